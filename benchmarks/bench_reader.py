@@ -0,0 +1,39 @@
+"""Measures how many rows per second TransactionsReader parses, with the fast
+path and with the strict path that every entry used to go through.
+
+    python -m benchmarks.bench_reader [ROWS]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from capgains.transactions_reader import TransactionsReader
+
+from benchmarks.ledger import write_ledger
+
+
+def rows_per_second(path, rows, fast_path):
+    TransactionsReader.fast_path = fast_path
+    try:
+        start = time.perf_counter()
+        for _ in TransactionsReader.iter_transactions(path):
+            pass
+        return rows / (time.perf_counter() - start)
+    finally:
+        TransactionsReader.fast_path = True
+
+
+def main(rows=200000):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ledger.csv')
+        write_ledger(path, rows)
+        strict = rows_per_second(path, rows, fast_path=False)
+        fast = rows_per_second(path, rows, fast_path=True)
+    print("strict path: {:>10,.0f} rows/sec".format(strict))
+    print("fast path:   {:>10,.0f} rows/sec ({:.1f}x)".format(
+        fast, fast / strict))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,64 @@
+"""Measures how long the CLI takes to start, by running its commands in a
+fresh interpreter, the way that they run from a shell. The time taken by the
+bare interpreter is shown for comparison.
+
+    python -m benchmarks.bench_startup [--runs N] [--budget-ms MS]
+
+With --budget-ms, or $CAPGAINS_STARTUP_BUDGET_MS, the benchmark exits with
+an error if any command takes longer than the budget on top of the bare
+interpreter, so that it can guard against slow imports creeping back in.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.ledger import write_ledger
+
+
+def best_seconds(code, args, runs):
+    command = [sys.executable, '-c', code] + args
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark how long the CLI takes to start")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float,
+                        default=os.environ.get('CAPGAINS_STARTUP_BUDGET_MS'),
+                        help=("fail if a command takes longer than this on "
+                              "top of the bare interpreter"))
+    args = parser.parse_args(argv)
+
+    cli = 'from capgains.cli import capgains; capgains()'
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ledger.csv')
+        write_ledger(path, 10)
+        python = best_seconds('pass', [], args.runs)
+        timings = [
+            ('capgains --help', best_seconds(cli, ['--help'], args.runs)),
+            ('capgains show', best_seconds(cli, ['show', path], args.runs)),
+        ]
+    print("{:<16} {:>7.1f} ms".format('python', python * 1000))
+    over_budget = []
+    for name, seconds in timings:
+        overhead = (seconds - python) * 1000
+        print("{:<16} {:>7.1f} ms (+{:.1f} ms)".format(
+            name, seconds * 1000, overhead))
+        if args.budget_ms is not None and overhead > args.budget_ms:
+            over_budget.append(name)
+    if over_budget:
+        sys.exit("over the budget of {} ms: {}".format(
+            args.budget_ms, ", ".join(over_budget)))
+
+
+if __name__ == '__main__':
+    main()
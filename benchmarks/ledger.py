@@ -0,0 +1,82 @@
+"""A seeded generator of synthetic transactions CSV-files, so that benchmarks
+run against the same ledger every time."""
+import csv
+import random
+from datetime import date, timedelta
+
+# The first day with a supported exchange rate that is a weekday
+START_DATE = date(2007, 5, 1)
+
+
+def parse_currency_mix(mix):
+    """Parse a currency mix such as "USD=3,CAD=1" into a list of (currency,
+    weight) pairs"""
+    pairs = []
+    for part in mix.split(','):
+        currency, _, weight = part.partition('=')
+        pairs.append((currency.strip().upper(), float(weight or 1)))
+    return pairs
+
+
+def generate_ledger(rows, tickers=20, currencies=(('USD', 1), ('CAD', 1)),
+                    loss_ratio=0.2, seed=0, end_date=None):
+    """Yield the entries of a ledger of the given number of rows, spread
+    over the given number of tickers, in chronological order.
+
+    Each ticker trades in a single currency, picked according to the
+    weights of the currency mix. Sales never sell more than the share
+    balance, and roughly loss_ratio of them are made below the average
+    purchase price of the ticker, so that superficial losses get checked.
+    """
+    rng = random.Random(seed)
+    if end_date is None:
+        end_date = date.today() - timedelta(days=30)
+    names = ['T{:03d}'.format(i) for i in range(tickers)]
+    codes, weights = zip(*currencies)
+    ticker_currencies = {
+        name: rng.choices(codes, weights)[0] for name in names}
+    balances = dict.fromkeys(names, 0)
+    # Purchases are priced around a fixed market price, so that the average
+    # purchase price does not drift away over a long ledger
+    market_prices = {name: rng.uniform(10, 500) for name in names}
+    average_prices = dict(market_prices)
+
+    days = max((end_date - START_DATE).days, 1)
+    rows_per_day = max(1, -(-rows // days))
+    for i in range(rows):
+        day = START_DATE + timedelta(days=i // rows_per_day)
+        ticker = rng.choice(names)
+        balance = balances[ticker]
+        average_price = average_prices[ticker]
+        if balance == 0 or rng.random() < 0.6:
+            action = 'BUY'
+            qty = rng.randint(1, 100)
+            price = market_prices[ticker] * rng.uniform(0.9, 1.2)
+            average_prices[ticker] = (
+                (average_price * balance + price * qty) / (balance + qty))
+            balances[ticker] = balance + qty
+        else:
+            action = 'SELL'
+            qty = rng.randint(1, balance)
+            if rng.random() < loss_ratio:
+                price = average_price * rng.uniform(0.7, 0.99)
+            else:
+                price = average_price * rng.uniform(1.01, 1.5)
+            balances[ticker] = balance - qty
+        yield [
+            day.isoformat(),
+            'Stocks',
+            ticker,
+            action,
+            str(qty),
+            '{:.2f}'.format(price),
+            '9.99',
+            ticker_currencies[ticker],
+        ]
+
+
+def write_ledger(path, rows, **kwargs):
+    """Write a generated ledger to a CSV-file. The keyword arguments are the
+    ones of generate_ledger."""
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(generate_ledger(rows, **kwargs))
@@ -0,0 +1,23 @@
+"""A rate provider that makes up exchange rates, so that benchmarks neither
+touch the network nor depend on the speed of the Valet API."""
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from capgains.rate_providers import RateProvider
+
+
+class SyntheticRateProvider(RateProvider):
+    """Provides a deterministic rate for every weekday of every series"""
+
+    def fetch(self, currency_from, start_date, end_date, forex_strs):
+        rates = {forex_str: {} for forex_str in forex_strs}
+        day = start_date
+        while day <= end_date:
+            if day.weekday() < 5:
+                ordinal = day.toordinal()
+                for idx, forex_str in enumerate(forex_strs):
+                    rate = 1.25 + 0.1 * math.sin(ordinal / 50 + idx)
+                    rates[forex_str][day] = Decimal('{:.4f}'.format(rate))
+            day += timedelta(days=1)
+        return rates
@@ -0,0 +1,209 @@
+"""Benchmarks the hot paths of capgains in isolation, against a seeded
+synthetic ledger and made-up exchange rates:
+
+    reader            TransactionsReader.iter_transactions, in rows/sec
+    get_rate          ExchangeRate.get_rate, in lookups/sec
+    add_transactions  TickerGains.add_transactions, in rows/sec
+    filter_by         Transactions.filter_by, in filters/sec
+
+    python -m benchmarks.run [--rows N] [--tickers N] [--currencies MIX]
+                             [--loss-ratio R] [--seed N] [--repeat N]
+                             [--output FILE] [--compare FILE]
+
+The results are written as JSON with --output, and --compare prints how the
+current results compare to the ones saved by an earlier run.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import tabulate
+
+from capgains.commands.capgains_calc import (
+    _get_map_of_currencies_to_exchange_rates)
+from capgains.exchange_rate import ExchangeRate
+from capgains.rate_registry import rate_registry
+from capgains.ticker_gains import TickerGains
+from capgains.transactions_reader import TransactionsReader
+
+from benchmarks.ledger import parse_currency_mix, write_ledger
+from benchmarks.rates import SyntheticRateProvider
+
+
+class Ledger:
+    """The generated ledger and everything that the benchmarks need to have
+    been computed beforehand"""
+
+    def __init__(self, path):
+        self.path = path
+        self.transactions = TransactionsReader.get_transactions(path)
+        self.exchange_rates = _get_map_of_currencies_to_exchange_rates(
+            self.transactions)
+        self.partitions = [self.transactions.filter_by_ticker(ticker)
+                           for ticker in self.transactions.tickers]
+        self.years = sorted({t.date.year for t in self.transactions})
+
+
+def bench_reader(ledger):
+    for _ in TransactionsReader.iter_transactions(ledger.path):
+        pass
+    return len(ledger.transactions)
+
+
+def bench_get_rate(ledger):
+    exchange_rates = ledger.exchange_rates
+    for t in ledger.transactions:
+        exchange_rates[t.currency].get_rate(t.date)
+    return len(ledger.transactions)
+
+
+def bench_add_transactions(ledger):
+    for partition in ledger.partitions:
+        TickerGains(partition[0].ticker).add_transactions(
+            partition, ledger.exchange_rates)
+    return len(ledger.transactions)
+
+
+def bench_filter_by(ledger):
+    transactions = ledger.transactions
+    last_year = ledger.years[-1]
+    filters = 0
+    for ticker in transactions.tickers:
+        transactions.filter_by_ticker(ticker, max_year=last_year)
+        filters += 1
+    for year in ledger.years:
+        transactions.filter_by(year=year, action='SELL', description="Stocks",
+                               superficial_loss=False)
+        filters += 1
+    return filters
+
+
+benchmarks = [
+    ('reader', bench_reader),
+    ('get_rate', bench_get_rate),
+    ('add_transactions', bench_add_transactions),
+    ('filter_by', bench_filter_by),
+]
+
+
+def time_benchmark(benchmark, ledger, repeat):
+    """Run a benchmark repeat times and return the timings of the runs,
+    along with the number of operations done by each run"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ops = benchmark(ledger)
+        timings.append(time.perf_counter() - start)
+    return timings, ops
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    # Serve the rates from memory instead of the Valet API and the rate cache
+    ExchangeRate.rate_provider = SyntheticRateProvider()
+    rate_registry.cache = None
+    rate_registry.clear()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ledger.csv')
+        write_ledger(path, args.rows, tickers=args.tickers,
+                     currencies=parse_currency_mix(args.currencies),
+                     loss_ratio=args.loss_ratio, seed=args.seed)
+        ledger = Ledger(path)
+        results = dict()
+        for name, benchmark in benchmarks:
+            timings, ops = time_benchmark(benchmark, ledger, args.repeat)
+            best = min(timings)
+            results[name] = {
+                'ops': ops,
+                'best_seconds': best,
+                'median_seconds': statistics.median(timings),
+                'ops_per_sec': ops / best,
+            }
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'parameters': {
+            'rows': args.rows,
+            'tickers': args.tickers,
+            'currencies': args.currencies,
+            'loss_ratio': args.loss_ratio,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+
+def print_results(report, baseline=None):
+    headers = ["benchmark", "ops", "best (s)", "median (s)", "ops/sec"]
+    if baseline is not None:
+        headers += ["baseline ops/sec", "change"]
+    rows = []
+    for name, result in report['results'].items():
+        row = [name, result['ops'],
+               "{:.4f}".format(result['best_seconds']),
+               "{:.4f}".format(result['median_seconds']),
+               "{:,.0f}".format(result['ops_per_sec'])]
+        if baseline is not None:
+            old = baseline['results'].get(name)
+            if old is None:
+                row += ["", ""]
+            else:
+                row += ["{:,.0f}".format(old['ops_per_sec']),
+                        "{:+.1%}".format(result['ops_per_sec'] /
+                                         old['ops_per_sec'] - 1)]
+        rows.append(row)
+    print(tabulate.tabulate(rows, headers=headers, tablefmt="psql",
+                            disable_numparse=True))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the hot paths of capgains")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--tickers', type=int, default=20)
+    parser.add_argument('--currencies', default='USD=1,CAD=1',
+                        help="weights of the currencies, such as USD=3,CAD=1")
+    parser.add_argument('--loss-ratio', type=float, default=0.2,
+                        help="share of the sales that are made at a loss")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', metavar='FILE',
+                        help="write the results to a JSON file")
+    parser.add_argument('--compare', metavar='FILE',
+                        help="compare with the results of an earlier run")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        parameters = {name: value for name, value in vars(args).items()
+                      if name in baseline['parameters']}
+        if parameters != baseline['parameters']:
+            print("warning: the baseline was run with different parameters",
+                  file=sys.stderr)
+    report = run(args)
+    print_results(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
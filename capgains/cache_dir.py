@@ -0,0 +1,13 @@
+import os
+
+
+def cache_dir():
+    """Return the directory that capgains keeps its caches in, which is
+    $CAPGAINS_CACHE_DIR if it is set, or else the capgains directory of the
+    user's cache directory"""
+    directory = os.environ.get('CAPGAINS_CACHE_DIR')
+    if not directory:
+        cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                      os.path.join(os.path.expanduser('~'), '.cache'))
+        directory = os.path.join(cache_home, 'capgains')
+    return directory
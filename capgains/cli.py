@@ -1,34 +1,239 @@
+import datetime
+
 import click
 
-from capgains.commands.capgains_show import capgains_show
-from capgains.commands.capgains_calc import capgains_calc
-from capgains.transactions_reader import TransactionsReader
+# The commands import what they need when they run, so that starting the CLI
+# does not load requests, tabulate and the rest of capgains up front
+from capgains.output import formats
+from capgains.profiling import profiler
+from capgains.rate_registry import RateRegistry
+
+
+ledger_cache_option = click.option(
+    '--ledger-cache', is_flag=True, envvar='CAPGAINS_LEDGER_CACHE',
+    help=("Cache the parsed transactions CSV-file, so that following runs "
+          "do not parse it again until it changes. The cache is stored in "
+          "$CAPGAINS_CACHE_DIR, or else in ~/.cache/capgains. Can also be "
+          "set with $CAPGAINS_LEDGER_CACHE"))
+
+format_option = click.option(
+    '--format', 'output_format', type=click.Choice(formats),
+    default='table', show_default=True,
+    help=("Print a table, or stream the rows as CSV or as JSON Lines for "
+          "other programs to read"))
+
+
+class YearRange(click.ParamType):
+    """A range of years, such as 2018-2025, or a single year"""
+    name = 'year-range'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, range):
+            return value
+        first, _, last = value.partition('-')
+        try:
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            self.fail("{} is not a year or a range of years such as "
+                      "2018-2025".format(value), param, ctx)
+        if last < first:
+            self.fail("{} ends before it starts".format(value), param, ctx)
+        return range(first, last + 1)
+
+
+def _read_transactions(transactions_csv, ledger_cache, tickers=None,
+                       min_year=None, max_year=None):
+    """Return the transactions of the CSV-file made by the tickers between
+    min_year and max_year, read from the ledger cache if requested, or else
+    streamed from the CSV-file. The transactions can also be read from a
+    ledger store database instead of a CSV-file."""
+    start_date = None
+    if min_year is not None:
+        start_date = datetime.date(min_year, 1, 1)
+    from capgains.ledger_store import LedgerStore
+    if LedgerStore.is_store(transactions_csv):
+        # The store selects the transactions through its index
+        with profiler.stage('read transactions'):
+            return LedgerStore(transactions_csv).get_transactions(
+                tickers=tickers, start_date=start_date, max_year=max_year)
+    if ledger_cache:
+        from capgains.ledger_cache import LedgerCache
+        from capgains.transactions import Transactions
+        with profiler.stage('read transactions'):
+            transactions = LedgerCache().get_transactions(transactions_csv)
+            if tickers or min_year or max_year:
+                # The cache holds every transaction of the CSV-file, so the
+                # filters are applied once they are read
+                transactions = Transactions(transactions).filter_by(
+                    tickers=tickers, min_year=min_year, max_year=max_year)
+            return transactions
+    from capgains.transactions_reader import TransactionsReader
+    # The reader skips the other entries before parsing their numbers
+    return profiler.iter('read transactions',
+                         TransactionsReader.iter_transactions(
+                             transactions_csv, tickers=tickers,
+                             start_date=start_date, max_year=max_year))
 
 
 @click.group()
-def capgains():
-    pass
+@click.option('--profile', is_flag=True,
+              help=("Print how long each stage of the command took, to "
+                    "standard error"))
+@click.option('--profile-out', metavar='FILE',
+              help=("Also write a cProfile dump of the command to FILE, for "
+                    "analysis with pstats"))
+@click.pass_context
+def capgains(ctx, profile, profile_out):
+    if not (profile or profile_out):
+        return
+    profiler.enable()
+    cprofile = None
+    if profile_out:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+
+    def report():
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(profile_out)
+        click.echo(profiler.summary(), err=True)
+        profiler.disable()
+
+    ctx.call_on_close(report)
 
 
 @capgains.command(help=("Show entries from the transactions CSV-file in a "
                         "tabular format. Filters can be applied to narrow "
-                        "down the entries."))
+                        "down the entries. A database made by the import "
+                        "command can be given instead of the CSV-file."))
 @click.argument('transactions-csv')
 @click.option('-t', '--tickers', metavar='TICKERS',
               multiple=True, help="Stocks tickers to filter for")
-def show(transactions_csv, tickers):
-    transactions = TransactionsReader.get_transactions(transactions_csv)
-    capgains_show(transactions, tickers)
+@format_option
+@ledger_cache_option
+def show(transactions_csv, tickers, output_format, ledger_cache):
+    from capgains.commands.capgains_show import capgains_show
+    transactions = _read_transactions(transactions_csv, ledger_cache,
+                                      tickers=tickers)
+    capgains_show(transactions, tickers, output_format=output_format)
+
+
+@capgains.command(help=("Index the transactions CSV-file, so that show and "
+                        "calc only read the entries of the tickers and years "
+                        "that they filter for. The index is kept next to the "
+                        "CSV-file, and is rebuilt when the CSV-file "
+                        "changes."))
+@click.argument('transactions-csv')
+def index(transactions_csv):
+    from capgains.ledger_index import LedgerIndex
+    ledger_index = LedgerIndex.build(transactions_csv)
+    try:
+        ledger_index.save()
+    except OSError as e:
+        raise click.ClickException("Could not write the index of {} : {}"
+                                   .format(transactions_csv, e))
+    click.echo("Indexed {} entries of {} tickers in {}".format(
+        ledger_index.entries, len(ledger_index.tickers),
+        LedgerIndex.path_for(transactions_csv)))
+
+
+@capgains.command('import',
+                  help=("Import the entries of the transactions CSV-file "
+                        "into a ledger store database, which show and calc "
+                        "can read instead of the CSV-file. Importing a "
+                        "CSV-file again only imports the entries appended "
+                        "to it since."))
+@click.argument('transactions-csv')
+@click.argument('database')
+def import_csv(transactions_csv, database):
+    import sqlite3
+    from capgains.ledger_store import LedgerStore
+    try:
+        imported = LedgerStore(database).import_csv(transactions_csv)
+    except sqlite3.Error as e:
+        raise click.ClickException("Could not import into {} : {}"
+                                   .format(database, e))
+    click.echo("Imported {} entries into {}".format(imported, database))
 
 
 @capgains.command(help=("Calculates capital gains from the transactions "
                         "CSV-file and displays output in a tabular format. "
                         "Filters can be applied to select which stocks to "
-                        "calculate the capital gains on."))
+                        "calculate the capital gains on. A database made "
+                        "by the import command can be given instead of the "
+                        "CSV-file."))
 @click.argument('transactions-csv')
-@click.argument('year', type=click.INT)
+@click.argument('year', type=click.INT, required=False)
 @click.option('-t', '--tickers', metavar='TICKERS',
               multiple=True, help="Stocks tickers to filter for")
-def calc(transactions_csv, year, tickers):
-    transactions = TransactionsReader.get_transactions(transactions_csv)
-    capgains_calc(transactions, year, tickers=tickers)
+@click.option('--years', type=YearRange(), metavar='FIRST-LAST',
+              help=("Calculate the capital gains of every year in a range, "
+                    "such as 2018-2025, instead of a single YEAR. Every "
+                    "year is calculated with only the transactions made up "
+                    "to its end, as it is on its own"))
+@click.option('--no-rate-cache', is_flag=True,
+              help=("Do not read or write exchange rates in the local rate "
+                    "cache. The cache is stored in $CAPGAINS_CACHE_DIR, or "
+                    "else in ~/.cache/capgains"))
+@click.option('--fetch-workers', type=click.IntRange(min=1),
+              default=RateRegistry.max_workers, show_default=True,
+              help="Maximum number of exchange rate requests to make at once")
+@click.option('--rates-file', metavar='FILE', envvar='CAPGAINS_RATES_FILE',
+              help=("Read the exchange rates from a local JSON or CSV dump of "
+                    "Bank of Canada Valet observations instead of the "
+                    "internet. Can also be set with $CAPGAINS_RATES_FILE"))
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              show_default=True,
+              help="Number of processes to calculate the tickers in")
+@click.option('--opening-snapshot', metavar='FILE',
+              help=("Start out from the year-end positions in a snapshot "
+                    "written by --snapshot-out, and only use the "
+                    "transactions made after the year of the snapshot"))
+@click.option('--snapshot-out', metavar='FILE',
+              help=("Write the positions of every ticker at the end of the "
+                    "last calculated year to a snapshot file"))
+@format_option
+@ledger_cache_option
+def calc(transactions_csv, year, tickers, years, no_rate_cache,
+         fetch_workers, rates_file, jobs, opening_snapshot, snapshot_out,
+         output_format, ledger_cache):
+    from capgains.commands.capgains_calc import capgains_calc_years
+    from capgains.exchange_rate import ExchangeRate
+    from capgains.rate_providers import FileRateProvider
+    from capgains.rate_registry import rate_registry
+    from capgains.snapshot import Snapshot
+    from capgains.transactions import Transactions
+
+    if year is None and years is None:
+        raise click.UsageError('Missing argument "YEAR".')
+    if year is not None and years is not None:
+        raise click.UsageError("YEAR and --years can not be used together")
+    if years is None:
+        years = [year]
+    if no_rate_cache or rates_file:
+        rate_registry.cache = None
+    if rates_file:
+        ExchangeRate.rate_provider = FileRateProvider(rates_file)
+    rate_registry.max_workers = fetch_workers
+    if not rates_file:
+        # The HTTP client has to allow as many requests in flight as there
+        # are threads fetching
+        from capgains.valet_client import valet_client
+        valet_client.max_concurrent = fetch_workers
+    opening = None
+    min_year = None
+    if opening_snapshot:
+        opening = Snapshot.load(opening_snapshot)
+        min_year = opening.year + 1
+    # Only read the transactions of the requested tickers, made after the
+    # opening snapshot and up to the last year
+    transactions = Transactions(_read_transactions(
+        transactions_csv, ledger_cache, tickers=tickers, min_year=min_year,
+        max_year=max(years)))
+    closing = capgains_calc_years(transactions, list(years), tickers=tickers,
+                                  jobs=jobs, opening=opening,
+                                  output_format=output_format)
+    if snapshot_out:
+        closing.save(snapshot_out)
@@ -1,10 +1,20 @@
+from bisect import bisect_right
 import click
-import tabulate
+from click import ClickException
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import timedelta
 from itertools import groupby
 import csv
+import io
+import sys
 
 from capgains.exchange_rate import ExchangeRate
+from capgains.output import row_writer
+from capgains.profiling import profiler
+from capgains.snapshot import Snapshot, TickerPosition
 from capgains.ticker_gains import TickerGains
+from capgains.transactions import Transactions
 
 # describes how to align the individual table columns
 colalign = (
@@ -19,6 +29,20 @@ colalign = (
 )
 
 
+# The columns of the formats other than the table
+fields = [
+    "year",
+    "date",
+    "description",
+    "ticker",
+    "qty",
+    "proceeds",
+    "acb",
+    "outlays",
+    "capital_gain",
+]
+
+
 def _get_total_gains(transactions):
     total = 0
     for t in transactions:
@@ -30,70 +54,317 @@ def _get_map_of_currencies_to_exchange_rates(transactions):
     """First, split the list of transactions into sublists where each sublist
     will only contain transactions with the same currency"""
 
-    contiguous_currencies = sorted(transactions.transactions,
-                                   key=lambda t: t.currency)
+    contiguous_currencies = sorted(transactions, key=lambda t: t.currency)
     currency_groups = [list(g) for _, g in groupby(contiguous_currencies,
                                                    lambda t: t.currency)]
+    date_ranges = [(g[0].currency, g[0].date, g[-1].date)
+                   for g in currency_groups]
+    # Fetch the rates of every currency at the same time
+    ExchangeRate.prefetch(date_ranges)
     currencies_to_exchange_rates = dict()
     # Create a separate ExchangeRate object for each currency
-    for currency_group in currency_groups:
-        currency = currency_group[0].currency
-        min_date = currency_group[0].date
-        max_date = currency_group[-1].date
+    for currency, min_date, max_date in date_ranges:
         currencies_to_exchange_rates[currency] = ExchangeRate(
             currency, min_date, max_date)
     return currencies_to_exchange_rates
 
 
-def calculate_gains(transactions, year, ticker):
-    ticker_transactions = transactions.filter_by(tickers=[ticker],
-                                                 max_year=year)
-    er_map = _get_map_of_currencies_to_exchange_rates(ticker_transactions)
-    tg = TickerGains(ticker)
-    tg.add_transactions(ticker_transactions, er_map)
-    # for every transactions class, there is a transaction class
-    return ticker_transactions.filter_by(year=year, action='SELL', description="Stocks", superficial_loss=False)
+def calculate_gains(transactions, year, ticker, exchange_rates=None):
+    return calculate_gains_by_year(transactions, [year], ticker,
+                                   exchange_rates)[year]
+
+
+def calculate_gains_by_year(transactions, years, ticker, exchange_rates=None,
+                            opening=None):
+    """Replay the transactions of a ticker and return a dictionary of each
+    year to the transactions to report for that year. Every year is
+    calculated with only the transactions made up to its end, exactly as
+    when it is calculated on its own."""
+    gains_by_year, _ = _replay_ticker(transactions, years, ticker,
+                                      exchange_rates, opening)
+    return gains_by_year
+
+
+def _replay_ticker(transactions, years, ticker, exchange_rates=None,
+                   opening=None):
+    """Replay the transactions of a ticker, starting out from the opening
+    TickerPosition if there is one, and return the transactions to report
+    for each year along with the position at the end of the last year.
+
+    The years are replayed in ascending order, each one up to its own end
+    and starting out from the position at the end of the previous one. The
+    pending entries of that position are replayed again with the year, so
+    that its purchases can still make their sales superficial losses."""
+    position = opening if opening is not None else TickerPosition(0, 0)
+    ticker_transactions = list(transactions.filter_by_ticker(
+        ticker, max_year=max(years)))
+    if exchange_rates is None:
+        exchange_rates = _get_map_of_currencies_to_exchange_rates(
+            position.pending_transactions() + ticker_transactions)
+    ticker_years = [t.date.year for t in ticker_transactions]
+    gains_by_year = dict()
+    start = 0
+    for year in sorted(years):
+        end = bisect_right(ticker_years, year, start)
+        replayed = Transactions(position.pending_transactions() +
+                                ticker_transactions[start:end])
+        start = end
+        tg = TickerGains(ticker, position.share_balance, position.total_acb,
+                         position.buy_dates)
+        window_start = Snapshot.pending_window_start(year)
+        with profiler.stage('add_transactions', detail=ticker):
+            tg.add_transactions(replayed, exchange_rates,
+                                checkpoint=window_start)
+        # for every transactions class, there is a transaction class
+        gains_by_year[year] = replayed.filter_by(year=year, action='SELL', description="Stocks", superficial_loss=False)  # noqa: E501
+        position = _closing_position(tg, replayed, window_start)
+    return gains_by_year, position
+
+
+def _closing_position(tg, replayed, window_start):
+    """Return the position of the ticker from before the transactions made
+    on or after window_start, which are kept as its pending entries along
+    with the purchases made within 30 days before them. Option trades do
+    not change the position, so they are left out."""
+    share_balance, total_acb = tg.checkpoint
+    buy_window_start = window_start - timedelta(
+        days=Snapshot.superficial_loss_days)
+    buy_dates = []
+    pending = []
+    for t in replayed:
+        if t.date < buy_window_start:
+            continue
+        if t.date < window_start:
+            if t.action == 'BUY':
+                buy_dates.append(t.date)
+        elif t.description != "Equity and Index Options":
+            pending.append(TickerPosition.pending_entry(t))
+    return TickerPosition(share_balance, total_acb, buy_dates, pending)
+
+
+def _calculate_ticker_gains(ticker, years, transactions, exchange_rates,
+                            opening, profile=False):
+    """Calculate the gains of a single ticker in a worker process. Whatever
+    is echoed while calculating is captured and returned along with the
+    transactions to report and the closing position, so that it can be
+    printed in order. When profiling, the stages timed in the worker process
+    are returned as well, so that they can be merged into the profile of the
+    run."""
+    if profile:
+        profiler.enable()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        gains_by_year, position = _replay_ticker(
+            Transactions(transactions), years, ticker, exchange_rates,
+            opening)
+    return (output.getvalue(),
+            {year: list(transactions_to_report)
+             for year, transactions_to_report in gains_by_year.items()},
+            position,
+            profiler.export() if profile else None)
+
+
+def _ticker_partitions(transactions, tickers, years, exchange_rates,
+                       opening):
+    """Yield the arguments of _calculate_ticker_gains for every ticker: only
+    the ticker's own transactions and opening position, and only the
+    exchange rates covering them and the pending entries of the opening
+    position"""
+    for ticker in tickers:
+        position = opening.positions.get(ticker) if opening else None
+        ticker_transactions = list(transactions.filter_by_ticker(
+            ticker, max_year=max(years)))
+        replayed = ticker_transactions
+        if position is not None:
+            replayed = position.pending_transactions() + replayed
+        ticker_rates = dict()
+        if replayed:
+            start_date = replayed[0].date
+            end_date = replayed[-1].date
+            for t in replayed:
+                if t.currency not in ticker_rates:
+                    ticker_rates[t.currency] = exchange_rates[
+                        t.currency].slice(start_date, end_date)
+        yield (ticker, years, ticker_transactions, ticker_rates, position,
+               profiler.enabled)
+
+
+def _parallel_ticker_gains(transactions, tickers, years, exchange_rates,
+                           opening, jobs):
+    """Yield the tickers, the transactions to report and the closing position
+    of each of them, calculated in a pool of processes but yielded in sorted
+    ticker order"""
+    partitions = list(_ticker_partitions(transactions, tickers, years,
+                                         exchange_rates, opening))
+    with ProcessPoolExecutor(max_workers=min(jobs, len(partitions))) as pool:
+        results = pool.map(_calculate_ticker_gains, *zip(*partitions))
+        for partition in partitions:
+            with profiler.stage('wait for processes'):
+                output, gains_by_year, position, stages = next(results)
+                if stages is not None:
+                    profiler.merge(stages)
+            if output:
+                click.echo(output, nl=False)
+            yield partition[0], gains_by_year, position
+
+
+def _schedule3_row(t):
+    # https://faq.mytaxexpress.com/index.php?action=faq&cat=8&id=137&artlang=en
+    # myTaxExpress format: qty, stock name, sell price, buy price/acb, expense
+    return [
+        "{0:f}".format(t.qty.normalize()),
+        t.ticker,
+        "{:,.2f}".format(t.proceeds),
+        "{:,.2f}".format(t.acb),
+        "{:,.2f}".format(t.expenses),
+    ]
 
 
-def capgains_calc(transactions, year, tickers=None):
+def _echo_ticker_gains(ticker, year, transactions_to_report, output_queue,
+                       writer=None):
+    """Print the table of the capital gains of a ticker for a year, or write
+    its rows to the RowWriter if there is one, and queue its rows for the
+    year's schedule 3 file"""
+    if not transactions_to_report:
+        return
+    output_queue.extend(_schedule3_row(t) for t in transactions_to_report)
+    if writer is not None:
+        with profiler.stage('write rows'):
+            for t in transactions_to_report:
+                writer.write([
+                    year,
+                    t.date.isoformat(),
+                    t.description,
+                    t.ticker,
+                    "{0:f}".format(t.qty.normalize()),
+                    "{:.2f}".format(t.proceeds),
+                    "{:.2f}".format(t.acb),
+                    "{:.2f}".format(t.expenses),
+                    "{:.2f}".format(t.capital_gain)
+                ])
+        return
+    import tabulate
+    with profiler.stage('render tables'):
+        click.echo("{}-{}".format(ticker, year))
+
+        total_gains = _get_total_gains(transactions_to_report)
+        click.echo("[Total Gains = {0:,.2f}]".format(total_gains))
+        headers = ["date", "description", "ticker", "qty", "proceeds", "ACB",
+                   "outlays", "capital gain/loss"]
+        rows = [[
+            t.date,
+            t.description,
+            t.ticker,
+            "{0:f}".format(t.qty.normalize()),
+            "{:,.2f}".format(t.proceeds),
+            "{:,.2f}".format(t.acb),
+            "{:,.2f}".format(t.expenses),
+            "{:,.2f}".format(t.capital_gain)
+        ] for t in transactions_to_report]
+        output = tabulate.tabulate(rows, headers=headers, tablefmt="psql",
+                                   colalign=colalign, disable_numparse=True)
+        click.echo("{}\n".format(output))
+
+
+def capgains_calc(transactions, year, tickers=None, jobs=1,
+                  output_format='table'):
     """Take a list of transactions and print the calculated capital
-    gains in a separate tabular format for each specified ticker."""
+    gains in a separate tabular format for each specified ticker. With more
+    than one job, the tickers are calculated in a pool of processes."""
+    capgains_calc_years(transactions, [year], tickers=tickers, jobs=jobs,
+                        output_format=output_format)
+
+
+def capgains_calc_years(transactions, years, tickers=None, jobs=1,
+                        opening=None, output_format='table'):
+    """Take a list of transactions and print the calculated capital gains of
+    each of the years, in ascending order. Every year is calculated with
+    only the transactions made up to its end, as when it is calculated on
+    its own, so a sale at the end of a year is not made a superficial loss
+    by a purchase of the following year. A schedule 3 file is written for
+    every year.
+
+    If an opening Snapshot is given, every ticker starts out from its
+    position in the snapshot and only the transactions made after the year
+    of the snapshot are replayed. Returns the Snapshot of the positions at
+    the end of the last year.
+
+    Formats other than the table write a row for every reported sale as
+    soon as its ticker is calculated, and only those rows go to standard
+    output. Every other message goes to standard error instead."""
+    if output_format == 'table':
+        return _calculate_years(transactions, years, tickers, jobs, opening)
+    with row_writer(output_format, fields) as writer, \
+            redirect_stdout(sys.stderr):
+        return _calculate_years(transactions, years, tickers, jobs, opening,
+                                writer)
+
+
+def _calculate_years(transactions, years, tickers, jobs, opening,
+                     writer=None):
+    last_year = max(years)
+    closing = Snapshot(last_year)
+    pending = []
+    if opening is not None:
+        if min(years) <= opening.year:
+            raise ClickException(
+                "Only the years after the opening snapshot of {} can be "
+                "calculated".format(opening.year))
+        # Positions that no transaction changes are carried forward as they
+        # are, while the ones with pending entries are replayed again
+        for ticker, position in opening.positions.items():
+            if not tickers or ticker in tickers:
+                closing.positions[ticker] = TickerPosition(
+                    position.share_balance, position.total_acb)
+                pending.extend(position.pending_transactions())
+        transactions = transactions.filter_by(min_year=opening.year + 1)
+
     filtered_transactions = transactions.filter_by(tickers=tickers)
-    if not filtered_transactions:
+    replayed_tickers = sorted(set(filtered_transactions.tickers) |
+                              {t.ticker for t in pending})
+    if not replayed_tickers:
         click.echo("No transactions available")
-        return
+        return closing
+
+    # Every ticker shares the same exchange rates, covering the date range of
+    # all of the transactions that are part of the calculation
+    with profiler.stage('fetch exchange rates'):
+        pending.sort(key=lambda t: t.date)
+        exchange_rates = _get_map_of_currencies_to_exchange_rates(
+            pending + list(filtered_transactions.filter_by(
+                max_year=last_year)))
+
+    if jobs > 1 and len(replayed_tickers) > 1:
+        ticker_gains = _parallel_ticker_gains(
+            filtered_transactions, replayed_tickers, years, exchange_rates,
+            opening, jobs)
+    else:
+        ticker_gains = (
+            (ticker, *_replay_ticker(
+                filtered_transactions, years, ticker, exchange_rates,
+                opening.positions.get(ticker) if opening else None))
+            for ticker in replayed_tickers)
+
+    output_queues = {year: [] for year in years}
+
+    # The first year is printed as each ticker is calculated, and the
+    # following years once every ticker has been calculated
+    first_year = years[0]
+    later_gains = []
+    for ticker, gains_by_year, position in ticker_gains:
+        _echo_ticker_gains(ticker, first_year, gains_by_year[first_year],
+                           output_queues[first_year], writer)
+        later_gains.append((ticker, gains_by_year))
+        closing.positions[ticker] = position
+    for year in years[1:]:
+        for ticker, gains_by_year in later_gains:
+            _echo_ticker_gains(ticker, year, gains_by_year[year],
+                               output_queues[year], writer)
 
-    output_queue = []
-
-    for ticker in filtered_transactions.tickers:
-        transactions_to_report = calculate_gains(filtered_transactions, year,
-                                                 ticker)
-        if transactions_to_report:
-            click.echo("{}-{}".format(ticker, year))
-
-            total_gains = _get_total_gains(transactions_to_report)
-            click.echo("[Total Gains = {0:,.2f}]".format(total_gains))
-            headers = ["date", "description", "ticker", "qty", "proceeds", "ACB",
-                       "outlays", "capital gain/loss"]
-            rows = [[
-                t.date,
-                t.description,
-                t.ticker,
-                "{0:f}".format(t.qty.normalize()),
-                "{:,.2f}".format(t.proceeds),
-                "{:,.2f}".format(t.acb),
-                "{:,.2f}".format(t.expenses),
-                "{:,.2f}".format(t.capital_gain)
-            ] for t in transactions_to_report]
-            output = tabulate.tabulate(rows, headers=headers, tablefmt="psql",
-                                       colalign=colalign, disable_numparse=True)
-            click.echo("{}\n".format(output))
-
-            for r in rows:
-                # https://faq.mytaxexpress.com/index.php?action=faq&cat=8&id=137&artlang=en
-                # myTaxExpress format: qty, stock name, sell price, buy price/acb, expense
-                output_queue.append([r[3], r[2], r[4], r[5], r[6]])
-
-    with open(f'schedule3-{year}.csv', 'w', encoding='UTF8', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerows(output_queue)
+    with profiler.stage('write schedule3'):
+        for year in years:
+            with open(f'schedule3-{year}.csv', 'w', encoding='UTF8',
+                      newline='') as f:
+                schedule3_writer = csv.writer(f)
+                schedule3_writer.writerows(output_queues[year])
+    return closing
@@ -1,6 +1,7 @@
 import click
-import tabulate
 
+from capgains.output import row_writer
+from capgains.profiling import profiler
 
 # describes how to align the individual table columns
 colalign = (
@@ -15,11 +16,16 @@ colalign = (
 )
 
 
-def capgains_show(transactions, tickers=None):
-    """Take a list of transactions and print them in tabular format."""
-    filtered_transactions = transactions.filter_by(tickers=tickers)
-    if not filtered_transactions:
-        click.echo("No results found")
+def capgains_show(transactions, tickers=None, output_format='table'):
+    """Take a list of transactions and print them in tabular format. The
+    transactions can be any iterable, such as the stream returned by
+    TransactionsReader.iter_transactions, and are filtered as they are
+    read. Formats other than the table are written as the transactions are
+    read, without holding on to them."""
+    filtered_transactions = (t for t in transactions
+                             if not tickers or t.ticker in tickers)
+    if output_format != 'table':
+        _write_rows(filtered_transactions, output_format)
         return
     headers = ["date", "description", "ticker", "action", "qty", "price",
                "commission", "currency"]
@@ -33,6 +39,33 @@ def capgains_show(transactions, tickers=None):
         "{:,.2f}".format(t.commission),
         t.currency
     ] for t in filtered_transactions]
-    output = tabulate.tabulate(rows, headers=headers, colalign=colalign,
-                               tablefmt="psql", disable_numparse=True)
-    click.echo(output)
+    if not rows:
+        click.echo("No results found")
+        return
+    import tabulate
+    with profiler.stage('render tables'):
+        output = tabulate.tabulate(rows, headers=headers, colalign=colalign,
+                                   tablefmt="psql", disable_numparse=True)
+        click.echo(output)
+
+
+def _write_rows(transactions, output_format):
+    """Stream the transactions to a RowWriter, with the numbers at their
+    full precision and without thousands separators"""
+    fields = ["date", "description", "ticker", "action", "qty", "price",
+              "commission", "currency"]
+    with row_writer(output_format, fields) as writer:
+        for t in transactions:
+            with profiler.stage('write rows'):
+                writer.write([
+                    t.date.isoformat(),
+                    t.description,
+                    t.ticker,
+                    t.action,
+                    "{0:f}".format(t.qty.normalize()),
+                    "{0:f}".format(t.price.normalize()),
+                    "{0:f}".format(t.commission.normalize()),
+                    t.currency
+                ])
+    if not writer.rows:
+        click.echo("No results found", err=True)
@@ -1,133 +1,198 @@
-import requests
+from array import array
+from bisect import bisect_right
 from datetime import date, timedelta, datetime
 from decimal import Decimal
+from functools import partial
 from click import ClickException
 
+from capgains.rate_providers import ValetRateProvider
+from capgains.rate_registry import rate_registry
+
 
 class ExchangeRate:
     indicative_rate_min_date = date(2017, 1, 3)
     noon_rate_min_date = date(2007, 5, 1)
     valet_obs_url = 'https://www.bankofcanada.ca/valet/observations'
-    observations = "observations"
     currency_to = 'CAD'
-    date = 'd'
-    value = 'v'
     supported_currencies = ['CAD', 'USD', 'EUR', 'GBP']
     noon_rate_forex_str = {
         'USD': 'IEXE0101',
         'EUR': 'FXEURCAD',
         'GBP': 'FXGBPCAD',
     }
+    # Rates are stored as integers scaled by 10^rate_precision. The Bank of
+    # Canada publishes its rates with at most 4 decimal places.
+    rate_precision = 6
+    # Where the rates come from, which is the Bank of Canada's Valet API
+    # unless a FileRateProvider is set to work offline
+    rate_provider = ValetRateProvider(valet_obs_url)
 
     def __init__(self, currency_from, start_date, end_date):
         self._currency_from = currency_from
         self._start_date = start_date
         self._end_date = end_date
-        self._rates = dict()
+        # Parallel arrays holding the date ordinals of every observation in
+        # ascending order and the matching scaled rates
+        self._rate_dates = array('l')
+        self._rate_values = array('q')
+
+        self._validate(currency_from, start_date, end_date)
+
+        if currency_from == self.currency_to:
+            # Nothing to do if currencies are the same
+            return
 
-        if currency_from not in self.supported_currencies:
+        series_requests = self._series_requests(currency_from, start_date,
+                                                end_date)
+        all_series = rate_registry.get_all_series(
+            series_requests, batch_fetch=self._fetch_series_batch)
+        # The noon rates come before the indicative rates, so that the
+        # indicative rate wins on days that have both
+        self._set_rates([series.rates_until(end_date)
+                         for series in all_series])
+
+    @classmethod
+    def _validate(cls, currency_from, start_date, end_date):
+        """Raise an error if rates can not be provided for the currency and
+        date range"""
+        if currency_from not in cls.supported_currencies:
             raise ClickException(
                 "Currency ({}) is not currently supported. The supported "
                 "currencies are {}" .format(currency_from,
-                                            self.supported_currencies))
+                                            cls.supported_currencies))
 
         if end_date < start_date:
             raise ClickException(
                 "End date must be after start date")
-        if start_date < self.noon_rate_min_date:
+        if start_date < cls.noon_rate_min_date:
             raise ClickException(
                 "We do not support having transactions before {}"
-                .format(self.noon_rate_min_date.isoformat()))
+                .format(cls.noon_rate_min_date.isoformat()))
         if end_date > datetime.today().date():
             raise ClickException(
                 "We do not support having transactions past today's date")
 
-        if currency_from == self.currency_to:
-            # Nothing to do if currencies are the same
-            return
+    @classmethod
+    def prefetch(cls, date_ranges):
+        """Fetch the rates for several (currency, start_date, end_date)
+        ranges at the same time, so that ExchangeRate objects created for
+        those ranges afterwards are served from memory"""
+        series_requests = []
+        for currency_from, start_date, end_date in date_ranges:
+            cls._validate(currency_from, start_date, end_date)
+            if currency_from != cls.currency_to:
+                series_requests.extend(cls._series_requests(
+                    currency_from, start_date, end_date))
+        rate_registry.get_all_series(series_requests,
+                                     batch_fetch=cls._fetch_series_batch)
 
-        noon_rates = self._fetch_noon_rates(start_date, end_date)
-        indicative_rates = self._fetch_indicative_rates(start_date, end_date)
-        self._rates.update(noon_rates)
-        self._rates.update(indicative_rates)
+    def _set_rates(self, all_rates):
+        """Store the rates of several series, each given as a pair of sorted
+        arrays of date ordinals and scaled rates. A later series wins over an
+        earlier one on days that both have a rate for."""
+        all_rates = [rates for rates in all_rates if rates[0]]
+        if len(all_rates) == 1:
+            self._rate_dates, self._rate_values = all_rates[0]
+            return
+        rates = dict()
+        for dates, values in all_rates:
+            rates.update(zip(dates, values))
+        ordinals = sorted(rates)
+        self._rate_dates = array('l', ordinals)
+        self._rate_values = array('q', (rates[o] for o in ordinals))
 
-    def _fetch_rates(self, start_date, end_date, forex_str):
-        """Fetch exchange rates from the supplied URL"""
-        rates = {}
+    @classmethod
+    def _series_requests(cls, currency_from, start_date, end_date):
+        """Return the (currency, series, start date, end date, fetch)
+        requests for the rate registry that cover the date range: the
+        historical noon rates before the indicative rates took over, and the
+        indicative rates after"""
+        series_requests = []
         # Always move the start date back 7 days in case the start
         # date, end date, and all days in between are all weekends/holidays
         # where no exchange rate can be found
-        start_date -= timedelta(days=7)
-        params = {"start_date": start_date.isoformat(),
-                  "end_date": end_date.isoformat()}
-        url = "{}/{}/json".format(self.valet_obs_url, forex_str)
-        response = None
-        try:
-            response = requests.get(url=url, params=params)
-        except requests.ConnectionError as e:
-            raise ClickException(
-                "Error with internet connection to URL {} : {}".format(url, e))
-        except requests.HTTPError as e:
-            raise ClickException(
-                "HTTP request for URL {} was unsuccessful : {}".format(url, e))
-        except requests.exceptions.Timeout as e:
-            raise ClickException(
-                "Request timeout on URL {} : {}".format(url, e))
-        except requests.exceptions.TooManyRedirects as e:
-            raise ClickException(
-                "URL {} was bad : {}".format(url, e))
-        except requests.exceptions.RequestException as e:
-            raise ClickException(
-                "Catastrophic error with URL {} : {}".format(url, e))
-        try:
-            rates_json = response.json()[self.observations]
-        except KeyError:
-            raise ClickException(
-                "No observations were found using currency {}"
-                .format(self._currency_from))
-        for day_rate in rates_json:
-            date_str = day_rate[self.date]
-            date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            rate = Decimal(day_rate[forex_str][self.value])
-            rates[date] = rate
-        return rates
-
-    def _fetch_noon_rates(self, start_date, end_date):
-        """Get the historical noon rates from the Bank of Canada"""
-        if start_date >= self.indicative_rate_min_date:
-            # No available noon dates for this date range
-            return {}
-        if end_date >= self.indicative_rate_min_date:
-            # Our date range overlaps with the noon rate and indicative rate
-            # boundary
-            end_date = self.indicative_rate_min_date - timedelta(days=1)
-        forex_str = self.noon_rate_forex_str[self._currency_from]
-        return self._fetch_rates(start_date, end_date, forex_str)
-
-    def _fetch_indicative_rates(self, start_date, end_date):
-        """Get the indicative rates from the Bank of Canada"""
-        if end_date < self.indicative_rate_min_date:
-            # No available indicative rates for this date range
-            return {}
-        if start_date < self.indicative_rate_min_date:
-            # Our date range overlaps with the noon rate and indicative rate
-            # boundary
-            start_date = self.indicative_rate_min_date
-        forex_str = "FX{}{}".format(self._currency_from, self.currency_to)
-        return self._fetch_rates(start_date, end_date, forex_str)
+        week = timedelta(days=7)
+        if start_date < cls.indicative_rate_min_date:
+            # Our date range overlaps with the noon rates. Those stop at the
+            # indicative rate boundary.
+            noon_end_date = min(
+                end_date, cls.indicative_rate_min_date - timedelta(days=1))
+            forex_str = cls.noon_rate_forex_str[currency_from]
+            series_requests.append((
+                currency_from, forex_str, start_date - week, noon_end_date,
+                partial(cls._fetch_series, currency_from, forex_str)))
+        if end_date >= cls.indicative_rate_min_date:
+            # Our date range overlaps with the indicative rates. Those start
+            # at the indicative rate boundary.
+            indicative_start_date = max(start_date,
+                                        cls.indicative_rate_min_date)
+            forex_str = "FX{}{}".format(currency_from, cls.currency_to)
+            series_requests.append((
+                currency_from, forex_str, indicative_start_date - week,
+                end_date,
+                partial(cls._fetch_series, currency_from, forex_str)))
+        return series_requests
+
+    @classmethod
+    def _fetch_series(cls, currency_from, forex_str, start_date, end_date):
+        """Fetch the rates of a series as a dictionary of date ordinals to
+        scaled integer rates"""
+        rates = cls._fetch_rates(currency_from, start_date, end_date,
+                                 [forex_str])
+        return cls._scale_rates(rates[forex_str])
+
+    @classmethod
+    def _fetch_series_batch(cls, series_keys, start_date, end_date):
+        """Fetch the rates of several (currency, series) pairs with a single
+        request, returning a dictionary of (currency, series) pairs to
+        dictionaries of date ordinals to scaled integer rates"""
+        currencies = ", ".join(sorted({c for c, _ in series_keys}))
+        rates = cls._fetch_rates(currencies, start_date, end_date,
+                                 [forex_str for _, forex_str in series_keys])
+        return {(currency, forex_str): cls._scale_rates(rates[forex_str])
+                for currency, forex_str in series_keys}
+
+    @classmethod
+    def _scale_rates(cls, rates):
+        """Convert a dictionary of dates to Decimal rates into a dictionary
+        of date ordinals to scaled integer rates"""
+        scale = cls.rate_precision
+        return {d.toordinal(): int(rate.scaleb(scale).to_integral_value())
+                for d, rate in rates.items()}
+
+    @classmethod
+    def _fetch_rates(cls, currency_from, start_date, end_date, forex_strs):
+        """Fetch exchange rates for one or more series from the rate
+        provider, as a dictionary of dates to rates for each series"""
+        return cls.rate_provider.fetch(currency_from, start_date, end_date,
+                                       forex_strs)
 
     def _get_closest_rate_for_day(self, date):
         """Gets the exchange rate for the closest preceeding date with a
         rate
         """
-        if date in self._rates:
-            return self._rates[date]
-        dates_preceeding = [d for d in self._rates if d < date]
-        if dates_preceeding:
-            closest_date = min(dates_preceeding, key=lambda d: (date - d))
-            return self._rates[closest_date]
+        idx = bisect_right(self._rate_dates, date.toordinal())
+        if idx:
+            return Decimal(self._rate_values[idx - 1]).scaleb(
+                -self.rate_precision)
         return None
 
+    def slice(self, start_date, end_date):
+        """Return an ExchangeRate holding only the rates needed to look up the
+        dates between start_date and end_date, without fetching them again.
+        Keeps the copies sent to other processes small."""
+        sliced = type(self).__new__(type(self))
+        sliced._currency_from = self._currency_from
+        sliced._start_date = start_date
+        sliced._end_date = end_date
+        # Keep the closest preceding rate of start_date as well
+        start = max(
+            bisect_right(self._rate_dates, start_date.toordinal()) - 1, 0)
+        end = bisect_right(self._rate_dates, end_date.toordinal())
+        sliced._rate_dates = self._rate_dates[start:end]
+        sliced._rate_values = self._rate_values[start:end]
+        return sliced
+
     def get_rate(self, date):
         """Gets the exchange rate either:
         (1) for the day if an exchange rate exists for that day
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+
+from capgains.cache_dir import cache_dir
+from capgains.transaction import Transaction
+from capgains.transactions_reader import TransactionsReader
+
+
+class LedgerCache:
+    """A persistent cache of the parsed entries of transactions CSV-files, so
+    that a ledger which has not changed is not parsed and validated again
+    in every run.
+
+    Each CSV-file is cached in its own JSON Lines file, holding a small
+    header that identifies the version of the CSV-file that was parsed (its
+    size, mtime and the SHA-256 of its content), followed by the parsed
+    entries. The entries are stored as a table of the distinct values of
+    each column, and the positions of the values of every entry in those
+    tables. Only plain JSON is read back, so that a file planted in the
+    cache directory can not run code. The
+    entries are only read when the header matches the CSV-file. A CSV-file
+    with the same size but a new mtime is hashed to tell whether its content
+    actually changed, and any other change invalidates the cached entries.
+    """
+    directory_name = 'ledgers'
+    # Bumped whenever the layout of the cached entries changes
+    version = 2
+    hash_chunk_size = 1 << 20
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.path.join(cache_dir(), self.directory_name)
+        self._directory = directory
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def path_for(self, csv_file):
+        """Return the path of the cache file of a CSV-file"""
+        key = hashlib.sha256(
+            os.path.abspath(csv_file).encode('utf-8')).hexdigest()
+        return os.path.join(self._directory, key[:32] + '.json')
+
+    def get_transactions(self, csv_file):
+        """Return the list of Transactions of the CSV-file, from the cache if
+        it is still valid, or else by reading the CSV-file and caching the
+        parsed entries for the next run."""
+        transactions = self.load(csv_file)
+        if transactions is None:
+            try:
+                stat_key = self._stat_key(csv_file)
+            except OSError:
+                # Let the reader report the missing file
+                stat_key = None
+            transactions = list(TransactionsReader.iter_transactions(csv_file))
+            # Only cache the entries if the CSV-file did not change while it
+            # was being read
+            if stat_key is not None and stat_key == self._stat_key(csv_file):
+                self.store(csv_file, transactions)
+        return transactions
+
+    def load(self, csv_file):
+        """Return the cached list of Transactions of the CSV-file, or None if
+        there are no cached entries for the current version of the file."""
+        path = self.path_for(csv_file)
+        try:
+            size, mtime_ns = self._stat_key(csv_file)
+            with open(path) as f:
+                header = json.loads(f.readline())
+                if not self._is_valid(header, csv_file, size, mtime_ns):
+                    return None
+                body = f.readline()
+            if header['mtime_ns'] != mtime_ns:
+                # The content is unchanged, so only the mtime needs updating
+                # to skip hashing the CSV-file in the next run
+                header['mtime_ns'] = mtime_ns
+                self._write(path, header, body)
+            return self._transactions(json.loads(body))
+        except (OSError, ArithmeticError, KeyError, TypeError, ValueError,
+                IndexError, AttributeError):
+            # The cache is only an optimization, so act as if it was empty
+            return None
+
+    def _is_valid(self, header, csv_file, size, mtime_ns):
+        if header.get('version') != self.version or header['size'] != size:
+            return False
+        if header['mtime_ns'] == mtime_ns:
+            return True
+        return header['sha256'] == self._hash(csv_file)
+
+    # The columns of the entries that hold dates and numbers
+    _date_columns = {TransactionsReader.columns.index("date")}
+    _number_columns = {TransactionsReader.columns.index(column)
+                       for column in ("qty", "price", "commission")}
+
+    def _transactions(self, body):
+        """Convert the cached column tables and entries back into
+        Transactions"""
+        tables = []
+        for column, values in enumerate(body['columns']):
+            if column in self._date_columns:
+                values = [date(*map(int, value.split('-')))
+                          for value in values]
+            elif column in self._number_columns:
+                values = [Decimal(value) for value in values]
+            else:
+                values = [str(value) for value in values]
+            tables.append(values)
+        positions = body['entries']
+        num_columns = len(tables)
+        columns = [map(table.__getitem__, positions[column::num_columns])
+                   for column, table in enumerate(tables)]
+        return [Transaction.from_parsed(*row) for row in zip(*columns)]
+
+    def store(self, csv_file, transactions):
+        """Cache the parsed Transactions of the CSV-file"""
+        # Every distinct value of a column is only stored once. Decimals are
+        # stored as strings, since equal Decimals such as 10.0 and 10.00 are
+        # displayed differently.
+        num_columns = len(TransactionsReader.columns)
+        positions = [dict() for _ in range(num_columns)]
+        entries = []
+        for t in transactions:
+            row = (t.date.isoformat(), t.description, t.ticker, t.action,
+                   str(t.qty), str(t.price), str(t.commission), t.currency)
+            for column, value in enumerate(row):
+                table = positions[column]
+                position = table.get(value)
+                if position is None:
+                    position = table[value] = len(table)
+                entries.append(position)
+        body = json.dumps({'columns': [list(table) for table in positions],
+                           'entries': entries}, separators=(',', ':'))
+        try:
+            size, mtime_ns = self._stat_key(csv_file)
+            header = {'version': self.version,
+                      'size': size,
+                      'mtime_ns': mtime_ns,
+                      'sha256': self._hash(csv_file)}
+            self._write(self.path_for(csv_file), header, body)
+        except OSError:
+            # Failing to write to the cache only means that the CSV-file will
+            # be parsed again in the next run
+            pass
+
+    def _write(self, path, header, body):
+        """Atomically replace the cache file, so that concurrent runs never
+        read a partially written file"""
+        os.makedirs(self._directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory,
+                                        suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(json.dumps(header))
+                f.write('\n')
+                f.write(body)
+                f.write('\n')
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def _stat_key(csv_file):
+        stat = os.stat(csv_file)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _hash(self, csv_file):
+        digest = hashlib.sha256()
+        with open(csv_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.hash_chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
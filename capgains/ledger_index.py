@@ -0,0 +1,207 @@
+import csv
+import hashlib
+import io
+import json
+import locale
+import mmap
+import os
+import tempfile
+from click import ClickException
+
+from capgains.transactions_reader import TransactionsReader
+
+
+class LedgerIndex:
+    """A sidecar index of a transactions CSV-file, kept next to it, which
+    records the byte ranges of the entries of every ticker and year. The
+    entries of a few tickers or years can then be read without reading the
+    rest of the file.
+
+    The index identifies the version of the CSV-file that it was built from
+    by its size, mtime and the SHA-256 of its content. An index that no
+    longer matches the CSV-file is rebuilt when it is loaded. The entries
+    are checked for chronological order while the index is built, since the
+    entries outside of the ranges are not read afterwards.
+    """
+    suffix = '.index.json'
+    # Bumped whenever the layout of the index changes
+    version = 1
+
+    def __init__(self, csv_file, header, tickers):
+        self._csv_file = csv_file
+        self._header = header
+        # The ranges of each ticker and year, as [start, end, entry_no]
+        # lists, where entry_no is the number of the first entry in the range
+        self._tickers = tickers
+
+    @property
+    def csv_file(self):
+        return self._csv_file
+
+    @property
+    def entries(self):
+        return self._header['entries']
+
+    @property
+    def tickers(self):
+        return sorted(self._tickers.keys())
+
+    @classmethod
+    def path_for(cls, csv_file):
+        """Return the path of the index of a CSV-file"""
+        return csv_file + cls.suffix
+
+    @classmethod
+    def exists(cls, csv_file):
+        return os.path.exists(cls.path_for(csv_file))
+
+    @staticmethod
+    def _encoding():
+        # The encoding that TransactionsReader opens the CSV-file with
+        return locale.getpreferredencoding(False)
+
+    @classmethod
+    def build(cls, csv_file):
+        """Read the whole CSV-file and return its index. The dates of the
+        entries are validated, while their other fields are left for
+        TransactionsReader to validate when they are read."""
+        encoding = cls._encoding()
+        ticker_idx = TransactionsReader.columns.index("ticker")
+        digest = hashlib.sha256()
+        tickers = dict()
+        dates = dict()
+        last_date = None
+        last_key = None
+        run = None
+        offset = 0
+        entry_no = -1
+        try:
+            stat = os.stat(csv_file)
+            with open(csv_file, 'rb') as f:
+                for entry_no, line in enumerate(f):
+                    digest.update(line)
+                    end = offset + len(line)
+                    if line.count(b'"') % 2:
+                        raise ClickException(
+                            "Transaction entry {}: entries that span several "
+                            "lines can not be indexed".format(entry_no))
+                    entry = next(csv.reader([line.decode(encoding)]), [])
+                    day = TransactionsReader._entry_date(entry_no, entry,
+                                                         dates)
+                    if last_date and day < last_date:
+                        raise ClickException(
+                            "Transactions were not entered in chronological order")  # noqa: E501
+                    last_date = day
+                    key = (entry[ticker_idx], day.year)
+                    if key == last_key:
+                        run[1] = end
+                    else:
+                        run = [offset, end, entry_no]
+                        years = tickers.setdefault(key[0], dict())
+                        years.setdefault(str(key[1]), []).append(run)
+                        last_key = key
+                    offset = end
+        except FileNotFoundError:
+            raise ClickException("File not found: {}".format(csv_file))
+        header = {'version': cls.version,
+                  'size': stat.st_size,
+                  'mtime_ns': stat.st_mtime_ns,
+                  'sha256': digest.hexdigest(),
+                  'entries': entry_no + 1}
+        return cls(csv_file, header, tickers)
+
+    @classmethod
+    def load(cls, csv_file):
+        """Return the index of the CSV-file, which is rebuilt and saved again
+        if it is missing, unreadable or no longer matches the CSV-file"""
+        try:
+            with open(cls.path_for(csv_file)) as f:
+                data = json.load(f)
+            index = cls(csv_file, data['header'], data['tickers'])
+            if index._is_current():
+                return index
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        index = cls.build(csv_file)
+        try:
+            index.save()
+        except OSError:
+            # The index is only an optimization, so it is simply built again
+            # in the next run
+            pass
+        return index
+
+    def _is_current(self):
+        header = self._header
+        stat = os.stat(self._csv_file)
+        if header['version'] != self.version or header['size'] != \
+                stat.st_size:
+            return False
+        if header['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        digest = hashlib.sha256()
+        with open(self._csv_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        if header['sha256'] != digest.hexdigest():
+            return False
+        # The content is unchanged, so only the mtime needs updating to skip
+        # hashing the CSV-file in the next run
+        header['mtime_ns'] = stat.st_mtime_ns
+        try:
+            self.save()
+        except OSError:
+            pass
+        return True
+
+    def save(self):
+        """Atomically write the index next to the CSV-file"""
+        path = self.path_for(self._csv_file)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'header': self._header, 'tickers': self._tickers},
+                          f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def ranges(self, tickers=None, start_date=None, end_date=None):
+        """Return the byte ranges, as (start, end, entry_no) tuples in the
+        order of the CSV-file, that hold the entries of the tickers made in
+        the years between start_date and end_date"""
+        first_year = start_date.year if start_date else None
+        last_year = end_date.year if end_date else None
+        selected = []
+        for ticker in (tickers or self._tickers):
+            for year, runs in self._tickers.get(ticker, dict()).items():
+                year = int(year)
+                if ((first_year is None or year >= first_year) and
+                        (last_year is None or year <= last_year)):
+                    selected.extend(tuple(run) for run in runs)
+        selected.sort()
+        # Merge the ranges that follow each other, so that they are read at
+        # once
+        merged = []
+        for start, end, entry_no in selected:
+            if merged and merged[-1][1] == start:
+                merged[-1][1] = end
+            else:
+                merged.append([start, end, entry_no])
+        return [tuple(r) for r in merged]
+
+    def iter_entries(self, tickers=None, start_date=None, end_date=None):
+        """Yield the entry numbers and the entries of the CSV-file, as lists
+        of fields, that are in the ranges of the tickers and years"""
+        ranges = self.ranges(tickers, start_date, end_date)
+        if not ranges:
+            return
+        encoding = self._encoding()
+        with open(self._csv_file, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for start, end, entry_no in ranges:
+                text = m[start:end].decode(encoding)
+                yield from enumerate(
+                    csv.reader(io.StringIO(text, newline='')), entry_no)
@@ -0,0 +1,196 @@
+import csv
+import hashlib
+import io
+import locale
+import os
+from click import ClickException
+from datetime import date
+from decimal import Decimal
+
+from capgains.transaction import Transaction
+from capgains.transactions import Transactions
+from capgains.transactions_reader import TransactionsReader
+
+
+class LedgerStore:
+    """A SQLite database of transaction entries imported from CSV-files, so
+    that filtered reads go through an index on the ticker and date instead
+    of reading and parsing the whole ledger.
+
+    The entries are kept in the order that they were imported, with their
+    dates as ISO strings and their numbers as the strings of the parsed
+    Decimals, so that they are read back exactly as TransactionsReader
+    parsed them. The size and SHA-256 of every imported CSV-file are
+    recorded, so that importing it again only imports the entries appended
+    to it since.
+    """
+    # The first bytes of every SQLite database file
+    magic = b'SQLite format 3\x00'
+    hash_chunk_size = 1 << 20
+
+    def __init__(self, path):
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    @classmethod
+    def is_store(cls, path):
+        """Tell whether the file is a SQLite database rather than a
+        CSV-file"""
+        try:
+            with open(path, 'rb') as f:
+                return f.read(len(cls.magic)) == cls.magic
+        except OSError:
+            return False
+
+    def _connect(self):
+        # sqlite3 is imported here, so that starting the CLI does not load it
+        import sqlite3
+        conn = sqlite3.connect(self._path, isolation_level=None)
+        conn.execute("CREATE TABLE IF NOT EXISTS transactions ("
+                     "entry INTEGER PRIMARY KEY, date TEXT, "
+                     "description TEXT, ticker TEXT, action TEXT, qty TEXT, "
+                     "price TEXT, commission TEXT, currency TEXT)")
+        conn.execute("CREATE INDEX IF NOT EXISTS transactions_ticker_date "
+                     "ON transactions (ticker, date)")
+        conn.execute("CREATE TABLE IF NOT EXISTS sources ("
+                     "path TEXT PRIMARY KEY, size INTEGER, sha256 TEXT, "
+                     "entries INTEGER)")
+        return conn
+
+    def import_csv(self, csv_file):
+        """Import the entries of a CSV-file, and return how many entries
+        were imported. Only the entries appended to a CSV-file since it was
+        last imported are imported again. The entries have to come on or
+        after the last entry already in the store."""
+        source = os.path.abspath(csv_file)
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            imported = conn.execute(
+                "SELECT size, sha256, entries FROM sources WHERE path = ?",
+                (source,)).fetchone()
+            size, sha256, entries, text = self._read_new_entries(csv_file,
+                                                                 imported)
+            reader = csv.reader(io.StringIO(text, newline=''))
+            transactions = list(TransactionsReader._convert_entries(
+                enumerate(reader, entries), None))
+            last = conn.execute("SELECT date FROM transactions "
+                                "ORDER BY entry DESC LIMIT 1").fetchone()
+            if (transactions and last is not None and
+                    transactions[0].date.isoformat() < last[0]):
+                raise ClickException(
+                    "Transactions were not entered in chronological order")
+            conn.executemany(
+                "INSERT INTO transactions ({}) VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?)".format(
+                    ", ".join(TransactionsReader.columns)),
+                ((t.date.isoformat(), t.description, t.ticker, t.action,
+                  str(t.qty), str(t.price), str(t.commission), t.currency)
+                 for t in transactions))
+            conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                         (source, size, sha256,
+                          entries + len(transactions)))
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return len(transactions)
+
+    def _read_new_entries(self, csv_file, imported):
+        """Return the size and SHA-256 of the CSV-file, how many of its
+        entries were already imported, and the text of the entries that come
+        after them"""
+        size, sha256, entries = imported or (0, None, 0)
+        digest = hashlib.sha256()
+        try:
+            with open(csv_file, 'rb') as f:
+                remaining = size
+                while remaining:
+                    chunk = f.read(min(remaining, self.hash_chunk_size))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+                if remaining or (sha256 is not None and
+                                 digest.hexdigest() != sha256):
+                    raise ClickException(
+                        "{} changed since it was imported. Only the entries "
+                        "appended to it can be imported".format(csv_file))
+                new = f.read()
+        except FileNotFoundError:
+            raise ClickException("File not found: {}".format(csv_file))
+        digest.update(new)
+        text = new.decode(locale.getpreferredencoding(False))
+        if size:
+            # The last imported entry might not have ended with a line break
+            text = text.lstrip('\r\n')
+        return size + len(new), digest.hexdigest(), entries, text
+
+    def get_transactions(self, tickers=None, start_date=None, end_date=None,
+                         max_year=None):
+        """Return the Transactions of the tickers made between start_date
+        and end_date and on or before max_year, in the order that they were
+        imported"""
+        return Transactions(self.iter_transactions(
+            tickers=tickers, start_date=start_date, end_date=end_date,
+            max_year=max_year))
+
+    def iter_transactions(self, tickers=None, start_date=None,
+                          end_date=None, max_year=None):
+        """Yield the transactions that get_transactions returns, one at a
+        time"""
+        if max_year is not None:
+            last_day = date(max_year, 12, 31)
+            end_date = last_day if end_date is None else min(end_date,
+                                                             last_day)
+        conditions = []
+        parameters = []
+        if tickers:
+            tickers = sorted(set(tickers))
+            conditions.append("ticker IN ({})".format(
+                ", ".join("?" * len(tickers))))
+            parameters.extend(tickers)
+        if start_date is not None:
+            conditions.append("date >= ?")
+            parameters.append(start_date.isoformat())
+        if end_date is not None:
+            conditions.append("date <= ?")
+            parameters.append(end_date.isoformat())
+        query = "SELECT {} FROM transactions".format(
+            ", ".join(TransactionsReader.columns))
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY entry"
+
+        # Dates and numbers repeat a lot, so each of them is only parsed once
+        dates = dict()
+        numbers = dict()
+
+        def parse_date(text):
+            day = dates.get(text)
+            if day is None:
+                day = dates[text] = date(*map(int, text.split('-')))
+            return day
+
+        def parse_number(text):
+            number = numbers.get(text)
+            if number is None:
+                number = numbers[text] = Decimal(text)
+            return number
+
+        conn = self._connect()
+        try:
+            for (day, description, ticker, action, qty, price, commission,
+                 currency) in conn.execute(query, parameters):
+                yield Transaction.from_parsed(
+                    parse_date(day), description, ticker, action,
+                    parse_number(qty), parse_number(price),
+                    parse_number(commission), currency)
+        finally:
+            conn.close()
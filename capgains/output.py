@@ -0,0 +1,98 @@
+from abc import ABC, abstractmethod
+
+import click
+
+# The psql table is meant for people, and the other formats for programs
+formats = ['table', 'csv', 'jsonl']
+
+
+class _BufferedStream:
+    """Collects what is written and passes it on to the underlying stream in
+    large chunks, instead of one small write per row"""
+    buffer_size = 1 << 16
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._chunks = []
+        self._size = 0
+
+    def write(self, s):
+        self._chunks.append(s)
+        self._size += len(s)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._chunks:
+            self._stream.write(''.join(self._chunks))
+            self._chunks = []
+            self._size = 0
+        self._stream.flush()
+
+
+class RowWriter(ABC):
+    """Writes rows to standard output one at a time, as they are produced,
+    without holding on to them. The fields are the names of the columns."""
+
+    def __init__(self, fields, stream=None):
+        self.fields = fields
+        if stream is None:
+            stream = click.get_text_stream('stdout')
+        self._stream = _BufferedStream(stream)
+        self.rows = 0
+
+    def write(self, row):
+        self.rows += 1
+        self._write(row)
+
+    @abstractmethod
+    def _write(self, row):
+        """Write a single row to the stream"""
+
+    def close(self):
+        self._stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class CsvRowWriter(RowWriter):
+    """Writes the rows as a CSV-file with a header row"""
+
+    def __init__(self, fields, stream=None):
+        import csv
+        super().__init__(fields, stream)
+        self._writer = csv.writer(self._stream, lineterminator='\n')
+        self._writer.writerow(fields)
+
+    def _write(self, row):
+        self._writer.writerow(row)
+
+
+class JsonLinesRowWriter(RowWriter):
+    """Writes every row as a JSON object on its own line, keyed by the
+    fields"""
+
+    def __init__(self, fields, stream=None):
+        import json
+        super().__init__(fields, stream)
+        self._dumps = json.dumps
+
+    def _write(self, row):
+        self._stream.write(self._dumps(dict(zip(self.fields, row))))
+        self._stream.write('\n')
+
+
+row_writers = {
+    'csv': CsvRowWriter,
+    'jsonl': JsonLinesRowWriter,
+}
+
+
+def row_writer(output_format, fields, stream=None):
+    """Return the RowWriter of a format other than the table"""
+    return row_writers[output_format](fields, stream)
@@ -0,0 +1,155 @@
+import time
+
+
+class _NullStage:
+    """Stands in for a Stage while profiling is disabled, so that timed code
+    only pays for a method call"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_stage = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profiler, name, detail):
+        self._profiler = profiler
+        self._name = name
+        self._detail = detail
+
+    def __enter__(self):
+        self._path = self._profiler._enter(self._name)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self._start
+        self._profiler._exit(self._path, self._detail, elapsed)
+        return False
+
+
+class StageProfiler:
+    """Measures how long each stage of a run takes, such as reading the
+    transactions or fetching the exchange rates. Stages that start while
+    another stage is running are reported as part of that stage. Nothing is
+    measured unless the profiler is enabled."""
+    # How many of the slowest details, such as tickers, to report per stage
+    max_details = 5
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self._start = time.perf_counter()
+        self._active = []
+        # The seconds spent and number of calls of each stage, keyed by the
+        # names of the stages that it ran in, in the order that they started
+        self._stages = dict()
+        self._details = dict()
+
+    def enable(self):
+        self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def stage(self, name, detail=None):
+        """Return a context manager that times a stage. The time is also
+        counted towards the detail, such as the ticker being calculated, so
+        that the slowest ones can be reported."""
+        if not self.enabled:
+            return _null_stage
+        return _Stage(self, name, detail)
+
+    def iter(self, name, iterable):
+        """Time how long it takes to produce each item of an iterable, such
+        as transactions that are read while they are being used"""
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(name, iterable)
+
+    def _timed_iter(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def _enter(self, name):
+        self._active.append(name)
+        path = tuple(self._active)
+        if path not in self._stages:
+            self._stages[path] = [0, 0]
+        return path
+
+    def _exit(self, path, detail, elapsed):
+        self._active.pop()
+        stage = self._stages[path]
+        stage[0] += elapsed
+        stage[1] += 1
+        if detail is not None:
+            details = self._details.setdefault(path, dict())
+            details[detail] = details.get(detail, 0) + elapsed
+
+    def export(self):
+        """Return what has been recorded, such as to send it back from a
+        worker process"""
+        return self._stages, self._details
+
+    def merge(self, exported):
+        """Add what another profiler has recorded, such as the one of a
+        worker process, as part of the stages that are running. The stages
+        of processes that ran at the same time are added up, so they can
+        take longer than the stage that they are part of."""
+        stages, details = exported
+        prefix = tuple(self._active)
+        for path, (seconds, calls) in stages.items():
+            stage = self._stages.setdefault(prefix + path, [0, 0])
+            stage[0] += seconds
+            stage[1] += calls
+        for path, path_details in details.items():
+            merged = self._details.setdefault(prefix + path, dict())
+            for detail, seconds in path_details.items():
+                merged[detail] = merged.get(detail, 0) + seconds
+
+    def summary(self):
+        """Return a table of the time spent in each stage"""
+        import tabulate
+        total = time.perf_counter() - self._start
+        rows = []
+        accounted = 0
+        for path, (seconds, calls) in self._stages.items():
+            if len(path) == 1:
+                accounted += seconds
+            name = " > ".join(path)
+            rows.append([name, calls,
+                         "{:.3f}".format(seconds),
+                         "{:.1%}".format(seconds / total if total else 0)])
+            details = self._details.get(path)
+            if details:
+                slowest = sorted(details.items(), key=lambda d: -d[1])
+                for detail, seconds in slowest[:self.max_details]:
+                    rows.append(["{} [{}]".format(name, detail), "",
+                                 "{:.3f}".format(seconds),
+                                 "{:.1%}".format(seconds / total)])
+        other = max(total - accounted, 0)
+        rows.append(["other", "", "{:.3f}".format(other),
+                     "{:.1%}".format(other / total if total else 0)])
+        rows.append(["total", "", "{:.3f}".format(total), "100.0%"])
+        return tabulate.tabulate(rows, headers=["stage", "calls", "seconds",
+                                                "share"],
+                                 tablefmt="psql", colalign=("left", "right",
+                                                            "right", "right"),
+                                 disable_numparse=True)
+
+
+profiler = StageProfiler()
@@ -0,0 +1,122 @@
+import os
+from datetime import date, timedelta
+
+from capgains.cache_dir import cache_dir
+
+
+class RateCache:
+    """A persistent SQLite cache of the exchange rate observations fetched
+    from the Bank of Canada, along with the date spans that were fetched.
+    Published observations never change, so a span only needs to be fetched
+    once across every run. SQLite takes care of locking, so several processes
+    can read and write the same cache at the same time.
+    """
+    filename = 'rates.sqlite3'
+    # Observations for the last few days might not have been published yet,
+    # so spans are only recorded as fetched up to this many days ago
+    settle_days = 7
+    # How long to wait on another process holding the write lock
+    timeout = 30
+
+    def __init__(self, path):
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    @classmethod
+    def default_path(cls):
+        """Return the path of the cache file in the capgains cache
+        directory"""
+        return os.path.join(cache_dir(), cls.filename)
+
+    def _with_connection(self, work, default=None):
+        """Call work with a connection to the cache and return its result,
+        or return default if the cache cannot be used. The cache is only an
+        optimization, so failing to read or write it is not an error."""
+        # sqlite3 is imported here, so that starting the CLI does not load it
+        import sqlite3
+        try:
+            conn = self._connect(sqlite3)
+            try:
+                return work(conn)
+            finally:
+                conn.close()
+        except (sqlite3.Error, OSError):
+            return default
+
+    def _connect(self, sqlite3):
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self._path, timeout=self.timeout,
+                               isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS rates ("
+                     "currency TEXT, series TEXT, day INTEGER, "
+                     "value INTEGER, PRIMARY KEY (currency, series, day)) "
+                     "WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS spans ("
+                     "currency TEXT, series TEXT, start_day INTEGER, "
+                     "end_day INTEGER)")
+        return conn
+
+    def load(self, currency, forex_str):
+        """Return the cached spans, as (start, end) date tuples, and the
+        cached rates, as a dictionary of date ordinals to scaled rates, of a
+        series. Nothing is returned if the cache cannot be read."""
+        def read(conn):
+            spans = conn.execute(
+                "SELECT start_day, end_day FROM spans "
+                "WHERE currency = ? AND series = ?",
+                (currency, forex_str)).fetchall()
+            rates = conn.execute(
+                "SELECT day, value FROM rates "
+                "WHERE currency = ? AND series = ?",
+                (currency, forex_str)).fetchall()
+            return spans, rates
+
+        # An unreadable cache is treated as if it was empty
+        spans, rates = self._with_connection(read, ([], []))
+        spans = [(date.fromordinal(s), date.fromordinal(e)) for s, e in spans]
+        return spans, dict(rates)
+
+    def store(self, currency, forex_str, start_date, end_date, rates):
+        """Store the rates fetched for a span of a series. The rates are a
+        dictionary of date ordinals to scaled rates."""
+        settled_date = date.today() - timedelta(days=self.settle_days)
+        end_date = min(end_date, settled_date)
+
+        def write(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR REPLACE INTO rates VALUES (?, ?, ?, ?)",
+                ((currency, forex_str, day, value)
+                 for day, value in rates.items()))
+            if start_date <= end_date:
+                self._add_span(conn, currency, forex_str,
+                               start_date.toordinal(), end_date.toordinal())
+            conn.execute("COMMIT")
+
+        # Failing to write to the cache only means that the rates will be
+        # fetched again in the next run
+        self._with_connection(write)
+
+    def _add_span(self, conn, currency, forex_str, start, end):
+        """Record a fetched span, merging it with the spans that it overlaps
+        or touches so that the spans table stays small"""
+        spans = conn.execute(
+            "SELECT start_day, end_day FROM spans "
+            "WHERE currency = ? AND series = ? "
+            "AND start_day <= ? AND end_day >= ?",
+            (currency, forex_str, end + 1, start - 1)).fetchall()
+        for span_start, span_end in spans:
+            start = min(start, span_start)
+            end = max(end, span_end)
+        conn.execute(
+            "DELETE FROM spans WHERE currency = ? AND series = ? "
+            "AND start_day >= ? AND end_day <= ?",
+            (currency, forex_str, start, end))
+        conn.execute("INSERT INTO spans VALUES (?, ?, ?, ?)",
+                     (currency, forex_str, start, end))
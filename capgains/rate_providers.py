@@ -0,0 +1,141 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from click import ClickException
+
+
+class RateProvider(ABC):
+    """The interface of a source of Bank of Canada exchange rate
+    observations. Observations are in the format used by the Valet API,
+    where each observation holds the date and the value of every series on
+    that date."""
+    observations = "observations"
+    date = 'd'
+    value = 'v'
+
+    @abstractmethod
+    def fetch(self, currency_from, start_date, end_date, forex_strs):
+        """Return a dictionary of each series in forex_strs to a dictionary
+        of dates to Decimal rates, for the dates between start_date and
+        end_date. currency_from describes the requested currencies in error
+        messages."""
+
+    def _parse_observations(self, observations, forex_strs, start_date=None,
+                            end_date=None):
+        """Split Valet observations up into a dictionary of dates to rates
+        for each series"""
+        rates = {forex_str: {} for forex_str in forex_strs}
+        for day_rate in observations:
+            date_str = day_rate[self.date]
+            date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            if start_date and date < start_date:
+                continue
+            if end_date and date > end_date:
+                continue
+            for forex_str in forex_strs:
+                if forex_str in day_rate:
+                    rates[forex_str][date] = Decimal(
+                        day_rate[forex_str][self.value])
+        return rates
+
+
+class ValetRateProvider(RateProvider):
+    """Fetches the observations from the Bank of Canada Valet API"""
+
+    def __init__(self, valet_obs_url):
+        self.valet_obs_url = valet_obs_url
+
+    def fetch(self, currency_from, start_date, end_date, forex_strs):
+        # The HTTP client is imported here, so that neither starting the CLI
+        # nor calculating with cached rates loads requests
+        import requests
+        from capgains.valet_client import valet_client
+        params = {"start_date": start_date.isoformat(),
+                  "end_date": end_date.isoformat()}
+        url = "{}/{}/json".format(self.valet_obs_url, ",".join(forex_strs))
+        response = None
+        try:
+            response = valet_client.get(url, params=params)
+        except requests.ConnectionError as e:
+            raise ClickException(
+                "Error with internet connection to URL {} : {}".format(url, e))
+        except requests.HTTPError as e:
+            raise ClickException(
+                "HTTP request for URL {} was unsuccessful : {}".format(url, e))
+        except requests.exceptions.Timeout as e:
+            raise ClickException(
+                "Request timeout on URL {} : {}".format(url, e))
+        except requests.exceptions.TooManyRedirects as e:
+            raise ClickException(
+                "URL {} was bad : {}".format(url, e))
+        except requests.exceptions.RequestException as e:
+            raise ClickException(
+                "Catastrophic error with URL {} : {}".format(url, e))
+        try:
+            rates_json = response.json()[self.observations]
+        except KeyError:
+            raise ClickException(
+                "No observations were found using currency {}"
+                .format(currency_from))
+        return self._parse_observations(rates_json, forex_strs)
+
+
+class FileRateProvider(RateProvider):
+    """Reads the observations from a local file instead of the network, so
+    that no internet connection is needed. The file is either the JSON
+    returned by the Valet observations API, or a CSV-file with a header row
+    of "date" followed by the series names and a row for every date, such as
+    the CSV returned by the Valet API. The whole file is loaded once, the
+    first time that rates are needed."""
+
+    def __init__(self, path):
+        self.path = path
+        self._observations = None
+
+    def _load(self):
+        try:
+            with open(self.path, newline='') as f:
+                if self.path.lower().endswith('.json'):
+                    return json.load(f)[self.observations]
+                return self._read_csv(f)
+        except FileNotFoundError:
+            raise ClickException("File not found: {}".format(self.path))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ClickException(
+                "Could not read exchange rates from {} : {}"
+                .format(self.path, e))
+
+    def _read_csv(self, f):
+        """Convert the rows of a CSV-file into Valet observations, skipping
+        everything before the header row"""
+        observations = []
+        header = None
+        for row in csv.reader(f):
+            if header is None:
+                if row and row[0].strip().lower() == 'date':
+                    header = [column.strip().upper() for column in row]
+                continue
+            if not row:
+                continue
+            observation = {self.date: row[0].strip()}
+            for forex_str, value in zip(header[1:], row[1:]):
+                if value.strip():
+                    observation[forex_str] = {self.value: value.strip()}
+            observations.append(observation)
+        if header is None:
+            raise ValueError("no header row starting with 'date' was found")
+        return observations
+
+    def fetch(self, currency_from, start_date, end_date, forex_strs):
+        if self._observations is None:
+            self._observations = self._load()
+        try:
+            rates = self._parse_observations(self._observations, forex_strs,
+                                             start_date, end_date)
+        except (ValueError, KeyError, TypeError, InvalidOperation) as e:
+            raise ClickException(
+                "Could not read exchange rates from {} : {}"
+                .format(self.path, e))
+        return rates
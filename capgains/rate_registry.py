@@ -0,0 +1,227 @@
+from array import array
+from bisect import bisect_right
+from datetime import date, timedelta
+
+from capgains.rate_cache import RateCache
+
+
+class RateSeries:
+    """Holds the observations of a single exchange rate series, stored as
+    date ordinals and scaled integer rates, together with the date spans
+    that have already been fetched for it.
+    """
+
+    def __init__(self):
+        self._spans = []
+        self._dates = array('l')
+        self._values = array('q')
+
+    def missing_spans(self, start_date, end_date):
+        """Return the (start, end) date spans between start_date and end_date
+        that have not been fetched yet."""
+        missing = []
+        start = start_date.toordinal()
+        end = end_date.toordinal()
+        for span_start, span_end in self._spans:
+            if span_end < start:
+                continue
+            if span_start > end:
+                break
+            if span_start > start:
+                missing.append((start, span_start - 1))
+            start = max(start, span_end + 1)
+        if start <= end:
+            missing.append((start, end))
+        return [(date.fromordinal(s), date.fromordinal(e))
+                for s, e in missing]
+
+    def add(self, start_date, end_date, rates):
+        """Add the rates fetched for the span between start_date and
+        end_date. The rates are a dictionary of date ordinals to scaled
+        integer rates."""
+        self.add_span(start_date, end_date)
+        self.add_rates(rates)
+
+    def add_span(self, start_date, end_date):
+        """Mark the span between start_date and end_date as fetched"""
+        spans = sorted(self._spans +
+                       [(start_date.toordinal(), end_date.toordinal())])
+        self._spans = []
+        for span_start, span_end in spans:
+            if self._spans and span_start <= self._spans[-1][1] + 1:
+                # Merge overlapping and adjacent spans
+                last_start, last_end = self._spans[-1]
+                self._spans[-1] = (last_start, max(last_end, span_end))
+            else:
+                self._spans.append((span_start, span_end))
+
+    def add_rates(self, rates):
+        """Add a dictionary of date ordinals to scaled integer rates"""
+        merged_rates = dict(zip(self._dates, self._values))
+        merged_rates.update(rates)
+        ordinals = sorted(merged_rates)
+        self._dates = array('l', ordinals)
+        self._values = array('q', (merged_rates[o] for o in ordinals))
+
+    def spans(self):
+        """Return the (start, end) date spans that have been fetched"""
+        return [(date.fromordinal(s), date.fromordinal(e))
+                for s, e in self._spans]
+
+    def rates_until(self, end_date):
+        """Return the date ordinals and scaled rates of every observation up
+        to and including end_date."""
+        idx = bisect_right(self._dates, end_date.toordinal())
+        return self._dates[:idx], self._values[:idx]
+
+
+class RateRegistry:
+    """A process-wide store of every exchange rate series fetched so far.
+    ExchangeRate objects get their rates from here so that each span of a
+    series is only fetched once per run, no matter how many tickers need it.
+
+    When a RateCache is set, series are first loaded from it and every
+    fetched span is written back to it, so that spans fetched in earlier runs
+    do not need to be fetched again.
+    """
+
+    # The maximum number of spans, or batches of spans, to fetch at the same
+    # time
+    max_workers = 6
+    # Missing spans that are at most this many days apart are fetched with a
+    # single batch request. Spans further apart are fetched with separate
+    # requests, so that the years between them are not downloaded again.
+    batch_gap_days = 31
+
+    def __init__(self, cache=None):
+        self._series = dict()
+        self.cache = cache
+
+    def get_series(self, currency, forex_str, start_date, end_date, fetch):
+        """Return the RateSeries for the currency and series, first fetching
+        any span between start_date and end_date that it is missing.
+
+        fetch is called as fetch(start_date, end_date) and must return a
+        dictionary of date ordinals to scaled integer rates.
+        """
+        return self.get_all_series(
+            [(currency, forex_str, start_date, end_date, fetch)])[0]
+
+    def get_all_series(self, series_requests, batch_fetch=None):
+        """Return the RateSeries for each of the (currency, series,
+        start_date, end_date, fetch) requests, as get_series does. The
+        missing spans of every request are fetched concurrently, using up to
+        max_workers threads, and only added to the series once all of them
+        have been fetched.
+
+        If batch_fetch is given, the missing spans that are close to each
+        other are instead fetched together with a batch_fetch(keys,
+        start_date, end_date) call, which gets the rates of all the
+        (currency, series) keys over the date range and returns them as a
+        dictionary of keys to rates. The batches are fetched concurrently.
+        """
+        # Merge the date ranges requested for the same series, so that a span
+        # needed by two requests is only fetched once
+        requested_spans = dict()
+        for currency, forex_str, start_date, end_date, fetch in \
+                series_requests:
+            key = (currency, forex_str)
+            if key not in requested_spans:
+                requested_spans[key] = (RateSeries(), fetch)
+            requested_spans[key][0].add_span(start_date, end_date)
+
+        fetches = []
+        for key, (requested, fetch) in requested_spans.items():
+            series = self._load_series(*key)
+            for span_start, span_end in requested.spans():
+                for missing_span in series.missing_spans(span_start,
+                                                         span_end):
+                    fetches.append((key, missing_span, fetch))
+
+        if batch_fetch is None:
+            groups = [[f] for f in fetches]
+        else:
+            groups = self._nearby_groups(fetches)
+        if len(groups) > 1 and self.max_workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = [pool.submit(self._fetch_group, group, batch_fetch)
+                           for group in groups]
+                group_rates = [future.result() for future in futures]
+        else:
+            group_rates = [self._fetch_group(group, batch_fetch)
+                           for group in groups]
+
+        fetches = [f for group in groups for f in group]
+        all_rates = [rates for group in group_rates for rates in group]
+        for (key, span, _), rates in zip(fetches, all_rates):
+            self._series[key].add(*span, rates)
+            if self.cache:
+                self.cache.store(*key, *span, rates)
+        return [self._series[(currency, forex_str)]
+                for currency, forex_str, *_ in series_requests]
+
+    def _nearby_groups(self, fetches):
+        """Split the (key, span, fetch) fetches up into groups of spans that
+        overlap or are at most batch_gap_days apart"""
+        gap = timedelta(days=self.batch_gap_days)
+        groups = []
+        group_end = None
+        order = sorted(range(len(fetches)), key=lambda i: fetches[i][1])
+        for idx in order:
+            span_start, span_end = fetches[idx][1]
+            if groups and span_start <= group_end + gap:
+                groups[-1].append(idx)
+                group_end = max(group_end, span_end)
+            else:
+                groups.append([idx])
+                group_end = span_end
+        # Keep the fetches of a group in the order that they were requested
+        return [[fetches[idx] for idx in sorted(group)] for group in groups]
+
+    def _fetch_group(self, group, batch_fetch):
+        """Fetch the rates of every (key, span, fetch) of a group, with a
+        single batch_fetch call if there is more than one"""
+        if len(group) > 1 and batch_fetch is not None:
+            return self._fetch_batch(group, batch_fetch)
+        return [fetch(*span) for _, span, fetch in group]
+
+    def _fetch_batch(self, fetches, batch_fetch):
+        """Fetch every (key, span, fetch) with one batch_fetch call over the
+        date range covering all of the spans, and split the result back up
+        into the rates of each span"""
+        keys = list(dict.fromkeys(key for key, _, _ in fetches))
+        start_date = min(span[0] for _, span, _ in fetches)
+        end_date = max(span[1] for _, span, _ in fetches)
+        batch_rates = batch_fetch(keys, start_date, end_date)
+        all_rates = []
+        for key, (span_start, span_end), _ in fetches:
+            # Only keep the rates within the span, since that is all that
+            # will be recorded as fetched for the series
+            span_start = span_start.toordinal()
+            span_end = span_end.toordinal()
+            all_rates.append({day: rate
+                              for day, rate in batch_rates[key].items()
+                              if span_start <= day <= span_end})
+        return all_rates
+
+    def _load_series(self, currency, forex_str):
+        """Return the RateSeries for the currency and series, loading it from
+        the rate cache if it is not in memory yet"""
+        key = (currency, forex_str)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = RateSeries()
+            if self.cache:
+                spans, rates = self.cache.load(currency, forex_str)
+                for span_start, span_end in spans:
+                    series.add_span(span_start, span_end)
+                series.add_rates(rates)
+        return series
+
+    def clear(self):
+        """Forget every series fetched so far"""
+        self._series.clear()
+
+
+rate_registry = RateRegistry(RateCache(RateCache.default_path()))
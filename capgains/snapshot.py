@@ -0,0 +1,119 @@
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from click import ClickException
+
+from capgains.transaction import Transaction
+
+
+class TickerPosition:
+    """The position held in a ticker at the end of a year.
+
+    Whether a sale made in the last 30 days of the year is a superficial
+    loss depends on the purchases of the following year, so the transactions
+    made in those days are kept as pending entries to replay along with the
+    following year. The share balance and total ACB are the ones from before
+    the pending entries, and buy_dates are the dates of the purchases made
+    within 30 days before them."""
+
+    def __init__(self, share_balance, total_acb, buy_dates=(), pending=()):
+        self.share_balance = Decimal(share_balance)
+        self.total_acb = Decimal(total_acb)
+        self.buy_dates = list(buy_dates)
+        # The fields of the pending transactions, in the order of
+        # TransactionsReader.columns
+        self.pending = [tuple(entry) for entry in pending]
+
+    @staticmethod
+    def pending_entry(transaction):
+        """Return the fields of a transaction to keep as a pending entry"""
+        t = transaction
+        return (t.date, t.description, t.ticker, t.action, t.qty, t.price,
+                t.commission, t.currency)
+
+    def pending_transactions(self):
+        """Return new transactions made from the pending entries, so that
+        replaying them does not change the transactions already reported"""
+        return [Transaction.from_parsed(*entry) for entry in self.pending]
+
+
+def _dump_entry(entry):
+    day, description, ticker, action, qty, price, commission, currency = \
+        entry
+    return [day.isoformat(), description, ticker, action, str(qty),
+            str(price), str(commission), currency]
+
+
+def _load_entry(fields):
+    day, description, ticker, action, qty, price, commission, currency = \
+        fields
+    return (datetime.strptime(day, '%Y-%m-%d').date(), description, ticker,
+            action, Decimal(qty), Decimal(price), Decimal(commission),
+            currency)
+
+
+class Snapshot:
+    """The year-end positions of every ticker, which can be used as the
+    opening positions of the following years instead of replaying all of
+    the transactions that came before"""
+    version = 2
+    # Sales are superficial losses if the shares were bought within this many
+    # days before or after the sale
+    superficial_loss_days = 30
+
+    def __init__(self, year, positions=None):
+        self.year = year
+        self.positions = positions if positions is not None else dict()
+
+    @classmethod
+    def pending_window_start(cls, year):
+        """Return the earliest date of a transaction in the year that can
+        still be affected by the transactions of the following year, as the
+        start of the 30 days before a sale on January 1st"""
+        return (date(year + 1, 1, 1) -
+                timedelta(days=cls.superficial_loss_days))
+
+    @classmethod
+    def load(cls, path):
+        """Read a snapshot from a JSON file written by save"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') != cls.version:
+                raise ValueError("unsupported snapshot version {}"
+                                 .format(data.get('version')))
+            positions = dict()
+            for ticker, position in data['tickers'].items():
+                positions[ticker] = TickerPosition(
+                    position['share_balance'],
+                    position['total_acb'],
+                    [datetime.strptime(d, '%Y-%m-%d').date()
+                     for d in position['buy_dates']],
+                    [_load_entry(entry) for entry in position['pending']])
+            return cls(int(data['year']), positions)
+        except FileNotFoundError:
+            raise ClickException("File not found: {}".format(path))
+        except (ValueError, KeyError, TypeError, AttributeError,
+                InvalidOperation) as e:
+            raise ClickException(
+                "Could not read snapshot from {} : {}".format(path, e))
+
+    def save(self, path):
+        """Write the snapshot to a JSON file"""
+        data = {
+            'version': self.version,
+            'year': self.year,
+            'tickers': {
+                ticker: {
+                    'share_balance': str(position.share_balance),
+                    'total_acb': str(position.total_acb),
+                    'buy_dates': [d.isoformat() for d in position.buy_dates],
+                    'pending': [_dump_entry(entry)
+                                for entry in position.pending],
+                }
+                for ticker, position in sorted(self.positions.items())
+            },
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.write('\n')
@@ -1,48 +1,158 @@
+from bisect import bisect_left, bisect_right
 from datetime import timedelta
 from datetime import datetime
 from decimal import Decimal
 import click
-import tabulate
+
+from capgains.profiling import profiler
 
 
 class TickerGains:
-    def __init__(self, ticker):
+    def __init__(self, ticker, share_balance=0, total_acb=0,
+                 opening_buy_dates=()):
+        """The share balance and total ACB start out from an opening
+        position, such as one carried forward from a year-end snapshot.
+        opening_buy_dates are the dates of the purchases made before the
+        opening position that still fall within the superficial loss window
+        of the transactions that follow it."""
         self._ticker = ticker
-        self._share_balance = 0
-        self._total_acb = 0
-
-    def add_transactions(self, transactions, exchange_rates):
-        """Adds all transactions and updates the calculated values"""
-        for t in transactions:
+        self._share_balance = share_balance
+        self._total_acb = total_acb
+        self._opening_buy_dates = list(opening_buy_dates)
+        # The option trades of the current tax year, along with their
+        # proceeds, which are printed once all transactions have been added
+        self._option_trades = []
+        self._checkpoint = None
+
+    @property
+    def share_balance(self):
+        return self._share_balance
+
+    @property
+    def total_acb(self):
+        return self._total_acb
+
+    @property
+    def checkpoint(self):
+        """The share balance and total ACB from just before the first
+        transaction made on or after the checkpoint date passed to
+        add_transactions, or after the last transaction if there is none"""
+        return self._checkpoint
+
+    def add_transactions(self, transactions, exchange_rates,
+                         checkpoint=None):
+        """Adds all transactions and updates the calculated values.
+
+        The transactions are expected to be in chronological order, which is
+        what TransactionsReader guarantees.
+        The option trades of the current tax year are printed as a single
+        table at the end.
+        """
+        self._checkpoint = None
+        # Ordered list of dates used to locate the 61 day superficial loss
+        # window of a sale with a binary search
+        dates = [t.date for t in transactions]
+        for idx, t in enumerate(transactions):
+            if (checkpoint is not None and self._checkpoint is None and
+                    t.date >= checkpoint):
+                self._checkpoint = (self._share_balance, self._total_acb)
             rate = exchange_rates[t.currency].get_rate(t.date)
             t.exchange_rate = rate
             if (self._add_transaction(t)):
-                if self._is_superficial_loss(t, transactions):
+                with profiler.stage('superficial loss checks'):
+                    superficial_loss = self._is_superficial_loss(
+                        idx, transactions, dates)
+                if superficial_loss:
                     self._total_acb -= t.capital_gain
                     t.set_superficial_loss()
+        if self._checkpoint is None:
+            self._checkpoint = (self._share_balance, self._total_acb)
+        if self._option_trades:
+            with profiler.stage('render option trades'):
+                click.echo("{}\n".format(self.option_trades_table()))
+
+    def option_trades_table(self):
+        """Return a table of the option trades of the current tax year, or
+        None if there were none"""
+        if not self._option_trades:
+            return None
+        import tabulate
+
+        # describes how to align the individual table columns
+        colalign = (
+            "left",   # Date
+            "left",   # Option name
+            "left",   # Operation
+            "right",  # Quantity
+            "right",  # Price (CAD)
+            "right",  # Fee
+            "right",  # Number
+        )
+
+        # example 2:
+        # buy to open - plus fees
+        # sell to close - minus fees
+
+        # example 6:
+        # sell to open - minus fees
+        # buy to close - plus fees
+        rows = []
+        for transaction, proceeds in self._option_trades:
+            option_name = transaction.ticker[-1]
 
-    def _superficial_window_filter(self, transaction, min_date, max_date):
-        """Filter out BUY transactions that fall within
-        the 61 day superficial loss window"""
-        return transaction.date >= min_date and transaction.date <= max_date
+            if (option_name == "P"):
+                option_name = "PUT"
+            elif (option_name == "C"):
+                option_name = "CALL"
 
-    def _is_superficial_loss(self, transaction, transactions):
-        """Figures out if the transaction is a superficial loss"""
+            if (transaction.action == "BUY"):
+                proceeds_or_acb = "{:,.2f}".format(
+                    proceeds + transaction.expenses)
+            elif (transaction.action == "SELL"):
+                proceeds_or_acb = "N/A"
+
+            rows.append([
+                transaction.date,
+                transaction.ticker,
+                f"{transaction.action} {option_name}",
+                "{0:f}".format(transaction.qty.normalize()),
+                "{:,.2f}".format(proceeds),
+                "{:,.2f}".format(transaction.expenses),
+                proceeds_or_acb,
+            ])
+
+        headers = ["date", "option name", "operation",
+                   "qty", "price (CAD)", "fee", "acb"]
+        return tabulate.tabulate(rows, headers=headers, tablefmt="psql",
+                                 colalign=colalign, disable_numparse=True)
+
+    def _superficial_window(self, idx, transactions, dates):
+        """Return the transactions that fall within the 61 day superficial
+        loss window of the transaction at index idx, along with the position
+        of that transaction inside of the window"""
+        transaction_date = dates[idx]
+        min_date = transaction_date - timedelta(days=30)
+        max_date = transaction_date + timedelta(days=30)
+        start = bisect_left(dates, min_date, 0, idx)
+        end = bisect_right(dates, max_date, idx)
+        return transactions[start:end], idx - start
+
+    def _is_superficial_loss(self, idx, transactions, dates):
+        """Figures out if the transaction at index idx is a superficial loss"""
+        transaction = transactions[idx]
         # Has to be a capital loss
         if (transaction.capital_gain >= 0):
             return False
-        min_date = transaction.date - timedelta(days=30)
-        max_date = transaction.date + timedelta(days=30)
-        filtered_transactions = list(filter(
-            lambda t: self._superficial_window_filter(t, min_date, max_date),
-            transactions))
+        window, transaction_idx = self._superficial_window(idx, transactions,
+                                                           dates)
         # Has to have a purchase either 30 days before or 30 days after
-        if (not any(t.action == 'BUY' for t in filtered_transactions)):
+        window_start = transaction.date - timedelta(days=30)
+        if (not any(t.action == 'BUY' for t in window) and
+                not any(d >= window_start for d in self._opening_buy_dates)):
             return False
         # Has to have a positive share balance after 30 days
-        transaction_idx = filtered_transactions.index(transaction)
         balance = transaction._share_balance
-        for window_transaction in filtered_transactions[transaction_idx+1:]:
+        for window_transaction in window[transaction_idx+1:]:
             if window_transaction.action == 'SELL':
                 balance -= window_transaction.qty
             else:
@@ -75,52 +185,7 @@ class TickerGains:
             if (transaction.date.year != datetime.now().year - 1):
                 return False
 
-            # describes how to align the individual table columns
-            colalign = (
-                "left",   # Date
-                "left",   # Option name
-                "left",   # Operation
-                "right",  # Quantity
-                "right",  # Price (CAD)
-                "right",  # Fee
-                "right",  # Number
-            )
-
-            # example 2:
-            # buy to open - plus fees
-            # sell to close - minus fees
-
-            # example 6:
-            # sell to open - minus fees
-            # buy to close - plus fees
-            option_name = transaction.ticker[-1]
-
-            if (option_name == "P"):
-                option_name = "PUT"
-            elif (option_name == "C"):
-                option_name = "CALL"
-
-            if (transaction.action == "BUY"):
-                proceeds_or_acb = "{:,.2f}".format(
-                    proceeds + transaction.expenses)
-            elif (transaction.action == "SELL"):
-                proceeds_or_acb = "N/A"
-
-            headers = ["date", "option name", "operation",
-                       "qty", "price (CAD)", "fee", "acb"]
-
-            rows = [[
-                transaction.date,
-                transaction.ticker,
-                f"{transaction.action} {option_name}",
-                "{0:f}".format(transaction.qty.normalize()),
-                "{:,.2f}".format(proceeds),
-                "{:,.2f}".format(transaction.expenses),
-                proceeds_or_acb,
-            ]]
-            output = tabulate.tabulate(rows, headers=headers, tablefmt="psql",
-                                       colalign=colalign, disable_numparse=True)
-            click.echo("{}\n".format(output))
+            self._option_trades.append((transaction, proceeds))
             return False
 
         if self._share_balance < 0:
@@ -1,24 +1,62 @@
 from decimal import Decimal
 
+# Decimals are immutable, so every transaction can share the same zero
+_ZERO = Decimal(0)
+
 
 class Transaction:
     """Represents a transaction entry from the CSV-file"""
+    # Transactions are created for every entry of the CSV-file, so use slots
+    # instead of a per-instance __dict__ to keep them small
+    __slots__ = (
+        '_date',
+        '_description',
+        '_ticker',
+        '_action',
+        '_qty',
+        '_price',
+        '_commission',
+        '_currency',
+        '_exchange_rate',
+        '_share_balance',
+        '_proceeds',
+        '_capital_gain',
+        '_acb',
+        '_superficial_loss',
+    )
 
     def __init__(self, date, description, ticker, action, qty, price,
                  commission, currency):
+        self._init(date, description, ticker, action, Decimal(qty),
+                   round(Decimal(price), 4), round(Decimal(commission), 4),
+                   currency)
+
+    @classmethod
+    def from_parsed(cls, date, description, ticker, action, qty, price,
+                    commission, currency):
+        """Create a transaction from numbers that are already Decimals
+        rounded to 4 decimal places, such as the ones parsed by
+        TransactionsReader, without converting and rounding them again."""
+        transaction = cls.__new__(cls)
+        transaction._init(date, description, ticker, action, qty, price,
+                          commission, currency)
+        return transaction
+
+    def _init(self, date, description, ticker, action, qty, price,
+              commission, currency):
         self._date = date
         self._description = description
         self._ticker = ticker
         self._action = action
-        self._qty = Decimal(qty)
-        self._price = round(Decimal(price), 4)
-        self._commission = round(Decimal(commission), 4)
+        self._qty = qty
+        self._price = price
+        self._commission = commission
         self._currency = currency
         self._exchange_rate = None
-        self._share_balance = Decimal(0.0)
-        self._proceeds = Decimal(0.0)
-        self._capital_gain = Decimal(0.0)
-        self._acb = Decimal(0.0)
+        self._share_balance = _ZERO
+        self._proceeds = _ZERO
+        self._capital_gain = _ZERO
+        self._acb = _ZERO
         self._superficial_loss = False
 
     @property
@@ -109,4 +147,4 @@ class Transaction:
 
     def set_superficial_loss(self):
         self.superficial_loss = True
-        self.capital_gain = Decimal(0.0)
+        self.capital_gain = _ZERO
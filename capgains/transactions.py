@@ -1,24 +1,114 @@
+from array import array
+from heapq import merge
+
+
+class _Encoding:
+    """The dictionary encoding of a column of strings, such as the tickers,
+    which gives every distinct string of the column an integer code. It is
+    shared by a collection and the collections selected from it, so that
+    their columns can be compared and copied as plain integer codes."""
+
+    def __init__(self):
+        self.codes = dict()
+        self.values = list()
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode_column(self, values):
+        """Return the codes of a list of values as an array, encoding every
+        distinct value once instead of looking up each row on its own"""
+        for value in dict.fromkeys(values):
+            self.encode(value)
+        return array('I', map(self.codes.__getitem__, values))
+
+
+class _Columns:
+    """The rows of a collection along with columns of the fields that
+    transactions are filtered on, as arrays of integers, so that filters do
+    not go through the properties of every Transaction. A column is only
+    built the first time that a filter needs it, so that making a collection
+    costs no more than copying the list of its rows."""
+    encoded = ('ticker', 'action', 'description')
+
+    def __init__(self, rows, encodings=None):
+        self.rows = rows
+        self.encodings = encodings or {field: _Encoding()
+                                       for field in self.encoded}
+        self._columns = dict()
+
+    def column(self, field):
+        """Return the column of a field, building it if it is not built
+        yet"""
+        column = self._columns.get(field)
+        if column is None:
+            if field == 'year':
+                column = array('H', [t.date.year for t in self.rows])
+            else:
+                column = self.encodings[field].encode_column(
+                    [getattr(t, field) for t in self.rows])
+            self._columns[field] = column
+        return column
+
+    def append(self, transaction):
+        self.rows.append(transaction)
+        for field, column in self._columns.items():
+            if field == 'year':
+                column.append(transaction.date.year)
+            else:
+                column.append(self.encodings[field].encode(
+                    getattr(transaction, field)))
+
+    def select(self, positions):
+        """Return new columns holding the rows at the given positions, with
+        the columns built so far copied over"""
+        rows = self.rows
+        selected = _Columns([rows[i] for i in positions], self.encodings)
+        for field, column in self._columns.items():
+            selected._columns[field] = array(
+                column.typecode, [column[i] for i in positions])
+        return selected
+
+
 class Transactions:
-    """Holds a collection of transactions"""
+    """Holds a collection of transactions.
 
-    def __init__(self, transactions):
-        self._transactions = list()
-        self._tickers = dict()
-        for transaction in transactions:
-            self.add_transaction(transaction)
+    A filtered collection is a view: it holds the positions of its rows in
+    the columns of the collection that it was filtered from, and shares
+    those columns instead of copying them. Its list of transactions is only
+    made when it is first needed."""
+
+    def __init__(self, transactions=()):
+        self._columns = _Columns(list(transactions))
+        # The positions of the rows of this collection in the columns, or
+        # None if it holds all of them
+        self._positions = None
+        self._transactions = self._columns.rows
+        # Positions of the rows of each ticker, which are only partitioned
+        # once the collection is filtered by ticker
+        self._tickers = None
 
     @property
     def transactions(self):
         """Return all the stored transactions"""
+        if self._transactions is None:
+            rows = self._columns.rows
+            self._transactions = [rows[i] for i in self._positions]
         return self._transactions
 
     @property
     def tickers(self):
         """Return all the unique tickers in this collection of transactions."""
-        return sorted(self._tickers.keys())
+        return sorted(self._ticker_positions().keys())
 
     def __len__(self):
-        return len(self.transactions)
+        if self._transactions is None:
+            return len(self._positions)
+        return len(self._transactions)
 
     def __iter__(self):
         return iter(self.transactions)
@@ -26,35 +116,101 @@ class Transactions:
     def __getitem__(self, x):
         return self.transactions[x]
 
+    def _all_positions(self):
+        if self._positions is None:
+            return range(len(self._columns.rows))
+        return self._positions
+
+    def _ticker_positions(self):
+        """Return the positions of the rows of each ticker, partitioning the
+        rows by ticker the first time that it is called so that the
+        transactions of a single ticker can be retrieved without scanning
+        the whole collection"""
+        if self._tickers is None:
+            column = self._columns.column('ticker')
+            partitions = dict()
+            for i in self._all_positions():
+                code = column[i]
+                positions = partitions.get(code)
+                if positions is None:
+                    positions = partitions[code] = array('I')
+                positions.append(i)
+            values = self._columns.encodings['ticker'].values
+            self._tickers = {values[code]: positions
+                             for code, positions in partitions.items()}
+        return self._tickers
+
     def add_transaction(self, transaction):
         """Add a transaction to the list of stored transactions."""
-        self.transactions.append(transaction)
+        if self._positions is not None:
+            # Copy the rows of a view, so that the transaction is not added
+            # to the collection that it was filtered from
+            self._columns = self._columns.select(self._positions)
+            self._transactions = self._columns.rows
+            self._positions = None
+            self._tickers = None
+        idx = len(self._columns.rows)
+        self._columns.append(transaction)
+        if self._tickers is not None:
+            positions = self._tickers.get(transaction.ticker)
+            if positions is None:
+                positions = self._tickers[transaction.ticker] = array('I')
+            positions.append(idx)
 
-        ticker_refcount = self._tickers.get(transaction.ticker, 0)
-        ticker_refcount += 1
-        self._tickers[transaction.ticker] = ticker_refcount
+    def filter_by_ticker(self, ticker, max_year=None):
+        """Return only the transactions of a single ticker, optionally
+        restricted to the ones made on or before max_year."""
+        return self.filter_by(tickers=[ticker], max_year=max_year)
 
-    def filter_by(self, tickers=None, year=None, max_year=None, action=None, description=None,
-                  superficial_loss=None):
+    def filter_by(self, tickers=None, year=None, max_year=None, action=None,
+                  description=None, superficial_loss=None, min_year=None):
         """Filter the list of stored transactions on certain parameters (such
         as ticker, year, etc) and return only the transactions that match the
         requested parameters.
         """
-        def lambda_filter(t):
-            keep = True
-            if tickers:
-                keep &= (t.ticker in tickers)
-            if description:
-                keep &= (t.description in description)
-            if year:
-                keep &= (t.date.year == year)
-            if max_year:
-                keep &= (t.date.year <= max_year)
-            if action:
-                keep &= (t.action == action)
-            if superficial_loss is not None:
-                # superficial_loss can be set to False, so need to explicitly
-                # check that it is not set to None
-                keep &= (t.superficial_loss == superficial_loss)
-            return keep
-        return Transactions(filter(lambda_filter, self.transactions))
+        columns = self._columns
+        if tickers:
+            # Merge the positions of the requested tickers instead of
+            # checking the ticker of every transaction
+            indices = list(merge(*(positions for ticker, positions
+                                   in self._ticker_positions().items()
+                                   if ticker in tickers)))
+        else:
+            indices = self._all_positions()
+        if description:
+            column = columns.column('description')
+            codes = {code for d, code
+                     in columns.encodings['description'].codes.items()
+                     if d in description}
+            indices = [i for i in indices if column[i] in codes]
+        if year:
+            column = columns.column('year')
+            indices = [i for i in indices if column[i] == year]
+        if max_year:
+            column = columns.column('year')
+            indices = [i for i in indices if column[i] <= max_year]
+        if min_year:
+            column = columns.column('year')
+            indices = [i for i in indices if column[i] >= min_year]
+        if action:
+            column = columns.column('action')
+            code = columns.encodings['action'].codes.get(action)
+            indices = [i for i in indices if column[i] == code]
+        if superficial_loss is not None:
+            # superficial_loss can be set to False, so need to explicitly
+            # check that it is not set to None. It is set while the capital
+            # gains are calculated, so it is read from the transactions.
+            rows = columns.rows
+            indices = [i for i in indices
+                       if rows[i].superficial_loss == superficial_loss]
+        return self._view(indices)
+
+    def _view(self, indices):
+        """Return a new collection of the rows at the given positions, which
+        shares the rows and columns of this collection"""
+        view = Transactions.__new__(Transactions)
+        view._columns = self._columns
+        view._positions = array('I', indices)
+        view._transactions = None
+        view._tickers = None
+        return view
@@ -1,6 +1,6 @@
 import csv
 from click import ClickException
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
 
 from .transaction import Transaction
@@ -23,68 +23,215 @@ class TransactionsReader:
     ]
 
     @classmethod
-    def get_transactions(cls, csv_file):
-        """Convert the CSV-file entries into a list of Transactions."""
-        transactions = []
+    def get_transactions(cls, csv_file, tickers=None, start_date=None,
+                         end_date=None, max_year=None):
+        """Convert the CSV-file entries into a list of Transactions. The
+        filters are the ones of iter_transactions."""
+        return Transactions(cls.iter_transactions(
+            csv_file, tickers=tickers, start_date=start_date,
+            end_date=end_date, max_year=max_year))
+
+    # Positions of the columns in an entry, looked up once
+    _num_columns = len(columns)
+    _date_idx = columns.index("date")
+    _ticker_idx = columns.index("ticker")
+    _qty_idx = columns.index("qty")
+    _price_idx = columns.index("price")
+    _commission_idx = columns.index("commission")
+    # Whether well-formed entries are parsed with the fast path. Entries that
+    # the fast path can not parse always go through the strict path, which
+    # reports what is wrong with them.
+    fast_path = True
+
+    @classmethod
+    def iter_transactions(cls, csv_file, tickers=None, start_date=None,
+                          end_date=None, max_year=None):
+        """Lazily convert the CSV-file entries into Transactions, one entry at
+        a time, so that the whole file never has to be held in memory. The
+        entries are validated as they are read, so errors are only raised
+        once the offending entry is reached.
+
+        Only the entries of the given tickers, made between start_date and
+        end_date and on or before max_year, are converted. The other entries
+        are skipped after only looking at their ticker and date, which are
+        still checked for chronological order, so their numbers are never
+        parsed or validated. If the CSV-file has been indexed with
+        LedgerIndex, the other entries are not even read, and their order
+        was checked when the index was built."""
+        if max_year is not None:
+            last_day = date(max_year, 12, 31)
+            end_date = last_day if end_date is None else min(end_date,
+                                                             last_day)
+        selected = cls._selector(tickers, start_date, end_date)
         try:
+            # Imported here, since the ledger index builds on this module
+            from capgains.ledger_index import LedgerIndex
+            if selected is not None and LedgerIndex.exists(csv_file):
+                # Only read the parts of the CSV-file that hold the entries
+                # of the tickers and years
+                ledger_index = LedgerIndex.load(csv_file)
+                yield from cls._convert_entries(
+                    ledger_index.iter_entries(tickers, start_date, end_date),
+                    selected)
+                return
             with open(csv_file, newline='') as f:
-                reader = csv.reader(f)
-                last_date = None
-                for entry_no, entry in enumerate(reader):
-                    actual_num_columns = len(entry)
-                    expected_num_columns = len(cls.columns)
-                    if actual_num_columns != expected_num_columns:
-                        # Each line in the CSV file should have the same number
-                        # of columns as we expect
-                        raise ClickException(
-                            "Transaction entry {}: expected {} columns, entry has {}"  # noqa: E501
-                            .format(entry_no,
-                                    expected_num_columns,
-                                    actual_num_columns))
-                    date_idx = cls.columns.index("date")
-                    date_str = entry[date_idx]
-                    try:
-                        entry[date_idx] = datetime.strptime(
-                            date_str.split(" ")[0],
-                            '%Y-%m-%d').date()
-                    except ValueError:
-                        raise ClickException(
-                            "The date ({}) was not entered in the correct format (YYYY-MM-DD)"  # noqa: E501
-                            .format(date_str))
-                    qty_idx = cls.columns.index("qty")
-                    qty_str = entry[qty_idx]
-                    try:
-                        entry[qty_idx] = abs(round(Decimal(qty_str), 4))
-                    except InvalidOperation:
-                        raise ClickException(
-                            "The quantity entered {} is not a valid number"
-                            .format(qty_str))
-                    price_idx = cls.columns.index("price")
-                    price_str = entry[price_idx]
-                    try:
-                        entry[price_idx] = abs(round(Decimal(price_str), 4))
-                    except InvalidOperation:
-                        raise ClickException(
-                            "The price entered {} is not a valid number"
-                            .format(price_str))
-                    commission_idx = cls.columns.index("commission")
-                    commission_str = entry[commission_idx]
-                    try:
-                        entry[commission_idx] = abs(
-                            round(Decimal(commission_str), 4))
-                    except InvalidOperation:
-                        raise ClickException(
-                            "The commission entered {} is not a valid number"
-                            .format(commission_str))
-                    transaction = Transaction(*entry)
-                    if last_date:
-                        if transaction.date < last_date:
-                            raise ClickException(
-                                "Transactions were not entered in chronological order")  # noqa: E501
-                    last_date = transaction.date
-                    transactions.append(transaction)
-            return Transactions(transactions)
+                yield from cls._convert_entries(enumerate(csv.reader(f)),
+                                                selected)
         except FileNotFoundError:
             raise ClickException("File not found: {}".format(csv_file))
         except OSError:
             raise OSError("Could not open {} for reading".format(csv_file))
+
+    @classmethod
+    def _convert_entries(cls, entries, selected):
+        """Convert the numbered entries that pass the selector into
+        Transactions"""
+        last_date = None
+        # Dates parsed so far, since a ledger has many entries on the same
+        # day
+        dates = dict()
+        for entry_no, entry in entries:
+            if selected is not None:
+                day = cls._entry_date(entry_no, entry, dates)
+                if last_date and day < last_date:
+                    raise ClickException(
+                        "Transactions were not entered in chronological order")  # noqa: E501
+                last_date = day
+                if not selected(entry[cls._ticker_idx], day):
+                    continue
+            transaction = None
+            if cls.fast_path:
+                transaction = cls._parse_entry_fast(entry, dates)
+            if transaction is None:
+                transaction = cls._parse_entry(entry_no, entry)
+            if last_date:
+                if transaction.date < last_date:
+                    raise ClickException(
+                        "Transactions were not entered in chronological order")  # noqa: E501
+            last_date = transaction.date
+            yield transaction
+
+    @staticmethod
+    def _selector(tickers, start_date, end_date):
+        """Return a function of the ticker and date of an entry that tells
+        whether the entry passes the filters, or None if there are none"""
+        if not tickers and start_date is None and end_date is None:
+            return None
+        tickers = set(tickers) if tickers else None
+
+        def selected(ticker, day):
+            return ((tickers is None or ticker in tickers) and
+                    (start_date is None or day >= start_date) and
+                    (end_date is None or day <= end_date))
+        return selected
+
+    @classmethod
+    def _entry_date(cls, entry_no, entry, dates):
+        """Return the date of an entry without converting its other
+        fields"""
+        day = None
+        if len(entry) == cls._num_columns:
+            date_str = entry[cls._date_idx]
+            day = dates.get(date_str)
+            if day is None:
+                day = cls._parse_date(date_str)
+                if day is not None:
+                    dates[date_str] = day
+        if day is None:
+            # Let the strict path report what is wrong with the entry
+            day = cls._parse_entry(entry_no, list(entry)).date
+        return day
+
+    @classmethod
+    def _parse_entry_fast(cls, entry, dates):
+        """Convert a well-formed entry into a Transaction, converting each
+        field exactly once. Returns None if the entry is not well-formed."""
+        if len(entry) != cls._num_columns:
+            return None
+        date_str = entry[cls._date_idx]
+        day = dates.get(date_str)
+        if day is None:
+            day = cls._parse_date(date_str)
+            if day is None:
+                return None
+            dates[date_str] = day
+        try:
+            qty = abs(round(Decimal(entry[cls._qty_idx]), 4))
+            price = abs(round(Decimal(entry[cls._price_idx]), 4))
+            commission = abs(round(Decimal(entry[cls._commission_idx]), 4))
+        except InvalidOperation:
+            return None
+        entry[cls._date_idx] = day
+        entry[cls._qty_idx] = qty
+        entry[cls._price_idx] = price
+        entry[cls._commission_idx] = commission
+        return Transaction.from_parsed(*entry)
+
+    @staticmethod
+    def _parse_date(date_str):
+        """Parse a date in the YYYY-MM-DD format, which can be followed by a
+        time, without going through strptime. Returns None if the date is
+        not in that format."""
+        parts = date_str.split(" ")[0].split("-")
+        if len(parts) != 3:
+            return None
+        year, month, day = parts
+        if not (len(year) == 4 and 1 <= len(month) <= 2 and
+                1 <= len(day) <= 2 and year.isdigit() and
+                month.isdigit() and day.isdigit()):
+            return None
+        try:
+            return date(int(year), int(month), int(day))
+        except ValueError:
+            return None
+
+    @classmethod
+    def _parse_entry(cls, entry_no, entry):
+        """Convert an entry into a Transaction, raising an error that
+        describes the first problem found with the entry."""
+        actual_num_columns = len(entry)
+        expected_num_columns = len(cls.columns)
+        if actual_num_columns != expected_num_columns:
+            # Each line in the CSV file should have the same number
+            # of columns as we expect
+            raise ClickException(
+                "Transaction entry {}: expected {} columns, entry has {}"
+                .format(entry_no,
+                        expected_num_columns,
+                        actual_num_columns))
+        date_idx = cls._date_idx
+        date_str = entry[date_idx]
+        try:
+            entry[date_idx] = datetime.strptime(
+                date_str.split(" ")[0],
+                '%Y-%m-%d').date()
+        except ValueError:
+            raise ClickException(
+                "The date ({}) was not entered in the correct format (YYYY-MM-DD)"  # noqa: E501
+                .format(date_str))
+        qty_idx = cls._qty_idx
+        qty_str = entry[qty_idx]
+        try:
+            entry[qty_idx] = abs(round(Decimal(qty_str), 4))
+        except InvalidOperation:
+            raise ClickException(
+                "The quantity entered {} is not a valid number"
+                .format(qty_str))
+        price_idx = cls._price_idx
+        price_str = entry[price_idx]
+        try:
+            entry[price_idx] = abs(round(Decimal(price_str), 4))
+        except InvalidOperation:
+            raise ClickException(
+                "The price entered {} is not a valid number"
+                .format(price_str))
+        commission_idx = cls._commission_idx
+        commission_str = entry[commission_idx]
+        try:
+            entry[commission_idx] = abs(
+                round(Decimal(commission_str), 4))
+        except InvalidOperation:
+            raise ClickException(
+                "The commission entered {} is not a valid number"
+                .format(commission_str))
+        return Transaction.from_parsed(*entry)
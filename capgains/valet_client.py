@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+
+# This module is only imported once the first request is made, so that
+# starting the CLI does not load requests
+import requests
+from requests.adapters import HTTPAdapter
+
+from capgains.rate_registry import RateRegistry
+
+
+class ValetClient:
+    """Makes the HTTP requests to the Bank of Canada Valet API over a single
+    pooled session, so that connections are kept alive and reused by every
+    ExchangeRate.
+
+    Requests time out instead of hanging on a stalled server, and are retried
+    with exponential backoff and jitter when the connection fails or the
+    server responds with a 5xx error. At most max_concurrent requests are in
+    flight at once, as many as the threads that RateRegistry fetches with by
+    default, and consecutive requests are started at least
+    min_interval seconds apart, to keep bulk jobs polite.
+    """
+    retry_statuses = (500, 502, 503, 504)
+
+    def __init__(self, connect_timeout=5, read_timeout=30, max_retries=3,
+                 backoff_factor=0.5, backoff_max=10,
+                 max_concurrent=RateRegistry.max_workers,
+                 min_interval=0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.min_interval = min_interval
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.max_concurrent = max_concurrent
+        self._interval_lock = threading.Lock()
+        self._next_request_time = 0
+
+    @property
+    def max_concurrent(self):
+        return self._max_concurrent
+
+    @max_concurrent.setter
+    def max_concurrent(self, max_concurrent):
+        """Change how many requests can be in flight at once. The session is
+        made again when it is next needed, so that its connection pool
+        matches."""
+        with self._session_lock:
+            self._max_concurrent = max_concurrent
+            self._semaphore = threading.BoundedSemaphore(max_concurrent)
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    @property
+    def session(self):
+        """The pooled session, which is only created when it is first
+        needed"""
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=self.max_concurrent)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+    def get(self, url, params=None):
+        """Send a GET request, retrying failed attempts. Raises the same
+        exceptions as requests.get once all retries are exhausted."""
+        attempt = 0
+        while True:
+            try:
+                with self._semaphore:
+                    self._wait_for_turn()
+                    response = self.session.get(
+                        url, params=params,
+                        timeout=(self.connect_timeout, self.read_timeout))
+            except requests.ConnectionError:
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code not in self.retry_statuses:
+                    return response
+                if attempt >= self.max_retries:
+                    response.raise_for_status()
+            self._backoff(attempt)
+            attempt += 1
+
+    def _wait_for_turn(self):
+        """Block until min_interval seconds have passed since the start of
+        the previous request"""
+        with self._interval_lock:
+            wait = self._next_request_time - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._next_request_time = time.monotonic() + self.min_interval
+
+    def _backoff(self, attempt):
+        """Sleep before the next attempt, for exponentially longer after each
+        failed attempt. A random jitter keeps concurrent retries apart."""
+        delay = min(self.backoff_max, self.backoff_factor * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+
+    def close(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+valet_client = ValetClient()
@@ -2,8 +2,37 @@ import pytest
 import requests_mock as rm
 from datetime import date
 
+from capgains.exchange_rate import ExchangeRate
+from capgains.rate_cache import RateCache
+from capgains.rate_registry import rate_registry
 from capgains.transaction import Transaction
 from capgains.transactions import Transactions
+from capgains.valet_client import valet_client
+
+
+@pytest.fixture(autouse=True)
+def clear_rate_registry(tmp_path, monkeypatch):
+    """Make sure that the exchange rates fetched in one test are not reused
+    by another test, in memory or through the on-disk rate cache, and that
+    the rate source is restored after each test. Any other cache is kept in
+    the test's own directory."""
+    monkeypatch.setenv('CAPGAINS_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(ExchangeRate, 'rate_provider',
+                        ExchangeRate.rate_provider)
+    monkeypatch.setattr(rate_registry, 'cache',
+                        RateCache(str(tmp_path / RateCache.filename)))
+    rate_registry.clear()
+    yield
+    rate_registry.clear()
+
+
+@pytest.fixture(autouse=True)
+def no_retry_backoff(monkeypatch):
+    """Retry failed exchange rate requests without sleeping in between, and
+    restore the concurrency limit that the calc command sets"""
+    monkeypatch.setattr(valet_client, 'backoff_factor', 0)
+    monkeypatch.setattr(valet_client, 'max_concurrent',
+                        valet_client.max_concurrent)
 
 
 @pytest.fixture(scope="session")
@@ -35,3 +35,9 @@ def transactions_to_list(transactions):
             t.commission, t.currency
         ])
     return transactions_list
+
+
+def transaction_attributes(transaction):
+    """Return every attribute stored on a transaction, to compare them"""
+    return {attr: getattr(transaction, attr)
+            for attr in transaction.__slots__}
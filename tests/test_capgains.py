@@ -126,3 +126,157 @@ def test_calc_no_year(testfiles_dir, transactions):
     runner = CliRunner()
     result = runner.invoke(capgains, ['calc', filepath])
     assert result.exit_code == 2
+
+
+def test_calc_rates_file(testfiles_dir, tmp_path, monkeypatch):
+    """Testing the capgains calc command reading the exchange rates from a
+    local file"""
+    filepath = create_csv_file(testfiles_dir,
+                               "calcratesfiletest.csv",
+                               [["2020-05-21", "Stocks", "ANET", "BUY", "10",
+                                 "10.00", "0.00", "USD"],
+                                ["2020-05-22", "Stocks", "ANET", "SELL",
+                                 "10", "20.00", "0.00", "USD"]],
+                               True)
+    rates_file = tmp_path / 'rates.csv'
+    rates_file.write_text('date,FXUSDCAD\n2020-05-20,1.5\n')
+    monkeypatch.chdir(tmp_path)
+
+    runner = CliRunner()
+    result = runner.invoke(capgains, ['calc', filepath, '2020',
+                                      '--rates-file', str(rates_file)])
+    assert result.exit_code == 0
+    assert "[Total Gains = 150.00]" in result.output
+
+
+def test_calc_years(testfiles_dir, tmp_path, monkeypatch):
+    """Testing the capgains calc command with a range of years"""
+    filepath = create_csv_file(testfiles_dir,
+                               "calcyearstest.csv",
+                               [["2019-05-21", "Stocks", "ANET", "BUY", "10",
+                                 "10.00", "0.00", "CAD"],
+                                ["2019-06-21", "Stocks", "ANET", "SELL", "5",
+                                 "20.00", "0.00", "CAD"],
+                                ["2020-05-22", "Stocks", "ANET", "SELL",
+                                 "5", "30.00", "0.00", "CAD"]],
+                               True)
+    monkeypatch.chdir(tmp_path)
+
+    runner = CliRunner()
+    result = runner.invoke(capgains, ['calc', filepath, '--years',
+                                      '2019-2020'])
+    assert result.exit_code == 0
+    assert result.output.index("ANET-2019\n[Total Gains = 50.00]") < \
+        result.output.index("ANET-2020\n[Total Gains = 100.00]")
+    assert (tmp_path / 'schedule3-2019.csv').exists()
+    assert (tmp_path / 'schedule3-2020.csv').exists()
+
+    result = runner.invoke(capgains, ['calc', filepath, '2019', '--years',
+                                      '2019-2020'])
+    assert result.exit_code == 2
+
+    result = runner.invoke(capgains, ['calc', filepath, '--years',
+                                      '2020-2019'])
+    assert result.exit_code == 2
+
+
+def test_calc_years_cut_off(testfiles_dir, tmp_path, monkeypatch):
+    """Testing that every year of a range is calculated with only the
+    transactions made up to its end, as when it is calculated on its own"""
+    filepath = create_csv_file(testfiles_dir,
+                               "calcyearscutoff.csv",
+                               [["2018-01-10", "Stocks", "ANET", "BUY", "100",
+                                 "10.00", "0.00", "CAD"],
+                                ["2018-12-20", "Stocks", "ANET", "SELL", "50",
+                                 "5.00", "0.00", "CAD"],
+                                ["2019-01-05", "Stocks", "ANET", "BUY", "10",
+                                 "5.00", "0.00", "CAD"],
+                                ["2019-06-01", "Stocks", "ANET", "SELL", "60",
+                                 "20.00", "0.00", "CAD"]],
+                               True)
+    monkeypatch.chdir(tmp_path)
+
+    runner = CliRunner()
+    single_years = [runner.invoke(capgains, ['calc', filepath, year])
+                    for year in ('2018', '2019')]
+    result = runner.invoke(capgains, ['calc', filepath, '--years',
+                                      '2018-2019'])
+    assert result.exit_code == 0
+    # The purchase in January does not make the loss of 2018 superficial,
+    # since it was made after the end of 2018
+    assert "ANET-2018\n[Total Gains = -250.00]" in result.output
+    assert "ANET-2019\n[Total Gains = 400.00]" in result.output
+    assert result.output == "".join(r.output for r in single_years)
+
+
+def test_calc_fetch_workers(testfiles_dir, tmp_path, monkeypatch):
+    """Testing that --fetch-workers also limits how many requests the HTTP
+    client makes at once"""
+    from capgains.rate_registry import rate_registry
+    from capgains.valet_client import valet_client
+    filepath = create_csv_file(testfiles_dir, "calcfetchworkers.csv",
+                               [["2019-05-21", "Stocks", "ANET", "BUY", "10",
+                                 "10.00", "0.00", "CAD"]],
+                               True)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rate_registry, 'max_workers',
+                        rate_registry.max_workers)
+
+    runner = CliRunner()
+    result = runner.invoke(capgains, ['calc', filepath, '2019',
+                                      '--fetch-workers', '8'])
+    assert result.exit_code == 0
+    assert rate_registry.max_workers == 8
+    assert valet_client.max_concurrent == 8
+
+
+def test_calc_snapshot(testfiles_dir, tmp_path, monkeypatch):
+    """Testing the capgains calc command writing a year-end snapshot and
+    starting out from it"""
+    rows = [["2019-05-21", "Stocks", "ANET", "BUY", "10", "10.00", "0.00",
+             "CAD"],
+            ["2020-05-22", "Stocks", "ANET", "SELL", "5", "30.00", "0.00",
+             "CAD"]]
+    full_path = create_csv_file(testfiles_dir, "calcsnapshotfull.csv", rows,
+                                True)
+    later_path = create_csv_file(testfiles_dir, "calcsnapshotlater.csv",
+                                 rows[1:], True)
+    snapshot_path = str(tmp_path / 'snapshot-2019.json')
+    monkeypatch.chdir(tmp_path)
+
+    runner = CliRunner()
+    expected = runner.invoke(capgains, ['calc', full_path, '2020'])
+    result = runner.invoke(capgains, ['calc', full_path, '2019',
+                                      '--snapshot-out', snapshot_path])
+    assert result.exit_code == 0
+    result = runner.invoke(capgains, ['calc', later_path, '2020',
+                                      '--opening-snapshot', snapshot_path])
+    assert result.exit_code == 0
+    assert result.output == expected.output
+    assert "[Total Gains = 100.00]" in result.output
+
+    result = runner.invoke(capgains, ['calc', later_path, '2019',
+                                      '--opening-snapshot', snapshot_path])
+    assert result.exit_code == 1
+    assert result.output == ("Error: Only the years after the opening "
+                             "snapshot of 2019 can be calculated\n")
+
+
+def test_show_format_option(testfiles_dir, transactions):
+    """Testing the capgains show command with the CSV format"""
+    filepath = create_csv_file(testfiles_dir,
+                               "showformattest.csv",
+                               transactions_to_list(transactions),
+                               True)
+
+    runner = CliRunner()
+    result = runner.invoke(capgains, ['show', filepath, '-t', 'GOOGL',
+                                      '--format', 'csv'])
+    assert result.exit_code == 0
+    assert result.output == """\
+date,description,ticker,action,qty,price,commission,currency
+2018-02-20,RSU VEST,GOOGL,BUY,30,20,10,USD
+"""
+
+    result = runner.invoke(capgains, ['show', filepath, '--format', 'xml'])
+    assert result.exit_code == 2
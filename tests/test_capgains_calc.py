@@ -2,6 +2,7 @@ from datetime import date
 import requests_mock as rm
 
 from capgains.commands import capgains_calc as CapGainsCalc
+from capgains.snapshot import Snapshot
 from capgains.transaction import Transaction
 from capgains.transactions import Transactions
 
@@ -196,3 +197,208 @@ ANET-2018
 +------------+---------------+----------+-------+------------+-------+-----------+---------------------+
 
 """  # noqa: E501
+
+
+def test_exchange_rates_fetched_once_for_all_tickers(capfd, requests_mock):
+    """Testing that the exchange rates are only fetched once when several
+    tickers use the same currency"""
+    transactions = Transactions([
+        Transaction(date(2018, 1, 1), 'Stocks', 'ANET', 'BUY', 10, 10.00,
+                    0.00, 'USD'),
+        Transaction(date(2018, 1, 2), 'Stocks', 'GOOGL', 'BUY', 10, 10.00,
+                    0.00, 'USD'),
+        Transaction(date(2018, 3, 1), 'Stocks', 'ANET', 'SELL', 10, 20.00,
+                    0.00, 'USD'),
+        Transaction(date(2018, 4, 1), 'Stocks', 'GOOGL', 'SELL', 10, 20.00,
+                    0.00, 'USD'),
+    ])
+    observations = [{'d': '2017-12-29', 'FXUSDCAD': {'v': '1.5'}}]
+    requests_mock.get(rm.ANY, json={"observations": observations})
+    CapGainsCalc.capgains_calc(transactions, 2018)
+    out, _ = capfd.readouterr()
+    assert "ANET-2018\n[Total Gains = 150.00]" in out
+    assert "GOOGL-2018\n[Total Gains = 150.00]" in out
+    assert requests_mock.call_count == 1
+
+
+def test_jobs_output_matches_serial(capfd, requests_mock):
+    """Testing that calculating the tickers in a pool of processes prints the
+    same output, in the same order, as calculating them one by one"""
+    transactions = Transactions([
+        Transaction(date(2018, 1, 1), 'Stocks', 'GOOGL', 'BUY', 10, 10.00,
+                    1.00, 'USD'),
+        Transaction(date(2018, 1, 2), 'Stocks', 'ANET', 'BUY', 10, 10.00,
+                    1.00, 'CAD'),
+        Transaction(date(2018, 1, 3), 'Stocks', 'MSFT', 'BUY', 10, 10.00,
+                    1.00, 'USD'),
+        Transaction(date(2018, 3, 1), 'Stocks', 'ANET', 'SELL', 5, 20.00,
+                    1.00, 'CAD'),
+        Transaction(date(2018, 4, 1), 'Stocks', 'GOOGL', 'SELL', 10, 5.00,
+                    1.00, 'USD'),
+        Transaction(date(2018, 5, 1), 'Stocks', 'MSFT', 'SELL', 10, 20.00,
+                    1.00, 'USD'),
+    ])
+    observations = [{'d': '2017-12-29', 'FXUSDCAD': {'v': '1.5'}},
+                    {'d': '2018-04-02', 'FXUSDCAD': {'v': '1.25'}}]
+    requests_mock.get(rm.ANY, json={"observations": observations})
+    CapGainsCalc.capgains_calc(transactions, 2018)
+    serial, _ = capfd.readouterr()
+    CapGainsCalc.capgains_calc(transactions, 2018, jobs=3)
+    parallel, _ = capfd.readouterr()
+    assert parallel == serial
+    assert serial.index("ANET-2018") < serial.index("GOOGL-2018") < \
+        serial.index("MSFT-2018")
+
+
+def test_years_match_single_years(capfd, requests_mock, tmp_path,
+                                  monkeypatch):
+    """Testing that calculating a range of years prints the same tables and
+    writes the same schedule 3 files as calculating each year on its own"""
+    monkeypatch.chdir(tmp_path)
+    transactions = Transactions([
+        Transaction(date(2018, 1, 1), 'Stocks', 'ANET', 'BUY', 20, 10.00,
+                    1.00, 'USD'),
+        Transaction(date(2018, 1, 2), 'Stocks', 'GOOGL', 'BUY', 10, 10.00,
+                    1.00, 'CAD'),
+        Transaction(date(2018, 6, 1), 'Stocks', 'ANET', 'SELL', 5, 20.00,
+                    1.00, 'USD'),
+        Transaction(date(2019, 6, 1), 'Stocks', 'ANET', 'SELL', 5, 30.00,
+                    1.00, 'USD'),
+        Transaction(date(2019, 7, 1), 'Stocks', 'GOOGL', 'SELL', 10, 20.00,
+                    1.00, 'CAD'),
+        Transaction(date(2020, 6, 1), 'Stocks', 'ANET', 'SELL', 10, 40.00,
+                    1.00, 'USD'),
+    ])
+    observations = [{'d': '2017-12-29', 'FXUSDCAD': {'v': '1.5'}},
+                    {'d': '2019-05-31', 'FXUSDCAD': {'v': '1.25'}}]
+    requests_mock.get(rm.ANY, json={"observations": observations})
+    expected_out = ""
+    expected_files = {}
+    for year in (2018, 2019, 2020):
+        CapGainsCalc.capgains_calc(transactions, year)
+        out, _ = capfd.readouterr()
+        expected_out += out
+        path = tmp_path / 'schedule3-{}.csv'.format(year)
+        expected_files[year] = path.read_text()
+        path.unlink()
+
+    CapGainsCalc.capgains_calc_years(transactions, [2018, 2019, 2020])
+    out, _ = capfd.readouterr()
+    assert out == expected_out
+    for year in (2018, 2019, 2020):
+        path = tmp_path / 'schedule3-{}.csv'.format(year)
+        assert path.read_text() == expected_files[year]
+
+
+def _snapshot_transactions():
+    return [
+        Transaction(date(2018, 1, 10), 'Stocks', 'ANET', 'BUY', 100, 10.00,
+                    1.00, 'CAD'),
+        Transaction(date(2018, 6, 1), 'Stocks', 'GOOGL', 'BUY', 10, 10.00,
+                    1.00, 'CAD'),
+        Transaction(date(2018, 12, 20), 'Stocks', 'ANET', 'BUY', 10, 5.00,
+                    1.00, 'CAD'),
+        Transaction(date(2019, 1, 5), 'Stocks', 'ANET', 'SELL', 50, 5.00,
+                    1.00, 'CAD'),
+        Transaction(date(2019, 6, 1), 'Stocks', 'ANET', 'SELL', 20, 20.00,
+                    1.00, 'CAD'),
+    ]
+
+
+def test_opening_snapshot_matches_full_replay(capfd, tmp_path, monkeypatch):
+    """Testing that starting out from a year-end snapshot calculates the
+    same gains, including the superficial losses caused by purchases made
+    at the end of the snapshot's year, as replaying every transaction"""
+    monkeypatch.chdir(tmp_path)
+    CapGainsCalc.capgains_calc(Transactions(_snapshot_transactions()), 2019)
+    expected, _ = capfd.readouterr()
+    assert "2019-01-05" not in expected
+
+    closing = CapGainsCalc.capgains_calc_years(
+        Transactions(_snapshot_transactions()), [2018])
+    capfd.readouterr()
+    path = str(tmp_path / 'snapshot-2018.json')
+    closing.save(path)
+    opening = Snapshot.load(path)
+    assert opening.year == 2018
+    # The purchase is within 30 days of the year end, so it is replayed
+    # again with the following year
+    assert opening.positions['ANET'].buy_dates == []
+    assert [entry[0] for entry in opening.positions['ANET'].pending] == \
+        [date(2018, 12, 20)]
+    assert opening.positions['GOOGL'].buy_dates == []
+
+    later = [t for t in _snapshot_transactions() if t.date.year == 2019]
+    closing = CapGainsCalc.capgains_calc_years(Transactions(later), [2019],
+                                               opening=opening)
+    out, _ = capfd.readouterr()
+    assert out == expected
+    # Tickers without transactions after the snapshot are carried forward
+    assert closing.positions['GOOGL'].share_balance == 10
+    assert closing.positions['ANET'].share_balance == 40
+
+
+def test_opening_snapshot_resolves_pending_losses(capfd, tmp_path,
+                                                  monkeypatch):
+    """Testing that a loss made at the end of the snapshot's year becomes a
+    superficial loss through a purchase made after the snapshot, as it does
+    when replaying every transaction"""
+    monkeypatch.chdir(tmp_path)
+    rows = [
+        Transaction(date(2018, 1, 10), 'Stocks', 'ANET', 'BUY', 100, 10.00,
+                    0.00, 'CAD'),
+        Transaction(date(2018, 12, 20), 'Stocks', 'ANET', 'SELL', 50, 5.00,
+                    0.00, 'CAD'),
+        Transaction(date(2019, 1, 5), 'Stocks', 'ANET', 'BUY', 10, 5.00,
+                    0.00, 'CAD'),
+        Transaction(date(2019, 6, 1), 'Stocks', 'ANET', 'SELL', 60, 20.00,
+                    0.00, 'CAD'),
+    ]
+    CapGainsCalc.capgains_calc(Transactions(rows), 2019)
+    expected, _ = capfd.readouterr()
+    assert "| 2019-06-01 | Stocks        | ANET     |    60 |   1,200.00 " \
+        "| 800.00 |      0.00 |              400.00 |" in expected
+
+    path = str(tmp_path / 'snapshot-2018.json')
+    CapGainsCalc.capgains_calc_years(Transactions(rows), [2018]).save(path)
+    capfd.readouterr()
+    opening = Snapshot.load(path)
+    assert opening.positions['ANET'].share_balance == 100
+    assert opening.positions['ANET'].total_acb == 1000
+
+    later = [t for t in rows if t.date.year == 2019]
+    CapGainsCalc.capgains_calc_years(Transactions(later), [2019],
+                                     opening=opening)
+    out, _ = capfd.readouterr()
+    assert out == expected
+
+
+def test_jsonl_format(capfd, tmp_path, monkeypatch):
+    """Testing capgains_calc streaming the reported sales as JSON Lines,
+    with the messages going to standard error and the same schedule 3
+    file as the table"""
+    monkeypatch.chdir(tmp_path)
+    transactions = Transactions([
+        Transaction(date(2018, 1, 1), 'Stocks', 'ANET', 'BUY', 100, 10.00,
+                    1.00, 'CAD'),
+        Transaction(date(2018, 3, 1), 'Stocks', 'ANET', 'SELL', 50, 2000.00,
+                    1.00, 'CAD'),
+    ])
+    CapGainsCalc.capgains_calc(transactions, 2018)
+    capfd.readouterr()
+    schedule3 = (tmp_path / 'schedule3-2018.csv').read_text()
+
+    CapGainsCalc.capgains_calc(transactions, 2018, output_format='jsonl')
+    out, err = capfd.readouterr()
+    assert out == (
+        '{"year": 2018, "date": "2018-03-01", "description": "Stocks", '
+        '"ticker": "ANET", "qty": "50", "proceeds": "100000.00", '
+        '"acb": "500.50", "outlays": "1.00", "capital_gain": "99498.50"}\n')
+    assert err == ""
+    assert (tmp_path / 'schedule3-2018.csv').read_text() == schedule3
+
+    CapGainsCalc.capgains_calc(Transactions([]), 2018, output_format='csv')
+    out, err = capfd.readouterr()
+    assert out == ("year,date,description,ticker,qty,proceeds,acb,outlays,"
+                   "capital_gain\n")
+    assert err == "No transactions available\n"
@@ -124,3 +124,36 @@ def test_partial_shares(capfd, requests_mock):
 | 2018-02-20 | RSU VEST      | ANET     | SELL     |   0.5 |  100.00 |         0.00 |        CAD |
 +------------+---------------+----------+----------+-------+---------+--------------+------------+
 """  # noqa: E501
+
+
+def test_show_stream(transactions, capfd):
+    """Testing capgains_show with a stream of transactions"""
+    CapGainsShow.capgains_show(iter(transactions.transactions), ['GOOGL'])
+    out, _ = capfd.readouterr()
+    assert out == """\
++------------+---------------+----------+----------+-------+---------+--------------+------------+
+| date       | description   | ticker   | action   |   qty |   price |   commission |   currency |
+|------------+---------------+----------+----------+-------+---------+--------------+------------|
+| 2018-02-20 | RSU VEST      | GOOGL    | BUY      |    30 |   20.00 |        10.00 |        USD |
++------------+---------------+----------+----------+-------+---------+--------------+------------+
+"""  # noqa: E501
+
+
+def test_csv_format(transactions, capfd):
+    """Testing capgains_show streaming the transactions as CSV"""
+    CapGainsShow.capgains_show(transactions, tickers=['GOOGL'],
+                               output_format='csv')
+    out, _ = capfd.readouterr()
+    assert out == """\
+date,description,ticker,action,qty,price,commission,currency
+2018-02-20,RSU VEST,GOOGL,BUY,30,20,10,USD
+"""
+
+
+def test_jsonl_format_no_results(transactions, capfd):
+    """Testing capgains_show streaming no transactions as JSON Lines"""
+    CapGainsShow.capgains_show(transactions, tickers=['FB'],
+                               output_format='jsonl')
+    out, err = capfd.readouterr()
+    assert out == ""
+    assert err == "No results found\n"
@@ -21,42 +21,29 @@ def _request_error_throwing_test(requests_mock, expected_error,
 
 @pytest.fixture(scope='function')
 def USD_exchange_rates_mock(requests_mock):
-    noon_rate_matcher = re.compile(ExchangeRate.valet_obs_url)
-    indicative_rate_matcher = re.compile(ExchangeRate.valet_obs_url + '/FX')
-    requests_mock.get(noon_rate_matcher,
-                      json={
-                          "observations": [
-                              {
-                                  "d": "2016-05-21",
-                                  "IEXE0101": {
-                                      "v": "1.1"
-                                  }
-                              },
-                          ]
-                      })
-    requests_mock.get(indicative_rate_matcher,
-                      json={
-                          "observations": [
-                              {
-                                  "d": "2020-05-21",
-                                  "FXUSDCAD": {
-                                      "v": "1.2"
-                                  }
-                              },
-                              {
-                                  "d": "2020-05-22",
-                                  "FXUSDCAD": {
-                                      "v": "1.3"
-                                  }
-                              },
-                              {
-                                  "d": "2020-05-25",
-                                  "FXUSDCAD": {
-                                      "v": "1.4"
-                                  }
-                              },
-                          ]
-                      })
+    observations = {
+        "IEXE0101": [
+            ("2016-05-21", "1.1"),
+        ],
+        "FXUSDCAD": [
+            ("2020-05-21", "1.2"),
+            ("2020-05-22", "1.3"),
+            ("2020-05-25", "1.4"),
+        ],
+    }
+
+    def observations_callback(request, context):
+        # Requests can ask for several comma-separated series at once, in
+        # which case the observations of all of them are returned
+        series = request.path.split('/')[-2].upper().split(',')
+        rows = dict()
+        for forex_str in series:
+            for day, value in observations.get(forex_str, []):
+                rows.setdefault(day, {"d": day})[forex_str] = {"v": value}
+        return {"observations": [rows[day] for day in sorted(rows)]}
+
+    requests_mock.get(re.compile(ExchangeRate.valet_obs_url),
+                      json=observations_callback)
 
 
 def test_exchange_rate_end_after_start():
@@ -178,3 +165,34 @@ def test_get_rate_before_min_date_exception(USD_exchange_rates_mock):
     with pytest.raises(ClickException) as excinfo:
         er.get_rate(date(2017, 1, 2))
     assert excinfo.value.message == "Unable to find exchange rate on 2017-01-02"  # noqa: E501
+
+
+def test_exchange_rate_closest_preceeding_date(USD_exchange_rates_mock):
+    """Test that a day without a rate uses the rate of the closest preceeding
+    day that has one, and not any earlier rate"""
+    er = ExchangeRate('USD', date(2020, 5, 21), date(2020, 5, 27))
+    assert er.get_rate(date(2020, 5, 21)) == Decimal('1.2')
+    assert er.get_rate(date(2020, 5, 23)) == Decimal('1.3')
+    assert er.get_rate(date(2020, 5, 25)) == Decimal('1.4')
+    assert er.get_rate(date(2020, 5, 27)) == Decimal('1.4')
+    with pytest.raises(ClickException):
+        er.get_rate(date(2020, 5, 20))
+
+
+def test_noon_and_indicative_fetched_together(requests_mock,
+                                              USD_exchange_rates_mock):
+    """Test that the noon and indicative series are fetched with a single
+    request"""
+    ExchangeRate('USD', date(2016, 5, 21), date(2020, 5, 22))
+    assert requests_mock.call_count == 1
+    assert requests_mock.last_request.path.endswith(
+        '/iexe0101,fxusdcad/json')
+
+
+def test_exchange_rate_slice(USD_exchange_rates_mock):
+    """Test that a slice keeps the closest preceeding rate of its start date
+    and drops the rates after its end date"""
+    er = ExchangeRate('USD', date(2020, 5, 21), date(2020, 5, 27))
+    sliced = er.slice(date(2020, 5, 23), date(2020, 5, 24))
+    assert list(sliced._rate_dates) == [date(2020, 5, 22).toordinal()]
+    assert sliced.get_rate(date(2020, 5, 24)) == Decimal('1.3')
@@ -0,0 +1,168 @@
+import os
+
+from click.testing import CliRunner
+from capgains.cli import capgains
+from capgains.ledger_cache import LedgerCache
+from capgains.transactions_reader import TransactionsReader
+
+from tests.helpers import (create_csv_file, transactions_to_list,
+                           transaction_attributes)
+
+
+def _fail_to_read(csv_file):
+    raise AssertionError("The CSV-file should not have been read")
+
+
+def test_warm_load_does_not_read_csv(tmp_path, testfiles_dir, transactions,
+                                     monkeypatch):
+    """Testing that cached entries are loaded without parsing the CSV-file
+    again"""
+    filepath = create_csv_file(testfiles_dir, "ledgercache.csv",
+                               transactions_to_list(transactions))
+    cache = LedgerCache(str(tmp_path / 'ledgers'))
+    cold = cache.get_transactions(filepath)
+    assert os.path.exists(cache.path_for(filepath))
+
+    monkeypatch.setattr(TransactionsReader, 'iter_transactions',
+                        _fail_to_read)
+    warm = cache.get_transactions(filepath)
+    assert ([transaction_attributes(t) for t in warm] ==
+            [transaction_attributes(t) for t in cold])
+
+
+def test_changed_csv_is_read_again(tmp_path, testfiles_dir, transactions):
+    """Testing that the cached entries are invalidated when entries are
+    added to the CSV-file"""
+    filepath = create_csv_file(testfiles_dir, "ledgercachechanged.csv",
+                               transactions_to_list(transactions[:2]))
+    cache = LedgerCache(str(tmp_path / 'ledgers'))
+    assert len(cache.get_transactions(filepath)) == 2
+
+    filepath = create_csv_file(testfiles_dir, "ledgercachechanged.csv",
+                               transactions_to_list(transactions))
+    assert len(cache.get_transactions(filepath)) == 4
+
+
+def test_same_size_csv_is_hashed(tmp_path, testfiles_dir, transactions):
+    """Testing that an entry changed without changing the size of the
+    CSV-file invalidates the cached entries, while touching it does not"""
+    rows = transactions_to_list(transactions)
+    filepath = create_csv_file(testfiles_dir, "ledgercachehash.csv", rows)
+    cache = LedgerCache(str(tmp_path / 'ledgers'))
+    cache.get_transactions(filepath)
+
+    stat = os.stat(filepath)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load(filepath) is not None
+
+    rows[0][2] = 'ABCD'
+    filepath = create_csv_file(testfiles_dir, "ledgercachehash.csv", rows)
+    os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+    assert os.stat(filepath).st_size == stat.st_size
+    assert cache.load(filepath) is None
+    assert cache.get_transactions(filepath)[0].ticker == 'ABCD'
+
+
+def test_corrupt_cache_is_ignored(tmp_path, testfiles_dir, transactions):
+    """Testing that an unreadable cache file falls back to the CSV-file"""
+    filepath = create_csv_file(testfiles_dir, "ledgercachecorrupt.csv",
+                               transactions_to_list(transactions))
+    cache = LedgerCache(str(tmp_path / 'ledgers'))
+    cache.get_transactions(filepath)
+    with open(cache.path_for(filepath), 'wb') as f:
+        f.write(b'not a cache')
+    assert cache.load(filepath) is None
+    assert len(cache.get_transactions(filepath)) == 4
+
+
+def test_show_ledger_cache(testfiles_dir, transactions):
+    """Testing the capgains show command with the ledger cache"""
+    filepath = create_csv_file(testfiles_dir, "showledgercache.csv",
+                               transactions_to_list(transactions))
+    runner = CliRunner()
+    uncached = runner.invoke(capgains, ['show', filepath])
+    cold = runner.invoke(capgains, ['show', filepath, '--ledger-cache'])
+    warm = runner.invoke(capgains, ['show', filepath, '--ledger-cache'])
+    assert cold.exit_code == 0
+    assert cold.output == warm.output == uncached.output
+    assert os.path.exists(LedgerCache().path_for(filepath))
+
+
+def test_show_ledger_cache_tickers(testfiles_dir, transactions):
+    """Testing the capgains show command filtering the cached transactions
+    by ticker"""
+    filepath = create_csv_file(testfiles_dir, "showledgercachetickers.csv",
+                               transactions_to_list(transactions))
+    runner = CliRunner()
+    uncached = runner.invoke(capgains, ['show', filepath, '-t', 'ANET'])
+    cold = runner.invoke(capgains, ['show', filepath, '-t', 'ANET',
+                                    '--ledger-cache'])
+    warm = runner.invoke(capgains, ['show', filepath, '-t', 'ANET'],
+                         env={'CAPGAINS_LEDGER_CACHE': '1'})
+    assert cold.exit_code == 0
+    assert warm.exit_code == 0
+    assert "GOOGL" not in cold.output
+    assert cold.output == warm.output == uncached.output
+
+
+def test_calc_ledger_cache(testfiles_dir, tmp_path, monkeypatch):
+    """Testing the capgains calc command with the ledger cache, which
+    filters the cached transactions by ticker and year"""
+    filepath = create_csv_file(
+        testfiles_dir, "calcledgercache.csv",
+        [["2018-01-10", "Stocks", "ANET", "BUY", "10", "10.00", "0.00",
+          "CAD"],
+         ["2018-03-01", "Stocks", "GOOGL", "BUY", "10", "10.00", "0.00",
+          "CAD"],
+         ["2018-06-01", "Stocks", "ANET", "SELL", "5", "20.00", "0.00",
+          "CAD"],
+         ["2019-06-01", "Stocks", "ANET", "SELL", "5", "30.00", "0.00",
+          "CAD"]])
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    uncached = runner.invoke(capgains, ['calc', filepath, '2018', '-t',
+                                        'ANET'])
+    cold = runner.invoke(capgains, ['calc', filepath, '2018', '-t', 'ANET',
+                                    '--ledger-cache'])
+    warm = runner.invoke(capgains, ['calc', filepath, '2018', '-t', 'ANET',
+                                    '--ledger-cache'])
+    assert cold.exit_code == 0
+    assert warm.exit_code == 0
+    assert "ANET-2018\n[Total Gains = 50.00]" in cold.output
+    assert "GOOGL" not in cold.output
+    assert cold.output == warm.output == uncached.output
+
+
+def test_show_ledger_cache_file_not_found(testfiles_dir):
+    """Testing the ledger cache with a file that doesn't exist"""
+    filepath = create_csv_file(testfiles_dir, "showledgercachedne.csv")
+    runner = CliRunner()
+    result = runner.invoke(capgains, ['show', filepath, '--ledger-cache'])
+    assert result.exit_code == 1
+    assert result.output == "Error: File not found: {}\n".format(filepath)
+
+
+class _Planted:
+    """Creates a directory when it is unpickled"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return (os.makedirs, (self.path,))
+
+
+def test_planted_pickle_is_not_loaded(tmp_path, testfiles_dir, transactions):
+    """Testing that a pickle planted in the cache directory is never
+    unpickled"""
+    import pickle
+    filepath = create_csv_file(testfiles_dir, "ledgercacheplanted.csv",
+                               transactions_to_list(transactions))
+    cache = LedgerCache(str(tmp_path / 'ledgers'))
+    os.makedirs(cache.directory)
+    marker = str(tmp_path / 'unpickled')
+    with open(cache.path_for(filepath), 'wb') as f:
+        pickle.dump(_Planted(marker), f)
+    assert cache.load(filepath) is None
+    assert not os.path.exists(marker)
+    assert len(cache.get_transactions(filepath)) == 4
@@ -0,0 +1,74 @@
+import os
+from datetime import date
+
+from click.testing import CliRunner
+from capgains.cli import capgains
+from capgains.ledger_index import LedgerIndex
+from capgains.transactions_reader import TransactionsReader
+
+from tests.helpers import create_csv_file, transaction_attributes
+
+rows = [
+    ["2017-02-15", "Stocks", "ANET", "BUY", "100", "50.00", "10.00", "USD"],
+    ["2018-02-20", "Stocks", "GOOGL", "BUY", "30", "20.00", "10.00", "USD"],
+    ["2018-02-20", "Stocks", "ANET", "SELL", "50", "120.00", "10.00", "USD"],
+    ["2018-03-01", "Stocks", "ANET", "BUY", "5", "110.00", "10.00", "USD"],
+    ["2019-02-15", "Stocks", "ANET", "BUY", "50", "130.00", "10.00", "USD"],
+]
+
+
+def test_index_reads_only_selected_ranges(testfiles_dir):
+    """Testing that an indexed CSV-file is read through the ranges of the
+    requested tickers and years"""
+    filepath = create_csv_file(testfiles_dir, "indexed.csv", rows)
+    LedgerIndex.build(filepath).save()
+    ledger_index = LedgerIndex.load(filepath)
+    assert ledger_index.entries == 5
+    assert ledger_index.tickers == ['ANET', 'GOOGL']
+    # The 2018 entries of ANET follow each other, so they are read at once
+    assert [entry_no for _, _, entry_no in ledger_index.ranges(
+        ['ANET'], date(2018, 1, 1), date(2018, 12, 31))] == [2]
+
+    expected = TransactionsReader.get_transactions(filepath)
+    expected = expected.filter_by(tickers=['ANET'], min_year=2018,
+                                  max_year=2018)
+    actual = TransactionsReader.get_transactions(
+        filepath, tickers=['ANET'], start_date=date(2018, 1, 1),
+        max_year=2018)
+    assert ([transaction_attributes(t) for t in actual] ==
+            [transaction_attributes(t) for t in expected])
+
+
+def test_stale_index_is_rebuilt(testfiles_dir):
+    """Testing that the index is rebuilt once entries are added to the
+    CSV-file"""
+    filepath = create_csv_file(testfiles_dir, "indexedstale.csv", rows[:2])
+    LedgerIndex.build(filepath).save()
+    filepath = create_csv_file(testfiles_dir, "indexedstale.csv", rows)
+    transactions = TransactionsReader.get_transactions(filepath,
+                                                       tickers=['ANET'])
+    assert len(transactions) == 4
+    assert LedgerIndex.load(filepath).entries == 5
+
+
+def test_index_command(testfiles_dir):
+    """Testing the capgains index command"""
+    filepath = create_csv_file(testfiles_dir, "indexcommand.csv", rows)
+    runner = CliRunner()
+    result = runner.invoke(capgains, ['index', filepath])
+    assert result.exit_code == 0
+    assert result.output == "Indexed 5 entries of 2 tickers in {}\n".format(
+        LedgerIndex.path_for(filepath))
+    assert os.path.exists(LedgerIndex.path_for(filepath))
+
+
+def test_index_command_out_of_order(testfiles_dir):
+    """Testing that a CSV-file with entries out of order is not indexed"""
+    filepath = create_csv_file(testfiles_dir, "indexoutoforder.csv",
+                               [rows[1], rows[0]])
+    runner = CliRunner()
+    result = runner.invoke(capgains, ['index', filepath])
+    assert result.exit_code == 1
+    assert result.output == ("Error: Transactions were not entered in "
+                             "chronological order\n")
+    assert not os.path.exists(LedgerIndex.path_for(filepath))
@@ -0,0 +1,80 @@
+from datetime import date
+
+from click.testing import CliRunner
+from capgains.cli import capgains
+from capgains.ledger_store import LedgerStore
+from capgains.transactions_reader import TransactionsReader
+
+from tests.helpers import create_csv_file, transaction_attributes
+
+rows = [
+    ["2017-02-15", "Stocks", "ANET", "BUY", "100", "50.00", "10.00", "USD"],
+    ["2018-02-20", "Stocks", "GOOGL", "BUY", "30", "20.00", "10.00", "USD"],
+    ["2018-02-20", "Stocks", "ANET", "SELL", "50", "120.00", "10.00", "USD"],
+    ["2019-02-15", "Stocks", "ANET", "BUY", "50.5", "130.1", "9.999", "USD"],
+]
+
+
+def test_import_and_read(testfiles_dir, tmp_path):
+    """Testing that imported entries are read back exactly as they are read
+    from the CSV-file"""
+    filepath = create_csv_file(testfiles_dir, "store.csv", rows)
+    store = LedgerStore(str(tmp_path / 'ledger.db'))
+    assert store.import_csv(filepath) == 4
+    assert LedgerStore.is_store(store.path)
+    assert not LedgerStore.is_store(filepath)
+
+    expected = TransactionsReader.get_transactions(filepath)
+    assert ([transaction_attributes(t) for t in store.get_transactions()] ==
+            [transaction_attributes(t) for t in expected])
+    filtered = store.get_transactions(tickers=['ANET'],
+                                      start_date=date(2018, 1, 1),
+                                      max_year=2018)
+    assert [t.date for t in filtered] == [date(2018, 2, 20)]
+
+
+def test_import_appended_entries(testfiles_dir, tmp_path):
+    """Testing that importing a CSV-file again only imports the entries
+    appended to it"""
+    filepath = create_csv_file(testfiles_dir, "storeappend.csv", rows[:2])
+    store = LedgerStore(str(tmp_path / 'ledger.db'))
+    assert store.import_csv(filepath) == 2
+    assert store.import_csv(filepath) == 0
+
+    filepath = create_csv_file(testfiles_dir, "storeappend.csv", rows)
+    assert store.import_csv(filepath) == 2
+    assert len(store.get_transactions()) == 4
+
+
+def test_import_changed_csv(testfiles_dir, tmp_path):
+    """Testing that a CSV-file whose imported entries changed is not
+    imported again"""
+    filepath = create_csv_file(testfiles_dir, "storechanged.csv", rows[:2])
+    database = str(tmp_path / 'ledger.db')
+    LedgerStore(database).import_csv(filepath)
+    filepath = create_csv_file(testfiles_dir, "storechanged.csv",
+                               [rows[0], rows[2]])
+
+    runner = CliRunner()
+    result = runner.invoke(capgains, ['import', filepath, database])
+    assert result.exit_code == 1
+    assert result.output == ("Error: {} changed since it was imported. Only "
+                             "the entries appended to it can be imported\n"
+                             .format(filepath))
+    assert len(LedgerStore(database).get_transactions()) == 2
+
+
+def test_show_reads_store(testfiles_dir, tmp_path):
+    """Testing that the capgains show command reads from a database like it
+    reads from the CSV-file"""
+    filepath = create_csv_file(testfiles_dir, "storeshow.csv", rows)
+    database = str(tmp_path / 'ledger.db')
+    runner = CliRunner()
+    result = runner.invoke(capgains, ['import', filepath, database])
+    assert result.exit_code == 0
+    assert result.output == "Imported 4 entries into {}\n".format(database)
+
+    from_csv = runner.invoke(capgains, ['show', filepath, '-t', 'ANET'])
+    from_store = runner.invoke(capgains, ['show', database, '-t', 'ANET'])
+    assert from_store.exit_code == 0
+    assert from_store.output == from_csv.output
@@ -0,0 +1,52 @@
+import io
+import json
+import pytest
+
+from capgains.output import CsvRowWriter, JsonLinesRowWriter, RowWriter
+
+
+def test_csv_row_writer():
+    stream = io.StringIO()
+    with CsvRowWriter(['date', 'ticker'], stream) as writer:
+        writer.write(['2020-01-02', 'ANET'])
+        writer.write(['2020-01-03', 'A,B'])
+    assert writer.rows == 2
+    assert stream.getvalue() == ('date,ticker\n'
+                                 '2020-01-02,ANET\n'
+                                 '2020-01-03,"A,B"\n')
+
+
+def test_json_lines_row_writer():
+    stream = io.StringIO()
+    with JsonLinesRowWriter(['date', 'qty'], stream) as writer:
+        writer.write(['2020-01-02', '1.5'])
+    lines = stream.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'date': '2020-01-02', 'qty': '1.5'}]
+
+
+def test_rows_are_buffered(monkeypatch):
+    """Testing that rows are passed on to the stream in large chunks"""
+    writes = []
+
+    class Stream:
+        def write(self, s):
+            writes.append(s)
+
+        def flush(self):
+            pass
+
+    with JsonLinesRowWriter(['n'], Stream()) as writer:
+        for n in range(100):
+            writer.write([n])
+        assert writes == []
+    assert len(writes) == 1
+    assert writes[0].count('\n') == 100
+
+
+def test_row_writer_must_implement_write():
+    class IncompleteRowWriter(RowWriter):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteRowWriter(['n'], io.StringIO())
@@ -0,0 +1,92 @@
+import pstats
+
+from click.testing import CliRunner
+from capgains.cli import capgains
+from capgains.profiling import StageProfiler, profiler
+
+from tests.helpers import create_csv_file, transactions_to_list
+
+
+def test_disabled_profiler_records_nothing():
+    p = StageProfiler()
+    with p.stage('read transactions'):
+        pass
+    assert list(p.iter('read transactions', [1, 2])) == [1, 2]
+    assert 'read transactions' not in p.summary()
+
+
+def test_nested_stages_and_details():
+    p = StageProfiler()
+    p.enable()
+    for ticker in ('ANET', 'GOOGL'):
+        with p.stage('add_transactions', detail=ticker):
+            with p.stage('superficial loss checks'):
+                pass
+    assert list(p.iter('read transactions', [1, 2, 3])) == [1, 2, 3]
+    summary = p.summary()
+    rows = [[cell.strip() for cell in line.split('|')[1:3]]
+            for line in summary.splitlines()[3:-1]]
+    names = [name for name, _ in rows]
+    assert names[0] == 'add_transactions'
+    assert set(names[1:3]) == {'add_transactions [ANET]',
+                               'add_transactions [GOOGL]'}
+    assert names[3:] == ['add_transactions > superficial loss checks',
+                         'read transactions', 'other', 'total']
+    # Reading the 3 items takes 4 calls, the last one finding the end
+    assert dict(rows)['read transactions'] == '4'
+
+
+def test_profile_option(testfiles_dir, transactions, tmp_path):
+    """Testing that --profile prints the stages to standard error without
+    changing the output"""
+    filepath = create_csv_file(testfiles_dir, "profiletest.csv",
+                               transactions_to_list(transactions))
+    profile_out = str(tmp_path / 'show.prof')
+    runner = CliRunner(mix_stderr=False)
+    expected = runner.invoke(capgains, ['show', filepath])
+    result = runner.invoke(capgains, ['--profile', '--profile-out',
+                                      profile_out, 'show', filepath])
+    assert result.exit_code == 0
+    assert result.stdout == expected.stdout
+    assert 'read transactions' in result.stderr
+    assert 'render tables' in result.stderr
+    assert not profiler.enabled
+    assert pstats.Stats(profile_out).total_calls > 0
+
+
+def test_merge_worker_stages():
+    """Testing that the stages of a worker process are reported as part of
+    the stage that they were merged in"""
+    worker = StageProfiler()
+    worker.enable()
+    with worker.stage('add_transactions', detail='ANET'):
+        pass
+    p = StageProfiler()
+    p.enable()
+    with p.stage('wait for processes'):
+        p.merge(worker.export())
+        p.merge(worker.export())
+    summary = p.summary()
+    rows = [[cell.strip() for cell in line.split('|')[1:3]]
+            for line in summary.splitlines()[3:-1]]
+    assert rows[:3] == [
+        ['wait for processes', '1'],
+        ['wait for processes > add_transactions', '2'],
+        ['wait for processes > add_transactions [ANET]', ''],
+    ]
+
+
+def test_profile_option_with_jobs(testfiles_dir, tmp_path, monkeypatch):
+    """Testing that --profile reports the time of every ticker when the
+    tickers are calculated in a pool of processes"""
+    filepath = create_csv_file(
+        testfiles_dir, "profilejobstest.csv",
+        [["2018-01-10", "Stocks", ticker, "BUY", "10", "10.00", "0.00",
+          "CAD"] for ticker in ('ANET', 'GOOGL')])
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(capgains, ['--profile', 'calc', filepath, '2018',
+                                      '--jobs', '2'])
+    assert result.exit_code == 0
+    assert 'wait for processes > add_transactions [ANET]' in result.stderr
+    assert 'wait for processes > add_transactions [GOOGL]' in result.stderr
@@ -0,0 +1,89 @@
+import requests_mock as rm
+from datetime import date, timedelta
+
+from capgains.exchange_rate import ExchangeRate
+from capgains.rate_cache import RateCache
+from capgains.rate_registry import RateRegistry, rate_registry
+
+
+def test_store_and_load(tmp_path):
+    cache = RateCache(str(tmp_path / RateCache.filename))
+    day = date(2020, 1, 2)
+    cache.store('USD', 'FXUSDCAD', date(2020, 1, 1), date(2020, 1, 5),
+                {day.toordinal(): 1250000})
+    spans, rates = cache.load('USD', 'FXUSDCAD')
+    assert spans == [(date(2020, 1, 1), date(2020, 1, 5))]
+    assert rates == {day.toordinal(): 1250000}
+    assert cache.load('EUR', 'FXEURCAD') == ([], {})
+
+
+def test_spans_are_merged(tmp_path):
+    cache = RateCache(str(tmp_path / RateCache.filename))
+    cache.store('USD', 'FXUSDCAD', date(2020, 1, 1), date(2020, 1, 5), {})
+    cache.store('USD', 'FXUSDCAD', date(2020, 1, 10), date(2020, 1, 15), {})
+    cache.store('USD', 'FXUSDCAD', date(2020, 1, 6), date(2020, 1, 9), {})
+    spans, _ = cache.load('USD', 'FXUSDCAD')
+    assert spans == [(date(2020, 1, 1), date(2020, 1, 15))]
+
+
+def test_recent_days_are_not_recorded_as_fetched(tmp_path):
+    """Testing that the days that might not have a published rate yet are
+    fetched again in the next run"""
+    cache = RateCache(str(tmp_path / RateCache.filename))
+    today = date.today()
+    start = today - timedelta(days=30)
+    cache.store('USD', 'FXUSDCAD', start, today, {})
+    spans, _ = cache.load('USD', 'FXUSDCAD')
+    assert spans == [(start,
+                      today - timedelta(days=RateCache.settle_days))]
+
+
+def test_unusable_cache_is_ignored(tmp_path):
+    not_a_dir = tmp_path / 'file'
+    not_a_dir.write_text('')
+    cache = RateCache(str(not_a_dir / RateCache.filename))
+    cache.store('USD', 'FXUSDCAD', date(2020, 1, 1), date(2020, 1, 5), {})
+    assert cache.load('USD', 'FXUSDCAD') == ([], {})
+
+
+def test_default_path(monkeypatch, tmp_path):
+    monkeypatch.setenv('CAPGAINS_CACHE_DIR', str(tmp_path))
+    assert RateCache.default_path() == str(tmp_path / RateCache.filename)
+
+
+def test_rates_cached_across_runs(requests_mock):
+    """Testing that a new run does not fetch the rates that an earlier run
+    already fetched"""
+    requests_mock.get(rm.ANY, json={"observations": [
+        {"d": "2020-05-21", "FXUSDCAD": {"v": "1.25"}}]})
+    ExchangeRate('USD', date(2020, 5, 21), date(2020, 5, 22))
+    assert requests_mock.call_count == 1
+
+    # Simulate a new run, which starts with an empty registry
+    rate_registry.clear()
+    er = ExchangeRate('USD', date(2020, 5, 21), date(2020, 5, 22))
+    assert requests_mock.call_count == 1
+    assert er.get_rate(date(2020, 5, 22)) == ExchangeRate(
+        'USD', date(2020, 5, 21), date(2020, 5, 21)).get_rate(
+            date(2020, 5, 21))
+
+
+def test_registries_share_cache_file(tmp_path):
+    """Testing that registries in separate processes, sharing a cache file,
+    see each others' rates"""
+    path = str(tmp_path / RateCache.filename)
+    fetched = []
+
+    def fetch(start_date, end_date):
+        fetched.append((start_date, end_date))
+        return {start_date.toordinal(): 1}
+
+    first = RateRegistry(RateCache(path))
+    second = RateRegistry(RateCache(path))
+    first.get_series('USD', 'FXUSDCAD', date(2020, 1, 1), date(2020, 1, 31),
+                     fetch)
+    series = second.get_series('USD', 'FXUSDCAD', date(2020, 1, 1),
+                               date(2020, 2, 29), fetch)
+    assert fetched == [(date(2020, 1, 1), date(2020, 1, 31)),
+                       (date(2020, 2, 1), date(2020, 2, 29))]
+    assert len(series.rates_until(date(2020, 2, 29))[0]) == 2
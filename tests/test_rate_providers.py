@@ -0,0 +1,103 @@
+import json
+import pytest
+from click import ClickException
+from datetime import date
+from decimal import Decimal
+
+from capgains.exchange_rate import ExchangeRate
+from capgains.rate_providers import FileRateProvider, RateProvider
+
+VALET_CSV = '''\
+"TERMS AND CONDITIONS"
+"https://www.bankofcanada.ca/terms/"
+
+"SERIES"
+"id","label","description"
+"FXUSDCAD","USD/CAD","US dollar to Canadian dollar daily exchange rate"
+
+"OBSERVATIONS"
+"date","FXUSDCAD","FXEURCAD"
+"2020-05-21","1.3945","1.5297"
+"2020-05-22","1.4002",""
+'''
+
+
+@pytest.fixture
+def rates_json(tmp_path):
+    path = tmp_path / 'rates.json'
+    path.write_text(json.dumps({"observations": [
+        {"d": "2016-05-20", "IEXE0101": {"v": "1.31"}},
+        {"d": "2020-05-21", "FXUSDCAD": {"v": "1.3945"}},
+        {"d": "2020-05-22", "FXUSDCAD": {"v": "1.4002"}},
+    ]}))
+    return str(path)
+
+
+def test_json_file(rates_json):
+    provider = FileRateProvider(rates_json)
+    rates = provider.fetch('USD', date(2020, 5, 1), date(2020, 5, 21),
+                           ['FXUSDCAD', 'IEXE0101'])
+    assert rates == {'FXUSDCAD': {date(2020, 5, 21): Decimal('1.3945')},
+                     'IEXE0101': {}}
+
+
+def test_valet_csv_file(tmp_path):
+    path = tmp_path / 'rates.csv'
+    path.write_text(VALET_CSV)
+    provider = FileRateProvider(str(path))
+    rates = provider.fetch('USD, EUR', date(2020, 5, 1), date(2020, 5, 31),
+                           ['FXUSDCAD', 'FXEURCAD'])
+    assert rates == {
+        'FXUSDCAD': {date(2020, 5, 21): Decimal('1.3945'),
+                     date(2020, 5, 22): Decimal('1.4002')},
+        'FXEURCAD': {date(2020, 5, 21): Decimal('1.5297')},
+    }
+
+
+def test_csv_file_without_header(tmp_path):
+    path = tmp_path / 'rates.csv'
+    path.write_text('2020-05-21,1.3945\n')
+    provider = FileRateProvider(str(path))
+    with pytest.raises(ClickException) as excinfo:
+        provider.fetch('USD', date(2020, 5, 1), date(2020, 5, 31),
+                       ['FXUSDCAD'])
+    assert excinfo.value.message == (
+        "Could not read exchange rates from {} : no header row starting "
+        "with 'date' was found".format(path))
+
+
+def test_file_not_found(tmp_path):
+    path = str(tmp_path / 'dne.json')
+    provider = FileRateProvider(path)
+    with pytest.raises(ClickException) as excinfo:
+        provider.fetch('USD', date(2020, 5, 1), date(2020, 5, 31),
+                       ['FXUSDCAD'])
+    assert excinfo.value.message == "File not found: {}".format(path)
+
+
+def test_file_is_loaded_once(rates_json):
+    provider = FileRateProvider(rates_json)
+    provider.fetch('USD', date(2020, 5, 1), date(2020, 5, 31), ['FXUSDCAD'])
+    observations = provider._observations
+    provider.fetch('USD', date(2016, 5, 1), date(2016, 5, 31), ['IEXE0101'])
+    assert provider._observations is observations
+
+
+def test_exchange_rate_offline(rates_json, requests_mock):
+    """Testing that ExchangeRate does not use the network with a file rate
+    provider. requests_mock fails any request that is made."""
+    ExchangeRate.rate_provider = FileRateProvider(rates_json)
+    er = ExchangeRate('USD', date(2016, 5, 20), date(2020, 5, 24))
+    assert er.get_rate(date(2016, 5, 22)) == Decimal('1.31')
+    assert er.get_rate(date(2020, 5, 24)) == Decimal('1.4002')
+    assert requests_mock.call_count == 0
+
+
+def test_rate_provider_must_implement_fetch():
+    """Testing that a rate provider without a fetch method can not be
+    created"""
+    class IncompleteRateProvider(RateProvider):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteRateProvider()
@@ -0,0 +1,189 @@
+import threading
+import requests_mock as rm
+from datetime import date
+
+from capgains.exchange_rate import ExchangeRate
+from capgains.rate_registry import RateRegistry, RateSeries
+
+
+def _observations(*days):
+    return {"observations": [{"d": day, "FXUSDCAD": {"v": "1.25"}}
+                             for day in days]}
+
+
+def test_missing_spans_empty_series():
+    series = RateSeries()
+    assert series.missing_spans(date(2020, 1, 1), date(2020, 1, 31)) == [
+        (date(2020, 1, 1), date(2020, 1, 31))]
+
+
+def test_missing_spans_around_fetched_span():
+    series = RateSeries()
+    series.add(date(2020, 1, 10), date(2020, 1, 20), {})
+    assert series.missing_spans(date(2020, 1, 1), date(2020, 1, 31)) == [
+        (date(2020, 1, 1), date(2020, 1, 9)),
+        (date(2020, 1, 21), date(2020, 1, 31)),
+    ]
+    assert series.missing_spans(date(2020, 1, 12), date(2020, 1, 15)) == []
+
+
+def test_adjacent_spans_are_merged():
+    series = RateSeries()
+    series.add(date(2020, 1, 1), date(2020, 1, 10), {})
+    series.add(date(2020, 1, 11), date(2020, 1, 20), {})
+    series.add(date(2020, 2, 1), date(2020, 2, 10), {})
+    assert series._spans == [
+        (date(2020, 1, 1).toordinal(), date(2020, 1, 20).toordinal()),
+        (date(2020, 2, 1).toordinal(), date(2020, 2, 10).toordinal()),
+    ]
+
+
+def test_rates_until():
+    series = RateSeries()
+    day1 = date(2020, 1, 2).toordinal()
+    day2 = date(2020, 1, 3).toordinal()
+    series.add(date(2020, 1, 1), date(2020, 1, 5), {day2: 2, day1: 1})
+    dates, values = series.rates_until(date(2020, 1, 2))
+    assert list(dates) == [day1]
+    assert list(values) == [1]
+
+
+def test_registry_only_fetches_missing_spans():
+    fetched = []
+
+    def fetch(start_date, end_date):
+        fetched.append((start_date, end_date))
+        return {}
+
+    registry = RateRegistry()
+    registry.get_series('USD', 'FXUSDCAD', date(2020, 1, 1),
+                        date(2020, 1, 31), fetch)
+    registry.get_series('USD', 'FXUSDCAD', date(2020, 1, 15),
+                        date(2020, 2, 15), fetch)
+    registry.get_series('EUR', 'FXEURCAD', date(2020, 1, 15),
+                        date(2020, 1, 20), fetch)
+    assert fetched == [
+        (date(2020, 1, 1), date(2020, 1, 31)),
+        (date(2020, 2, 1), date(2020, 2, 15)),
+        (date(2020, 1, 15), date(2020, 1, 20)),
+    ]
+
+
+def test_exchange_rates_share_fetched_rates(requests_mock):
+    """Testing that ExchangeRate objects with overlapping date ranges do not
+    fetch the same rates twice"""
+    requests_mock.get(rm.ANY, json=_observations("2020-05-21", "2020-05-22"))
+    er1 = ExchangeRate('USD', date(2020, 5, 21), date(2020, 5, 22))
+    er2 = ExchangeRate('USD', date(2020, 5, 21), date(2020, 5, 22))
+    assert requests_mock.call_count == 1
+    assert er1.get_rate(date(2020, 5, 22)) == er2.get_rate(date(2020, 5, 22))
+
+
+def test_registry_fetches_concurrently():
+    """Testing that the missing spans of several series are fetched at the
+    same time"""
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fetch(start_date, end_date):
+        # Only returns once all three fetches are running
+        barrier.wait()
+        return {start_date.toordinal(): 1}
+
+    registry = RateRegistry()
+    all_series = registry.get_all_series([
+        ('USD', 'FXUSDCAD', date(2020, 1, 1), date(2020, 1, 31), fetch),
+        ('EUR', 'FXEURCAD', date(2020, 1, 1), date(2020, 1, 31), fetch),
+        ('GBP', 'FXGBPCAD', date(2020, 1, 1), date(2020, 1, 31), fetch),
+    ])
+    assert [len(s.rates_until(date(2020, 1, 31))[0])
+            for s in all_series] == [1, 1, 1]
+
+
+def test_registry_merges_requests_for_same_series():
+    """Testing that overlapping requests for the same series in one batch
+    are fetched once"""
+    fetched = []
+
+    def fetch(start_date, end_date):
+        fetched.append((start_date, end_date))
+        return {}
+
+    registry = RateRegistry()
+    registry.get_all_series([
+        ('EUR', 'FXEURCAD', date(2016, 12, 1), date(2017, 1, 2), fetch),
+        ('EUR', 'FXEURCAD', date(2016, 12, 27), date(2017, 2, 1), fetch),
+    ])
+    assert fetched == [(date(2016, 12, 1), date(2017, 2, 1))]
+
+
+def test_prefetch_all_currencies(requests_mock):
+    """Testing that prefetching makes later ExchangeRate objects not fetch
+    anything"""
+    requests_mock.get(rm.ANY, json={"observations": []})
+    ranges = [(currency, date(2016, 5, 1), date(2020, 5, 1))
+              for currency in ('CAD', 'USD', 'EUR', 'GBP')]
+    ExchangeRate.prefetch(ranges)
+    # Every series of every currency is fetched in a single request
+    assert requests_mock.call_count == 1
+    assert requests_mock.last_request.path.endswith(
+        '/iexe0101,fxusdcad,fxeurcad,fxgbpcad/json')
+    for currency, start_date, end_date in ranges:
+        ExchangeRate(currency, start_date, end_date)
+    assert requests_mock.call_count == 1
+
+
+def test_registry_batches_fetches():
+    """Testing that every missing span is fetched with one batch request and
+    split back up per series"""
+    batches = []
+
+    def batch_fetch(keys, start_date, end_date):
+        batches.append((keys, start_date, end_date))
+        return {key: {date(2020, 1, 5).toordinal(): 1,
+                      date(2020, 3, 5).toordinal(): 2}
+                for key in keys}
+
+    def fetch(start_date, end_date):
+        raise AssertionError("Should have been fetched in a batch")
+
+    registry = RateRegistry()
+    usd, eur = registry.get_all_series([
+        ('USD', 'FXUSDCAD', date(2020, 1, 1), date(2020, 1, 31), fetch),
+        ('EUR', 'FXEURCAD', date(2020, 1, 1), date(2020, 3, 31), fetch),
+    ], batch_fetch=batch_fetch)
+    assert batches == [([('USD', 'FXUSDCAD'), ('EUR', 'FXEURCAD')],
+                        date(2020, 1, 1), date(2020, 3, 31))]
+    # Rates outside of the span requested for the series are left out
+    assert len(usd.rates_until(date(2020, 12, 31))[0]) == 1
+    assert len(eur.rates_until(date(2020, 12, 31))[0]) == 2
+
+
+def test_registry_batches_nearby_spans_concurrently():
+    """Testing that missing spans far apart are fetched with separate batch
+    requests, at the same time, instead of one request covering the years
+    between them"""
+    barrier = threading.Barrier(2, timeout=5)
+    batches = []
+
+    def batch_fetch(keys, start_date, end_date):
+        batches.append((keys, start_date, end_date))
+        # Only returns once both batches are running
+        barrier.wait()
+        return {key: {} for key in keys}
+
+    def fetch(start_date, end_date):
+        raise AssertionError("Should have been fetched in a batch")
+
+    registry = RateRegistry()
+    registry.get_all_series([
+        ('USD', 'FXUSDCAD', date(2018, 1, 1), date(2018, 1, 31), fetch),
+        ('EUR', 'FXEURCAD', date(2018, 1, 15), date(2018, 2, 28), fetch),
+        ('USD', 'FXUSDCAD', date(2021, 6, 1), date(2021, 6, 30), fetch),
+        ('EUR', 'FXEURCAD', date(2021, 6, 1), date(2021, 6, 30), fetch),
+    ], batch_fetch=batch_fetch)
+    assert sorted(batches) == [
+        ([('USD', 'FXUSDCAD'), ('EUR', 'FXEURCAD')],
+         date(2018, 1, 1), date(2018, 2, 28)),
+        ([('USD', 'FXUSDCAD'), ('EUR', 'FXEURCAD')],
+         date(2021, 6, 1), date(2021, 6, 30)),
+    ]
@@ -0,0 +1,63 @@
+import pytest
+from datetime import date
+from decimal import Decimal
+from click import ClickException
+
+from capgains.snapshot import Snapshot, TickerPosition
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    Snapshot(2020, {
+        'ANET': TickerPosition(Decimal('10.5'), Decimal('1234.5678'),
+                               [date(2020, 11, 15)],
+                               [(date(2020, 12, 20), 'Stocks', 'ANET', 'SELL',
+                                 Decimal('5'), Decimal('20.1234'),
+                                 Decimal('1.00'), 'USD')]),
+        'GOOGL': TickerPosition(0, 0),
+    }).save(path)
+    snapshot = Snapshot.load(path)
+    assert snapshot.year == 2020
+    assert sorted(snapshot.positions) == ['ANET', 'GOOGL']
+    anet = snapshot.positions['ANET']
+    assert anet.share_balance == Decimal('10.5')
+    assert anet.total_acb == Decimal('1234.5678')
+    assert anet.buy_dates == [date(2020, 11, 15)]
+    assert anet.pending == [(date(2020, 12, 20), 'Stocks', 'ANET', 'SELL',
+                             Decimal('5'), Decimal('20.1234'),
+                             Decimal('1.00'), 'USD')]
+    assert snapshot.positions['GOOGL'].pending == []
+
+
+def test_pending_window_start():
+    """A purchase on this date is within 30 days of a sale on January 1st of
+    the following year"""
+    assert Snapshot.pending_window_start(2020) == date(2020, 12, 2)
+
+
+def test_load_file_not_found(tmp_path):
+    path = str(tmp_path / 'missing.json')
+    with pytest.raises(ClickException) as excinfo:
+        Snapshot.load(path)
+    assert excinfo.value.message == "File not found: {}".format(path)
+
+
+def test_pending_transactions():
+    """Testing that every call returns new transactions, which have not been
+    replayed yet"""
+    position = TickerPosition(0, 0, pending=[
+        (date(2020, 12, 20), 'Stocks', 'ANET', 'BUY', Decimal('5'),
+         Decimal('20'), Decimal('1'), 'CAD')])
+    transaction, = position.pending_transactions()
+    transaction.set_superficial_loss()
+    assert transaction.superficial_loss
+    assert position.pending_transactions()[0].superficial_loss is False
+
+
+def test_load_invalid_snapshot(tmp_path):
+    path = tmp_path / 'snapshot.json'
+    path.write_text('{"version": 2, "year": 2020}')
+    with pytest.raises(ClickException) as excinfo:
+        Snapshot.load(str(path))
+    assert excinfo.value.message.startswith(
+        "Could not read snapshot from {} : ".format(path))
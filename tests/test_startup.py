@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+from tests.helpers import create_csv_file, transactions_to_list
+
+# Runs a command of the CLI in a fresh interpreter, and reports which of the
+# heavy modules had been imported by the time that it was done
+script = """
+import sys
+from capgains.cli import capgains
+try:
+    capgains(sys.argv[1:])
+except SystemExit:
+    pass
+print(' '.join(m for m in ('requests', 'tabulate', 'sqlite3')
+               if m in sys.modules), file=sys.stderr)
+"""
+
+
+def loaded_modules(*args):
+    result = subprocess.run([sys.executable, '-c', script] + list(args),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    return result.stderr.splitlines()[-1].split()
+
+
+def test_help_loads_no_command_dependencies():
+    """Testing that printing the help does not import the dependencies of
+    the commands"""
+    assert loaded_modules('--help') == []
+
+
+def test_show_does_not_load_requests(testfiles_dir, transactions):
+    """Testing that the show command does not import the HTTP client"""
+    filepath = create_csv_file(testfiles_dir, "startuptest.csv",
+                               transactions_to_list(transactions), True)
+    assert loaded_modules('show', filepath) == ['tabulate']
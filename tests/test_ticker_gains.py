@@ -1,6 +1,6 @@
 from click import ClickException
 import pytest
-from datetime import date
+from datetime import date, datetime, timedelta
 
 from capgains.ticker_gains import TickerGains
 from capgains.exchange_rate import ExchangeRate
@@ -266,3 +266,83 @@ def test_ticker_gains_ok(transactions, exchange_rates_mock):
     assert transactions[3].acb == 13020.00
     assert transactions[3].superficial_loss is False
     assert transactions[3].expenses == 20.0
+
+
+def _reference_is_superficial_loss(transaction, transactions):
+    """The original full scan superficial loss rule, used to check that the
+    indexed window lookup gives identical results"""
+    if transaction.capital_gain >= 0:
+        return False
+    min_date = transaction.date - timedelta(days=30)
+    max_date = transaction.date + timedelta(days=30)
+    window = [t for t in transactions if min_date <= t.date <= max_date]
+    if not any(t.action == 'BUY' for t in window):
+        return False
+    balance = transaction.share_balance
+    for t in window[window.index(transaction)+1:]:
+        balance += -t.qty if t.action == 'SELL' else t.qty
+    return balance > 0
+
+
+def test_superficial_loss_window_matches_full_scan():
+    """Testing that the indexed superficial loss window lookup flags the same
+    sales as a scan over every transaction"""
+    rows = [
+        (date(2018, 1, 1), 'BUY', 100, 100.00),
+        (date(2018, 1, 10), 'SELL', 10, 50.00),
+        (date(2018, 1, 10), 'SELL', 10, 50.00),
+        (date(2018, 2, 9), 'BUY', 5, 60.00),
+        (date(2018, 4, 1), 'SELL', 20, 40.00),
+        (date(2018, 5, 1), 'SELL', 65, 40.00),
+        (date(2018, 5, 20), 'BUY', 10, 30.00),
+        (date(2018, 6, 15), 'SELL', 5, 10.00),
+        (date(2018, 7, 15), 'SELL', 5, 10.00),
+        (date(2018, 8, 15), 'BUY', 1, 10.00),
+    ]
+    transactions = [
+        Transaction(day, 'Stocks', 'ANET', action, qty, price, 0.00, 'CAD')
+        for day, action, qty, price in rows
+    ]
+    er_map = {'CAD': ExchangeRate('CAD', rows[0][0], rows[-1][0])}
+    tg = TickerGains('ANET')
+    tg.add_transactions(transactions, er_map)
+
+    expected = []
+    for t in transactions:
+        ref = Transaction(t.date, 'Stocks', 'ANET', t.action, t.qty, t.price,
+                          0.00, 'CAD')
+        expected.append(ref)
+    tg_ref = TickerGains('ANET')
+    for ref in expected:
+        ref.exchange_rate = 1
+        if tg_ref._add_transaction(ref):
+            if _reference_is_superficial_loss(ref, expected):
+                tg_ref._total_acb -= ref.capital_gain
+                ref.set_superficial_loss()
+
+    assert ([t.superficial_loss for t in transactions] ==
+            [t.superficial_loss for t in expected])
+    assert ([t.capital_gain for t in transactions] ==
+            [t.capital_gain for t in expected])
+    assert any(t.superficial_loss for t in transactions)
+    assert not all(t.superficial_loss for t in transactions
+                   if t.action == 'SELL')
+
+
+def test_option_trades_printed_once(capsys):
+    """Testing that the option trades of the last tax year are printed as a
+    single table once all transactions have been added"""
+    year = datetime.now().year - 1
+    transactions = [
+        Transaction(date(year, 3, day), 'Equity and Index Options',
+                    'XYZ 100C', action, 1, 2.00, 1.00, 'CAD')
+        for day, action in [(1, 'BUY'), (2, 'SELL'), (3, 'BUY')]
+    ]
+    tg = TickerGains('XYZ 100C')
+    er = ExchangeRate('CAD', transactions[0].date, transactions[-1].date)
+    tg.add_transactions(transactions, {'CAD': er})
+    output = capsys.readouterr().out
+    assert output.count("option name") == 1
+    assert output.count("BUY CALL") == 2
+    assert output.count("SELL CALL") == 1
+    assert output == "{}\n\n".format(tg.option_trades_table())
@@ -1,7 +1,80 @@
 import pytest
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+from capgains.transaction import Transaction
 
 
 def test_cannot_set_negative_share_balance(transactions):
     with pytest.raises(ValueError) as excinfo:
         transactions[0].share_balance = -1
     assert str(excinfo.value) == "Share balance cannot be negative"
+
+
+class _DictTransaction:
+    """The attributes that a transaction held before it used slots, used as
+    the baseline for the memory measurement"""
+
+    def __init__(self, date, description, ticker, action, qty, price,
+                 commission, currency):
+        self._date = date
+        self._description = description
+        self._ticker = ticker
+        self._action = action
+        self._qty = Decimal(qty)
+        self._price = round(Decimal(price), 4)
+        self._commission = round(Decimal(commission), 4)
+        self._currency = currency
+        self._exchange_rate = None
+        self._share_balance = Decimal(0.0)
+        self._proceeds = Decimal(0.0)
+        self._capital_gain = Decimal(0.0)
+        self._acb = Decimal(0.0)
+        self._superficial_loss = False
+
+
+def _bytes_per_row(cls, rows=2000):
+    args = (date(2018, 2, 15), 'Stocks', 'ANET', 'BUY', Decimal('21'),
+            Decimal('307.96'), Decimal('20.99'), 'USD')
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        transactions = [cls(*args) for _ in range(rows)]
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(transactions) == rows
+    return (after - before) / rows
+
+
+def test_transaction_has_no_dict(transactions):
+    assert not hasattr(transactions[0], '__dict__')
+    with pytest.raises(AttributeError):
+        transactions[0].not_an_attribute = 1
+
+
+def test_transaction_memory_per_row():
+    """Testing that slotted transactions, sharing their zero defaults, take
+    at most half of the memory of a transaction with a __dict__"""
+    slotted = _bytes_per_row(Transaction)
+    baseline = _bytes_per_row(_DictTransaction)
+    assert slotted <= baseline / 2
+
+
+def test_transaction_setters(transactions):
+    transaction = transactions[0]
+    transaction.exchange_rate = 2
+    transaction.share_balance = 10
+    transaction.proceeds = 5
+    transaction.capital_gain = -1
+    transaction.acb = 3
+    assert transaction.exchange_rate == Decimal(2)
+    assert transaction.share_balance == Decimal(10)
+    assert transaction.proceeds == Decimal(5)
+    assert transaction.capital_gain == Decimal(-1)
+    assert transaction.acb == Decimal(3)
+    assert transaction.expenses == Decimal(20)
+    transaction.set_superficial_loss()
+    assert transaction.superficial_loss
+    assert transaction.capital_gain == 0
@@ -0,0 +1,138 @@
+import random
+from datetime import date, timedelta
+
+from capgains.transaction import Transaction
+from capgains.transactions import Transactions
+
+
+def test_tickers(transactions):
+    """Testing that the unique tickers are returned in sorted order"""
+    assert transactions.tickers == ['ANET', 'GOOGL']
+
+
+def test_filter_by_ticker(transactions):
+    """Testing that only the transactions of the requested ticker are
+    returned, in the order that they were added"""
+    anet_transactions = transactions.filter_by_ticker('ANET')
+    assert list(anet_transactions) == [transactions[0],
+                                       transactions[2],
+                                       transactions[3]]
+    assert anet_transactions.tickers == ['ANET']
+
+
+def test_filter_by_ticker_max_year(transactions):
+    """Testing that the transactions after max_year are left out"""
+    anet_transactions = transactions.filter_by_ticker('ANET', max_year=2018)
+    assert list(anet_transactions) == [transactions[0], transactions[2]]
+
+
+def test_filter_by_ticker_unknown_ticker(transactions):
+    """Testing that an unknown ticker returns no transactions"""
+    assert not transactions.filter_by_ticker('MSFT')
+
+
+def test_filter_by_ticker_after_add_transaction(transactions):
+    """Testing that transactions added later are part of the ticker's
+    transactions"""
+    transaction = Transaction(date(2019, 3, 1), 'Stocks', 'MSFT', 'BUY', 1,
+                              100.00, 0.00, 'CAD')
+    transactions.add_transaction(transaction)
+    assert list(transactions.filter_by_ticker('MSFT')) == [transaction]
+    assert transactions.tickers == ['ANET', 'GOOGL', 'MSFT']
+
+
+def test_filter_by_ticker_matches_filter_by(transactions):
+    """Testing that the per-ticker lookup agrees with filter_by"""
+    for ticker in transactions.tickers:
+        assert (list(transactions.filter_by_ticker(ticker, max_year=2018)) ==
+                list(transactions.filter_by(tickers=[ticker], max_year=2018)))
+    assert not Transactions([]).filter_by_ticker('ANET')
+
+
+def _reference_filter(transactions, tickers=None, year=None, max_year=None,
+                      action=None, description=None, superficial_loss=None):
+    """Filter the transactions one by one, which is what filter_by has to
+    agree with"""
+    return [t for t in transactions
+            if (not tickers or t.ticker in tickers) and
+            (not description or t.description in description) and
+            (not year or t.date.year == year) and
+            (not max_year or t.date.year <= max_year) and
+            (not action or t.action == action) and
+            (superficial_loss is None or
+             t.superficial_loss == superficial_loss)]
+
+
+def test_filter_by_matches_row_by_row_filter():
+    """Testing filter_by over a generated ledger against a row by row
+    filter"""
+    rng = random.Random(42)
+    rows = []
+    for day in range(400):
+        transaction = Transaction(
+            date(2016, 1, 1) + timedelta(days=day * 3),
+            rng.choice(['Stocks', 'Equity and Index Options', 'RSU VEST']),
+            rng.choice(['ANET', 'GOOGL', 'MSFT', 'SHOP']),
+            rng.choice(['BUY', 'SELL']), 1, 1.00, 0.00, 'CAD')
+        if rng.random() < 0.2:
+            transaction.set_superficial_loss()
+        rows.append(transaction)
+    transactions = Transactions(rows)
+    filters = [
+        {},
+        {'tickers': ['ANET', 'SHOP']},
+        {'tickers': ('GOOGL',), 'year': 2017},
+        {'max_year': 2017, 'action': 'SELL'},
+        {'description': 'Stocks', 'superficial_loss': False},
+        {'description': ['RSU VEST', 'Stocks'], 'superficial_loss': True},
+        {'tickers': ['MSFT'], 'year': 2018, 'action': 'BUY',
+         'description': 'Stocks', 'superficial_loss': False},
+        {'tickers': ['NOPE']},
+        {'action': 'NOPE'},
+    ]
+    for kwargs in filters:
+        filtered = transactions.filter_by(**kwargs)
+        expected = _reference_filter(rows, **kwargs)
+        assert list(filtered) == expected
+        assert filtered.tickers == sorted({t.ticker for t in expected})
+        # The filtered collection can be filtered again
+        for ticker in filtered.tickers:
+            assert list(filtered.filter_by_ticker(ticker)) == [
+                t for t in expected if t.ticker == ticker]
+
+
+def test_filter_by_after_adding_to_filtered_collection():
+    """Testing that transactions added to a filtered collection, with
+    strings that the collection has not seen before, can be filtered on"""
+    rows = [Transaction(date(2018, 1, day), 'Stocks', ticker, 'BUY', 1,
+                        1.00, 0.00, 'CAD')
+            for day, ticker in [(1, 'ANET'), (2, 'GOOGL')]]
+    transactions = Transactions(rows)
+    anet = transactions.filter_by(tickers=['ANET'])
+    added = Transaction(date(2018, 1, 3), 'RSU VEST', 'SHOP', 'SELL', 1,
+                        1.00, 0.00, 'CAD')
+    anet.add_transaction(added)
+    assert anet.tickers == ['ANET', 'SHOP']
+    assert list(anet.filter_by(action='SELL')) == [added]
+    assert list(anet.filter_by(description='RSU VEST')) == [added]
+    assert list(transactions.filter_by(action='SELL')) == []
+    assert Transactions(rows[1:]).filter_by(tickers=['ANET']).tickers == []
+
+
+def test_adding_to_collection_does_not_change_views():
+    """Testing that a filtered collection keeps the transactions that it
+    was filtered to, while the collection that it was filtered from can
+    still be added to and filtered"""
+    rows = [Transaction(date(2018, 1, day), 'Stocks', 'ANET', action, 1,
+                        1.00, 0.00, 'CAD')
+            for day, action in [(1, 'BUY'), (2, 'SELL')]]
+    transactions = Transactions(rows)
+    sales = transactions.filter_by(action='SELL')
+    added = Transaction(date(2019, 1, 3), 'Stocks', 'GOOGL', 'SELL', 1,
+                        1.00, 0.00, 'CAD')
+    transactions.add_transaction(added)
+    assert len(sales) == 1
+    assert list(sales) == [rows[1]]
+    assert sales.tickers == ['ANET']
+    assert list(transactions.filter_by(action='SELL', year=2019)) == [added]
+    assert list(sales.filter_by(year=2018)) == [rows[1]]
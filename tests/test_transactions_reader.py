@@ -1,10 +1,12 @@
 from click import ClickException
 from datetime import date
 import pytest
+import types
 
 from capgains.transaction import Transaction
 from capgains.transactions_reader import TransactionsReader
-from tests.helpers import create_csv_file, transactions_to_list
+from tests.helpers import create_csv_file, transactions_to_list, \
+    transaction_attributes
 
 
 def test_transactions_reader_default(testfiles_dir, transactions):
@@ -26,7 +28,8 @@ def test_transactions_reader_default(testfiles_dir, transactions):
     actual_transactions = TransactionsReader.get_transactions(filepath)
     assert len(actual_transactions) == 1
     actual_transaction = actual_transactions[0]
-    assert actual_transaction.__dict__ == exp_transaction.__dict__
+    assert (transaction_attributes(actual_transaction) ==
+            transaction_attributes(exp_transaction))
 
 
 def test_transactions_reader_negative_inputs(testfiles_dir, transactions):
@@ -58,7 +61,8 @@ def test_transactions_reader_negative_inputs(testfiles_dir, transactions):
     actual_transactions = TransactionsReader.get_transactions(filepath)
     assert len(actual_transactions) == 1
     actual_transaction = actual_transactions[0]
-    assert actual_transaction.__dict__ == exp_transaction.__dict__
+    assert (transaction_attributes(actual_transaction) ==
+            transaction_attributes(exp_transaction))
 
 
 def test_transactions_reader_columns_error(testfiles_dir):
@@ -216,3 +220,97 @@ def test_transactions_commission_not_number(testfiles_dir):
     with pytest.raises(ClickException) as excinfo:
         TransactionsReader.get_transactions(filepath)
     assert excinfo.value.message == "The commission entered BLAH is not a valid number"  # noqa: E501
+
+
+def test_iter_transactions(testfiles_dir, transactions):
+    """Testing that TransactionsReader can stream the transactions"""
+    filepath = create_csv_file(testfiles_dir,
+                               "stream.csv",
+                               transactions_to_list(transactions),
+                               True)
+    stream = TransactionsReader.iter_transactions(filepath)
+    assert isinstance(stream, types.GeneratorType)
+    assert [transactions_to_list([t])[0] for t in stream] == \
+        transactions_to_list(transactions)
+
+
+def test_iter_transactions_validates_lazily(testfiles_dir):
+    """Testing that streamed transactions are returned until an invalid
+    entry is reached"""
+    transaction_after = Transaction(date(2018, 2, 20), 'RSU VEST', 'GOOGL',
+                                    'BUY', 42, 249.55, 0.0, 'USD')
+    transaction_before = Transaction(date(2018, 2, 15), 'ESPP PURCHASE',
+                                     'ANET', 'BUY', 21, 307.96, 20.99, 'USD')
+    filepath = create_csv_file(testfiles_dir,
+                               "streamoutoforder.csv",
+                               transactions_to_list([transaction_after,
+                                                     transaction_before]),
+                               True)
+    stream = TransactionsReader.iter_transactions(filepath)
+    assert next(stream).ticker == 'GOOGL'
+    with pytest.raises(ClickException) as excinfo:
+        next(stream)
+    assert excinfo.value.message == "Transactions were not entered in chronological order"  # noqa: E501
+
+
+def test_fast_path_matches_strict_path(testfiles_dir, monkeypatch):
+    """Testing that the fast path parses entries exactly like the strict
+    path"""
+    rows = [
+        ["2018-2-5", "Stocks", "ANET", "BUY", "21", "307.96", "20.99", "USD"],
+        ["2018-02-05 10:30:00", "Stocks", "ANET", "SELL", "-1.123456",
+         "1e2", " 0.5 ", "USD"],
+        ["2018-12-31", "Stocks", "GOOGL", "SELL", "3", "1.00005", "0", "CAD"],
+    ]
+    filepath = create_csv_file(testfiles_dir, "fastpath.csv", rows, True)
+    fast = TransactionsReader.get_transactions(filepath)
+    monkeypatch.setattr(TransactionsReader, 'fast_path', False)
+    strict = TransactionsReader.get_transactions(filepath)
+    assert len(fast) == len(strict) == 3
+    for fast_transaction, strict_transaction in zip(fast, strict):
+        assert (transaction_attributes(fast_transaction) ==
+                transaction_attributes(strict_transaction))
+
+
+def test_fast_path_falls_back_to_strict_errors(testfiles_dir):
+    """Testing that malformed entries are reported by the strict path"""
+    rows = [
+        ["2018-02-05", "Stocks", "ANET", "BUY", "21", "307.96", "20.99",
+         "USD"],
+        ["2018-13-05", "Stocks", "ANET", "BUY", "21", "307.96", "20.99",
+         "USD"],
+    ]
+    filepath = create_csv_file(testfiles_dir, "fastpathbad.csv", rows, True)
+    with pytest.raises(ClickException) as excinfo:
+        TransactionsReader.get_transactions(filepath)
+    assert excinfo.value.message == "The date (2018-13-05) was not entered in the correct format (YYYY-MM-DD)"  # noqa: E501
+
+
+def test_iter_transactions_filters(testfiles_dir):
+    """Testing that only the entries of the requested tickers and dates are
+    converted, without parsing the numbers of the other entries"""
+    rows = [
+        ["2017-02-05", "Stocks", "ANET", "BUY", "21", "307.96", "0", "USD"],
+        ["2018-02-05", "Stocks", "GOOGL", "BUY", "oops", "1", "0", "USD"],
+        ["2018-03-05", "Stocks", "ANET", "SELL", "1", "300.00", "0", "USD"],
+        ["2019-01-05", "Stocks", "ANET", "SELL", "1", "310.00", "0", "USD"],
+    ]
+    filepath = create_csv_file(testfiles_dir, "filters.csv", rows, True)
+    transactions = TransactionsReader.get_transactions(
+        filepath, tickers=['ANET'], start_date=date(2018, 1, 1),
+        max_year=2018)
+    assert [t.date for t in transactions] == [date(2018, 3, 5)]
+
+
+def test_iter_transactions_filters_check_order(testfiles_dir):
+    """Testing that skipped entries are still checked for chronological
+    order"""
+    rows = [
+        ["2018-02-20", "Stocks", "GOOGL", "BUY", "42", "249.55", "0", "USD"],
+        ["2018-02-15", "Stocks", "GOOGL", "BUY", "21", "307.96", "0", "USD"],
+        ["2018-03-15", "Stocks", "ANET", "BUY", "21", "307.96", "0", "USD"],
+    ]
+    filepath = create_csv_file(testfiles_dir, "filtersorder.csv", rows, True)
+    with pytest.raises(ClickException) as excinfo:
+        TransactionsReader.get_transactions(filepath, tickers=['ANET'])
+    assert excinfo.value.message == "Transactions were not entered in chronological order"  # noqa: E501
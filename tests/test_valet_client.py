@@ -0,0 +1,142 @@
+import pytest
+import requests
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from capgains.valet_client import ValetClient
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Responds with the next queued (status, delay) pair"""
+
+    def do_GET(self):
+        status, delay = self.server.responses.pop(0)
+        self.server.requests += 1
+        time.sleep(delay)
+        body = b'{"observations": []}'
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            # The client gave up waiting
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = HTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.responses = []
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,),
+                              daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server):
+    return 'http://127.0.0.1:{}/valet'.format(server.server_address[1])
+
+
+def test_ok(stub_server):
+    stub_server.responses = [(200, 0)]
+    client = ValetClient(backoff_factor=0)
+    response = client.get(_url(stub_server))
+    assert response.json() == {"observations": []}
+    assert stub_server.requests == 1
+
+
+def test_retries_server_errors(stub_server):
+    stub_server.responses = [(503, 0), (500, 0), (200, 0)]
+    client = ValetClient(backoff_factor=0)
+    assert client.get(_url(stub_server)).status_code == 200
+    assert stub_server.requests == 3
+
+
+def test_server_errors_after_retries_raise(stub_server):
+    stub_server.responses = [(503, 0)] * 3
+    client = ValetClient(max_retries=2, backoff_factor=0)
+    with pytest.raises(requests.HTTPError):
+        client.get(_url(stub_server))
+    assert stub_server.requests == 3
+
+
+def test_client_errors_are_not_retried(stub_server):
+    stub_server.responses = [(404, 0)]
+    client = ValetClient(backoff_factor=0)
+    assert client.get(_url(stub_server)).status_code == 404
+    assert stub_server.requests == 1
+
+
+def test_stalled_server_times_out(stub_server):
+    """Testing that a stalled server can not hang the client for longer than
+    the read timeout"""
+    stub_server.responses = [(200, 1)]
+    client = ValetClient(read_timeout=0.2, backoff_factor=0)
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        client.get(_url(stub_server))
+    assert time.monotonic() - start < 0.9
+
+
+def test_connection_errors_are_retried(requests_mock):
+    requests_mock.get('https://valet.test/obs', [
+        {'exc': requests.ConnectionError},
+        {'json': {"observations": []}},
+    ])
+    client = ValetClient(backoff_factor=0)
+    assert client.get('https://valet.test/obs').status_code == 200
+    assert requests_mock.call_count == 2
+
+
+def test_session_is_reused():
+    client = ValetClient()
+    assert client.session is client.session
+    client.close()
+
+
+def test_min_interval_between_requests(requests_mock):
+    requests_mock.get('https://valet.test/obs', json={})
+    client = ValetClient(min_interval=0.1)
+    start = time.monotonic()
+    for _ in range(3):
+        client.get('https://valet.test/obs')
+    assert time.monotonic() - start >= 0.2
+
+
+class _BarrierSession:
+    """Responds to a request once as many requests as the barrier's parties
+    are in flight"""
+
+    def __init__(self, parties):
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def get(self, url, params=None, timeout=None):
+        self.barrier.wait()
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+
+def test_max_concurrent_requests():
+    """Testing that as many requests as max_concurrent can be in flight at
+    once"""
+    client = ValetClient(max_concurrent=4)
+    client.max_concurrent = 6
+    client._session = _BarrierSession(6)
+    statuses = []
+    threads = [threading.Thread(target=lambda: statuses.append(
+        client.get('https://valet.test/obs').status_code)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert statuses == [200] * 6